@@ -5,12 +5,17 @@ from sqlalchemy import pool
 
 from alembic import context
 
+from database import SQLALCHEMY_DATABASE_URL
 from models import Base
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
 
+# Use the same connection settings as the application, '%' has to be escaped
+# for the ini-style interpolation.
+config.set_main_option("sqlalchemy.url", SQLALCHEMY_DATABASE_URL.replace("%", "%%"))
+
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
 fileConfig(config.config_file_name)
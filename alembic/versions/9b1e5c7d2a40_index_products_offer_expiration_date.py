@@ -0,0 +1,26 @@
+"""Index products.offer_expiration_date
+
+Revision ID: 9b1e5c7d2a40
+Revises: 046a3992db90
+Create Date: 2026-10-19 11:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b1e5c7d2a40'
+down_revision: Union[str, None] = '046a3992db90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_products_offer_expiration_date'), 'products', ['offer_expiration_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_products_offer_expiration_date'), table_name='products')
@@ -0,0 +1,34 @@
+"""Index only the expiration dates of the active offers
+
+Revision ID: a9c2e6f0b4d8
+Revises: e3b9d5f7a1c6
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9c2e6f0b4d8'
+down_revision: Union[str, None] = 'e3b9d5f7a1c6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+LIVE_ROWS = sa.text("deleted_at IS NULL")
+ACTIVE_OFFERS = sa.text("deleted_at IS NULL AND (new_price <> original_price OR percentage_discount <> 0)")
+
+
+def upgrade() -> None:
+    op.drop_index('ix_products_live_offer_expiration_date', table_name='products')
+    op.create_index('ix_products_active_offer_expiration_date', 'products', ['offer_expiration_date'],
+                    postgresql_where=ACTIVE_OFFERS, sqlite_where=ACTIVE_OFFERS)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_active_offer_expiration_date', table_name='products')
+    op.create_index('ix_products_live_offer_expiration_date', 'products', ['offer_expiration_date'],
+                    postgresql_where=LIVE_ROWS, sqlite_where=LIVE_ROWS)
@@ -0,0 +1,30 @@
+"""Index the foreign keys of businesses and orders
+
+Revision ID: b2e6f4a8d0c1
+Revises: a7d3e9b1c5f4
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2e6f4a8d0c1'
+down_revision: Union[str, None] = 'a7d3e9b1c5f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_businesses_owner_id'), 'businesses', ['owner_id'], unique=False)
+    op.create_index(op.f('ix_orders_product_id'), 'orders', ['product_id'], unique=False)
+    op.create_index(op.f('ix_orders_user_id'), 'orders', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_orders_user_id'), table_name='orders')
+    op.drop_index(op.f('ix_orders_product_id'), table_name='orders')
+    op.drop_index(op.f('ix_businesses_owner_id'), table_name='businesses')
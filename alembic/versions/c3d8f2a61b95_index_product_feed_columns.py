@@ -0,0 +1,28 @@
+"""Index the product feed sort columns
+
+Revision ID: c3d8f2a61b95
+Revises: 9b1e5c7d2a40
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d8f2a61b95'
+down_revision: Union[str, None] = '9b1e5c7d2a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_products_percentage_discount'), 'products', ['percentage_discount'], unique=False)
+    op.create_index(op.f('ix_products_date_published'), 'products', ['date_published'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_products_date_published'), table_name='products')
+    op.drop_index(op.f('ix_products_percentage_discount'), table_name='products')
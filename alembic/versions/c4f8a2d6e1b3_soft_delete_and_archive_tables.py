@@ -0,0 +1,114 @@
+"""Soft delete businesses, products and orders, with partial indexes and archive tables
+
+Revision ID: c4f8a2d6e1b3
+Revises: b2e6f4a8d0c1
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f8a2d6e1b3'
+down_revision: Union[str, None] = 'b2e6f4a8d0c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+LIVE_ROWS = sa.text("deleted_at IS NULL")
+
+
+def create_live_index(name, table, columns, unique=False):
+    op.create_index(name, table, columns, unique=unique, postgresql_where=LIVE_ROWS, sqlite_where=LIVE_ROWS)
+
+
+def archive_columns(*columns):
+    return [sa.Column('id', sa.Integer(), nullable=False), *columns,
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.Column('version', sa.Integer(), nullable=True),
+            sa.Column('deleted_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')]
+
+
+def upgrade() -> None:
+    for table in ('businesses', 'products', 'orders'):
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    # Business names only need to be unique among the live businesses
+    with op.batch_alter_table('businesses', naming_convention={"uq": "%(table_name)s_%(column_0_name)s_key"}) as batch_op:
+        batch_op.drop_constraint('businesses_business_name_key', type_='unique')
+    create_live_index('ix_businesses_live_business_name', 'businesses', ['business_name'], unique=True)
+    create_live_index('ix_businesses_live_owner_id_id', 'businesses', ['owner_id', 'id'])
+
+    op.drop_index('ix_products_business_id_id', table_name='products')
+    op.drop_index(op.f('ix_products_percentage_discount'), table_name='products')
+    op.drop_index(op.f('ix_products_date_published'), table_name='products')
+    op.drop_index(op.f('ix_products_offer_expiration_date'), table_name='products')
+    op.create_index(op.f('ix_products_business_id'), 'products', ['business_id'], unique=False)
+    create_live_index('ix_products_live_business_id_id', 'products', ['business_id', 'id'])
+    create_live_index('ix_products_live_percentage_discount', 'products', ['percentage_discount'])
+    create_live_index('ix_products_live_date_published', 'products', ['date_published'])
+    create_live_index('ix_products_live_offer_expiration_date', 'products', ['offer_expiration_date'])
+
+    create_live_index('ix_orders_live_user_id_id', 'orders', ['user_id', 'id'])
+
+    op.create_table('businesses_archive', *archive_columns(
+        sa.Column('business_name', sa.String(length=200), nullable=True),
+        sa.Column('city', sa.String(length=100), nullable=True),
+        sa.Column('region', sa.String(length=100), nullable=True),
+        sa.Column('business_description', sa.String(), nullable=True),
+        sa.Column('logo', sa.String(length=100), nullable=True),
+        sa.Column('owner_id', sa.Integer(), nullable=True),
+    ))
+    op.create_table('products_archive', *archive_columns(
+        sa.Column('name', sa.String(length=100), nullable=True),
+        sa.Column('category', sa.String(length=100), nullable=True),
+        sa.Column('original_price', sa.DECIMAL(precision=12, scale=2), nullable=True),
+        sa.Column('new_price', sa.DECIMAL(precision=12, scale=2), nullable=True),
+        sa.Column('percentage_discount', sa.Integer(), nullable=True),
+        sa.Column('offer_expiration_date', sa.Date(), nullable=True),
+        sa.Column('product_image', sa.String(length=255), nullable=True),
+        sa.Column('date_published', sa.Date(), nullable=True),
+        sa.Column('quantity', sa.Integer(), nullable=True),
+        sa.Column('business_id', sa.Integer(), nullable=True),
+    ))
+    op.create_table('orders_archive', *archive_columns(
+        sa.Column('product_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('quantity', sa.Integer(), nullable=True),
+        sa.Column('order_date', sa.DateTime(), nullable=True),
+        sa.Column('total_price', sa.DECIMAL(precision=12, scale=2), nullable=True),
+        # The type already exists, it is shared with orders.status
+        sa.Column('status', postgresql.ENUM('pending', 'processing', 'shipped', 'delivered', 'cancelled',
+                                            name='orderstatus', create_type=False), nullable=True),
+    ))
+
+
+def downgrade() -> None:
+    op.drop_table('orders_archive')
+    op.drop_table('products_archive')
+    op.drop_table('businesses_archive')
+
+    op.drop_index('ix_orders_live_user_id_id', table_name='orders')
+
+    op.drop_index('ix_products_live_offer_expiration_date', table_name='products')
+    op.drop_index('ix_products_live_date_published', table_name='products')
+    op.drop_index('ix_products_live_percentage_discount', table_name='products')
+    op.drop_index('ix_products_live_business_id_id', table_name='products')
+    op.drop_index(op.f('ix_products_business_id'), table_name='products')
+    op.create_index(op.f('ix_products_offer_expiration_date'), 'products', ['offer_expiration_date'], unique=False)
+    op.create_index(op.f('ix_products_date_published'), 'products', ['date_published'], unique=False)
+    op.create_index(op.f('ix_products_percentage_discount'), 'products', ['percentage_discount'], unique=False)
+    op.create_index('ix_products_business_id_id', 'products', ['business_id', 'id'], unique=False)
+
+    op.drop_index('ix_businesses_live_owner_id_id', table_name='businesses')
+    op.drop_index('ix_businesses_live_business_name', table_name='businesses')
+    with op.batch_alter_table('businesses') as batch_op:
+        batch_op.create_unique_constraint('businesses_business_name_key', ['business_name'])
+
+    for table in ('orders', 'products', 'businesses'):
+        op.drop_column(table, 'deleted_at')
@@ -0,0 +1,34 @@
+"""Provision the Default Business
+
+Revision ID: d41f7a9e0c27
+Revises: c3d8f2a61b95
+Create Date: 2026-10-19 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41f7a9e0c27'
+down_revision: Union[str, None] = 'c3d8f2a61b95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Products without a business are added to it, databases where the application already
+    # created it on demand keep their row
+    op.execute(
+        "INSERT INTO businesses (business_name, city, region, business_description, logo) "
+        "SELECT 'Default Business', 'Unspecified', 'Unspecified', "
+        "'Default business entity for products without specified business', 'default_logo.jpg' "
+        "WHERE NOT EXISTS (SELECT 1 FROM businesses WHERE business_name = 'Default Business')"
+    )
+
+
+def downgrade() -> None:
+    # Products may reference the row, it is kept
+    pass
@@ -0,0 +1,35 @@
+"""Add product_stats table
+
+Revision ID: e3b9d5f7a1c6
+Revises: d7a1c3e5f9b2
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b9d5f7a1c6'
+down_revision: Union[str, None] = 'd7a1c3e5f9b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('product_stats',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('views', sa.BigInteger(), nullable=False),
+    sa.Column('orders', sa.BigInteger(), nullable=False),
+    sa.Column('popularity', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+    op.create_index(op.f('ix_product_stats_popularity'), 'product_stats', ['popularity'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_product_stats_popularity'), table_name='product_stats')
+    op.drop_table('product_stats')
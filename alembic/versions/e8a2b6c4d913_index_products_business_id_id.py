@@ -0,0 +1,26 @@
+"""Index products by (business_id, id)
+
+Revision ID: e8a2b6c4d913
+Revises: d41f7a9e0c27
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8a2b6c4d913'
+down_revision: Union[str, None] = 'd41f7a9e0c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_products_business_id_id', 'products', ['business_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_business_id_id', table_name='products')
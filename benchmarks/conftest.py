@@ -0,0 +1,42 @@
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+import models
+from schema.order import OrderStatus
+from services import auth
+
+
+@pytest.fixture(autouse=True)
+def jwt_secret(monkeypatch):
+    # Benchmarks run without a .env file, so provide a throwaway signing key
+    monkeypatch.setitem(auth.config_credentials, "SECRET", "benchmark-secret")
+
+
+@pytest.fixture
+def product():
+    return models.Product(
+        id=1,
+        name="Wireless Headphones",
+        category="Electronics",
+        original_price=Decimal("199.99"),
+        new_price=Decimal("149.99"),
+        percentage_discount=25,
+        offer_expiration_date=date(2024, 12, 31),
+        product_image="productdefault.jpg",
+        date_published=date(2024, 5, 1),
+        quantity=42,
+        business_id=1,
+    )
+
+
+@pytest.fixture
+def order():
+    return models.Order(
+        id=1,
+        product_id=1,
+        user_id=1,
+        quantity=2,
+        order_date=datetime(2024, 5, 23, 16, 6, 22),
+        total_price=Decimal("299.98"),
+        status=OrderStatus.pending,
+    )
@@ -0,0 +1,26 @@
+from services.auth import decode_token, encode_token
+from services.revocation import RevocationList
+
+
+# The claims of an access token, expiring in 2100
+TOKEN_DATA = {"id": 1, "username": "john_doe", "role": "customer", "ver": 0, "type": "access",
+              "jti": "0123456789abcdef0123456789abcdef", "iat": 1700000000, "exp": 4102444800}
+
+
+def test_encode_token(benchmark):
+    token = benchmark(encode_token, TOKEN_DATA)
+    assert isinstance(token, str)
+
+
+def test_decode_token(benchmark):
+    token = encode_token(TOKEN_DATA)
+    payload = benchmark(decode_token, token)
+    assert payload["id"] == 1
+
+
+def test_revocation_check(benchmark):
+    # A token id missing from the loaded filter is answered without the database
+    revocations = RevocationList()
+    revocations.loaded = True
+    revocations.revoked("fedcba9876543210fedcba9876543210")
+    assert benchmark(revocations.is_revoked, None, TOKEN_DATA["jti"]) is False
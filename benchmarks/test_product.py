@@ -0,0 +1,6 @@
+from services.product import calculate_percentage_discount
+
+
+def test_calculate_percentage_discount(benchmark):
+    discount = benchmark(calculate_percentage_discount, 200.0, 150.0)
+    assert discount == 25.0
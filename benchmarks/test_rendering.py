@@ -0,0 +1,33 @@
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from schema.product import ProductListResponse
+
+
+PAGE_SIZE = 1000
+
+
+@pytest.fixture
+def product_page(product):
+    return [product] * PAGE_SIZE
+
+
+@pytest.mark.benchmark(group="product-page")
+def test_render_product_page_jsonable_encoder(benchmark, product_page):
+    # The previous path: raw ORM objects introspected by jsonable_encoder
+    def render():
+        return JSONResponse(jsonable_encoder({"status": "ok", "data": product_page}))
+
+    response = benchmark(render)
+    assert response.status_code == 200
+
+
+@pytest.mark.benchmark(group="product-page")
+def test_render_product_page_orjson(benchmark, product_page):
+    # The current path: serialize(), the response model and ORJSONResponse
+    def render():
+        content = {"status": "ok", "data": [product.serialize() for product in product_page]}
+        return ORJSONResponse(ProductListResponse.model_validate(content).model_dump(mode="json"))
+
+    response = benchmark(render)
+    assert response.status_code == 200
@@ -0,0 +1,14 @@
+def test_product_serialize(benchmark, product):
+    data = benchmark(product.serialize)
+    assert data["product_id"] == 1
+
+
+def test_product_serialize_page(benchmark, product):
+    page = [product] * 100
+    data = benchmark(lambda: [item.serialize() for item in page])
+    assert len(data) == 100
+
+
+def test_order_serialize(benchmark, order):
+    data = benchmark(order.serialize)
+    assert data["status"] == "pending"
@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_app():
+    subprocess.run([sys.executable, "-c", "import main"], cwd=ROOT_DIR, check=True)
+
+
+def test_app_startup(benchmark):
+    # Importing the app must not touch the database, so this also fails if an
+    # import-time side effect such as create_all() creeps back in.
+    benchmark.pedantic(import_app, rounds=5, iterations=1)
@@ -0,0 +1,24 @@
+from schema.user import UserIn, UserUpdate
+
+
+USER_PAYLOAD = {
+    "username": "john_doe",
+    "email": "john@example.com",
+    "password": "Secure#Passw0rd",
+    "role": "customer",
+}
+
+
+def test_user_in_validation(benchmark):
+    user = benchmark(UserIn, **USER_PAYLOAD)
+    assert user.username == "john_doe"
+
+
+def test_user_update_validation(benchmark):
+    user = benchmark(UserUpdate, username="jane_doe", password="An0ther#Secret")
+    assert user.username == "jane_doe"
+
+
+def test_sanitize_fields(benchmark):
+    sanitized = benchmark(UserIn.sanitize_fields, "john<script>doe';--")
+    assert "'" not in sanitized
@@ -1,23 +1,87 @@
-from fastapi import FastAPI, status
+import os
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from logger import logger
 # from middleware import ecommerce_middleware
+from middleware import CompressionMiddleware, compression_stats
 from starlette.middleware.base import BaseHTTPMiddleware
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine
-import models
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm.exc import StaleDataError
+from schema.common import CompressionMetricsResponse, WelcomeResponse
+from schema.user import UserRole
 from routers.user import user_router
 from routers.auth import auth_router
 from routers.product import product_router
 from routers.business import business_router
 from routers.order import order_router
 from routers.admin import admin_router
+from routers.job import job_router
+from services.auth import LOGIN_BUCKET_PURGE_INTERVAL, Principal, get_current_principal, purge_login_buckets
+from services.deletion import COMPACTION_INTERVAL, run_compaction
+from services.feeds import FEED_REFRESH_INTERVAL, product_feeds
+from services.product import run_offer_sweep
+from services.reservation import RESERVATION_SNAPSHOT_INTERVAL, RESERVATION_SWEEP_INTERVAL, reservations
+from services.revocation import REVOCATION_REBUILD_INTERVAL, REVOCATION_SYNC_INTERVAL, revocation_list
+from services.scheduler import scheduler
+from services.stats import STATS_FLUSH_INTERVAL, popularity_counters
+from services.user import USER_FILTER_REBUILD_INTERVAL, USER_FILTER_SYNC_INTERVAL, taken_identities
+
+
+# Seconds between two sweeps of expired offers
+OFFER_SWEEP_INTERVAL = int(os.getenv("OFFER_SWEEP_INTERVAL", "300"))
+
+scheduler.every(OFFER_SWEEP_INTERVAL, run_offer_sweep)
+scheduler.every(COMPACTION_INTERVAL, run_compaction)
+scheduler.every(FEED_REFRESH_INTERVAL, product_feeds.refresh, name="product_feeds.refresh")
+scheduler.every(REVOCATION_SYNC_INTERVAL, revocation_list.sync, name="revocation_list.sync")
+scheduler.every(REVOCATION_REBUILD_INTERVAL, revocation_list.rebuild, name="revocation_list.rebuild")
+scheduler.every(USER_FILTER_SYNC_INTERVAL, taken_identities.sync, name="taken_identities.sync")
+scheduler.every(USER_FILTER_REBUILD_INTERVAL, taken_identities.rebuild, name="taken_identities.rebuild")
+scheduler.every(RESERVATION_SWEEP_INTERVAL, reservations.expire, name="reservations.expire")
+scheduler.every(RESERVATION_SNAPSHOT_INTERVAL, reservations.snapshot, name="reservations.snapshot")
+scheduler.every(STATS_FLUSH_INTERVAL, popularity_counters.flush, name="popularity_counters.flush")
+scheduler.every(LOGIN_BUCKET_PURGE_INTERVAL, purge_login_buckets)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await run_in_threadpool(revocation_list.rebuild)
+    except Exception as e:
+        # Revocation checks read the table until the next rebuild succeeds
+        logger.error(f"Loading the token revocation list failed: {e}")
+    try:
+        await run_in_threadpool(taken_identities.rebuild)
+    except Exception as e:
+        # Signup checks read the table until the next rebuild succeeds
+        logger.error(f"Loading the username and email filters failed: {e}")
+    try:
+        await run_in_threadpool(reservations.snapshot)
+    except Exception as e:
+        # Only the reservations made in this worker are held until the next snapshot succeeds
+        logger.error(f"Loading the reservations failed: {e}")
+    scheduler.start()
+    yield
+    await scheduler.stop()
+    try:
+        await run_in_threadpool(reservations.snapshot)
+    except Exception as e:
+        logger.error(f"Saving the reservations failed: {e}")
+    try:
+        await run_in_threadpool(popularity_counters.flush)
+    except Exception as e:
+        logger.error(f"Flushing the product counters failed: {e}")
 
 
 app = FastAPI(
     title="E-commerce Application",
     description="A robust e-commerce backend application. This app features role-based access control, allowing business owners to create and manage multiple businesses, each with its own products, while customers can place and manage orders. Additionally, an admin role is included to perform various administrative operations.",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 app.include_router(user_router)
 app.include_router(auth_router)
@@ -25,6 +89,14 @@ app.include_router(admin_router)
 app.include_router(product_router)
 app.include_router(business_router)
 app.include_router(order_router)
+app.include_router(job_router)
+
+
+@app.exception_handler(StaleDataError)
+async def conflicting_write(request: Request, exc: StaleDataError):
+    # A product or order was changed by another request between its read and its write
+    return ORJSONResponse(status_code=status.HTTP_409_CONFLICT,
+                          content={"detail": "The resource was modified concurrently, retry the request"})
 
 
 
@@ -34,7 +106,6 @@ logger.info("starting app")
 # app.add_middleware(BaseHTTPMiddleware, dispatch=ecommerce_middleware)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-models.Base.metadata.create_all(bind=engine)
 
 
 allowed_origins = ["*"]
@@ -48,7 +119,17 @@ app.add_middleware(
     allow_headers=["*"],     
 )
 
+# Compress JSON bodies above 1 KiB with Brotli or gzip, static images are sent as is
+app.add_middleware(CompressionMiddleware, minimum_size=1024, excluded_paths=("/static",))
+
 
-@app.get("/", status_code=status.HTTP_200_OK)
+@app.get("/", status_code=status.HTTP_200_OK, response_model=WelcomeResponse)
 async def home():
-    return {"message": "Welcome to our home page!"}
\ No newline at end of file
+    return {"message": "Welcome to our home page!"}
+
+
+@app.get("/metrics/compression", status_code=status.HTTP_200_OK, response_model=CompressionMetricsResponse)
+async def compression_metrics(user: Principal = Depends(get_current_principal)):
+    if user is None or user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Only admins can access this endpoint")
+    return {"status": "ok", "data": compression_stats.snapshot()}
@@ -1,9 +1,17 @@
 import time
+import zlib
 
 from fastapi import Request
+from starlette.datastructures import Headers, MutableHeaders
 
 from logger import logger
 
+try:
+    import brotli
+except ImportError:  # Brotli is optional, responses fall back to gzip
+    brotli = None
+
+
 async def ecommerce_middleware(request: Request, callnext):
     logger.info("Starting ................")
     start_time = time.time()
@@ -17,3 +25,201 @@ async def ecommerce_middleware(request: Request, callnext):
     return response
 
 
+# Responses of these types are worth compressing, images and archives are not
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+
+
+class CompressionStats:
+    """Counts how much the compression middleware saves, per worker."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.compressed_responses = 0
+        self.skipped_responses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.by_encoding = {"br": 0, "gzip": 0}
+
+    def record(self, encoding, bytes_in, bytes_out):
+        self.compressed_responses += 1
+        self.by_encoding[encoding] += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+    def snapshot(self):
+        return {
+            "compressed_responses": self.compressed_responses,
+            "skipped_responses": self.skipped_responses,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "compression_ratio": self.bytes_out / self.bytes_in if self.bytes_in else 1.0,
+            "by_encoding": dict(self.by_encoding),
+        }
+
+
+compression_stats = CompressionStats()
+
+
+class GzipCompressor:
+    def __init__(self, level):
+        # wbits=31 writes a gzip header and trailer around the deflate stream
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        # Sync flush so every streamed chunk reaches the client immediately
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data=b""):
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data=b""):
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick br or gzip from an Accept-Encoding header, honouring q-values."""
+    qualities = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    candidates = ("br", "gzip") if brotli is not None else ("gzip",)
+    encoding, best_quality = None, 0.0
+    for candidate in candidates:
+        quality = qualities.get(candidate, qualities.get("*", 0.0))
+        if quality > best_quality:
+            encoding, best_quality = candidate, quality
+    return encoding
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with Brotli or gzip, depending on what the client accepts.
+
+    Bodies smaller than `minimum_size`, responses that are already encoded or not
+    textual, and paths under `excluded_paths` (e.g. the static images) are sent as is.
+    Streamed responses are compressed chunk by chunk instead of being buffered. Every
+    textual response carries `Vary: Accept-Encoding`, compressed or not, so a shared cache
+    keeps the variants apart.
+    """
+
+    def __init__(self, app, minimum_size=1024, gzip_level=6, brotli_quality=4,
+                 excluded_paths=("/static",), stats=compression_stats):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.excluded_paths = tuple(excluded_paths)
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.excluded_paths):
+            await self.app(scope, receive, send)
+            return
+
+        # Without an accepted encoding the response is only given its Vary header
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        responder = CompressionResponder(self, encoding)
+        await responder(scope, receive, send)
+
+    def compressor(self, encoding):
+        if encoding == "br":
+            return BrotliCompressor(self.brotli_quality)
+        return GzipCompressor(self.gzip_level)
+
+
+class CompressionResponder:
+    def __init__(self, middleware, encoding):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = None
+        self.initial_message = None
+        self.compressor = None
+        self.passthrough = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.middleware.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Hold the headers back until the first body chunk tells us whether to compress
+            self.initial_message = message
+            headers = MutableHeaders(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            eligible = "content-encoding" not in headers and content_type.startswith(COMPRESSIBLE_TYPES)
+            if eligible:
+                # The body depends on Accept-Encoding even when it is sent as is
+                headers.add_vary_header("Accept-Encoding")
+            self.passthrough = not eligible or self.encoding is None
+            return
+
+        if message_type != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.initial_message is not None:
+            initial_message, self.initial_message = self.initial_message, None
+            if self.passthrough or (not more_body and len(body) < self.middleware.minimum_size):
+                if self.encoding is not None:
+                    self.middleware.stats.skipped_responses += 1
+                self.passthrough = True
+                await self.send(initial_message)
+                await self.send(message)
+                return
+
+            self.compressor = self.middleware.compressor(self.encoding)
+            headers = MutableHeaders(raw=initial_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            message["body"] = self.compress(body, more_body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(message["body"]))
+            await self.send(initial_message)
+            await self.send(message)
+            return
+
+        if not self.passthrough:
+            message["body"] = self.compress(body, more_body)
+        await self.send(message)
+
+    def compress(self, body, more_body):
+        if more_body:
+            compressed = self.compressor.compress(body)
+        else:
+            compressed = self.compressor.finish(body)
+        self.bytes_in += len(body)
+        self.bytes_out += len(compressed)
+        if not more_body:
+            self.middleware.stats.record(self.encoding, self.bytes_in, self.bytes_out)
+        return compressed
@@ -1,12 +1,40 @@
 from datetime import datetime
-from sqlalchemy import DECIMAL, Boolean, Column, Date, DateTime, ForeignKey, Integer, String, Enum
-from sqlalchemy.orm import relationship
+import secrets
+from sqlalchemy import DECIMAL, JSON, BigInteger, Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, String, Enum, Table, event, func, text
+from sqlalchemy.orm import Session, relationship, with_loader_criteria
 from database import Base
+from schema.job import JobStatus
 from schema.order import OrderStatus
 from schema.user import UserRole
 
 
 
+# Partial indexes cover only the live rows, which are the ones every listing reads
+LIVE_ROWS = text("deleted_at IS NULL")
+# The live products with an offer running, the ones the offer sweeper may have to revert
+ACTIVE_OFFERS = text("deleted_at IS NULL AND (new_price <> original_price OR percentage_discount <> 0)")
+
+
+class SoftDeleteMixin:
+    # Set when the row is deleted. Deleted rows are hidden from ORM queries, unless executed
+    # with the include_deleted execution option, and later moved to an archive table.
+    deleted_at = Column(DateTime, nullable=True)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def hide_deleted_rows(execute_state):
+    if (execute_state.is_select and not execute_state.is_column_load and not execute_state.is_relationship_load
+            and not execute_state.execution_options.get("include_deleted", False)):
+        # The criteria are propagated to the lazy loads of the returned objects
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(SoftDeleteMixin, lambda cls: cls.deleted_at.is_(None), include_aliases=True)
+        )
+
+
+def live_index(name, *columns, **kwargs):
+    return Index(name, *columns, postgresql_where=LIVE_ROWS, sqlite_where=LIVE_ROWS, **kwargs)
+
+
 class User(Base):
     __tablename__ = 'users'
 
@@ -17,6 +45,8 @@ class User(Base):
     is_verified = Column(Boolean, default=False)
     join_date = Column(DateTime, default=datetime.now)
     role = Column(Enum(UserRole), nullable=False, default=UserRole.CUSTOMER)
+    # Bumped to revoke every token issued to the user
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     businesses = relationship('Business', back_populates="owner")
     orders = relationship('Order', back_populates="user")
@@ -24,23 +54,40 @@ class User(Base):
 
 
 
-class Business(Base):
+class Business(SoftDeleteMixin, Base):
     __tablename__ = 'businesses'
 
     id = Column(Integer, primary_key=True, index=True)
-    business_name = Column(String(200), nullable=False, unique=True)
+    # Unique among the live businesses, see __table_args__
+    business_name = Column(String(200), nullable=False)
     city = Column(String(100), nullable=False, default="Unspecified")
     region = Column(String(100), nullable=False, default="Unspecified")
     business_description = Column(String, nullable=True)
     logo = Column(String(100), nullable=False, default="default.jpg")
-    owner_id = Column(Integer, ForeignKey('users.id'))
+    owner_id = Column(Integer, ForeignKey('users.id'), index=True)
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now, server_default=func.now())
+    version = Column(Integer, nullable=False, default=1, onupdate=text("businesses.version + 1"), server_default="1")
 
     owner = relationship('User', back_populates="businesses")
     products = relationship('Product', back_populates="business")
 
+    __table_args__ = (
+        live_index('ix_businesses_live_business_name', 'business_name', unique=True),
+        live_index('ix_businesses_live_owner_id_id', 'owner_id', 'id'),
+    )
+
+    def serialize(self):
+        return {
+            "business_id": self.id,
+            "business_name": self.business_name,
+            "city": self.city,
+            "region": self.region,
+            "business_description": self.business_description
+        }
 
 
-class Product(Base):
+
+class Product(SoftDeleteMixin, Base):
     __tablename__ = 'products'
 
     id = Column(Integer, primary_key=True, index=True)
@@ -53,11 +100,44 @@ class Product(Base):
     product_image = Column(String(255), nullable=False, default='productdefault.jpg')
     date_published = Column(Date, default=datetime.now)
     quantity = Column(Integer, nullable=False, default=0)
-    business_id = Column(Integer, ForeignKey('businesses.id'))
+    business_id = Column(Integer, ForeignKey('businesses.id'), index=True)
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now, server_default=func.now())
+    version = Column(Integer, nullable=False, default=1, onupdate=text("products.version + 1"), server_default="1")
 
     business = relationship('Business', back_populates="products")
 
-    def serialize(self):
+    # ORM flushes check and bump the version, updating a row changed since it was read raises
+    # StaleDataError. Core updates bump it through onupdate.
+    __mapper_args__ = {"version_id_col": version}
+
+    __table_args__ = (
+        # Keyset pagination of a business' products
+        live_index('ix_products_live_business_id_id', 'business_id', 'id'),
+        # The storefront feeds
+        live_index('ix_products_live_percentage_discount', 'percentage_discount'),
+        live_index('ix_products_live_date_published', 'date_published'),
+        # The offer sweeper, reverted offers leave the index so it does not grow with their history
+        Index('ix_products_active_offer_expiration_date', 'offer_expiration_date',
+              postgresql_where=ACTIVE_OFFERS, sqlite_where=ACTIVE_OFFERS),
+    )
+
+    # Serialized field name -> (column it is read from, how it is rendered),
+    # used to load and render sparse fieldsets
+    serialized_fields = {
+        "product_id": ("id", lambda product: product.id),
+        "name": ("name", lambda product: product.name),
+        "category": ("category", lambda product: product.category),
+        "new_price": ("new_price", lambda product: float(product.new_price)),
+        "percentage_discount": ("percentage_discount", lambda product: float(product.percentage_discount)),
+        "offer_expiration_date": ("offer_expiration_date", lambda product: product.offer_expiration_date.isoformat()),
+        "product_image": ("product_image", lambda product: product.product_image),
+        "date_published": ("date_published", lambda product: product.date_published.isoformat()),
+        "quantity": ("quantity", lambda product: product.quantity),
+    }
+
+    def serialize(self, fields=None):
+        if fields is not None:
+            return {field: self.serialized_fields[field][1](self) for field in fields}
 
         return {
             "product_id": self.id,
@@ -73,21 +153,47 @@ class Product(Base):
     
 
 
-class Order(Base):
+class Order(SoftDeleteMixin, Base):
     __tablename__ = 'orders'
 
     id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey('products.id'))
-    user_id = Column(Integer, ForeignKey('users.id'))
+    product_id = Column(Integer, ForeignKey('products.id'), index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
     quantity = Column(Integer, nullable=False, default=1)
     order_date = Column(DateTime, default=datetime.now)
     total_price = Column(DECIMAL(12, 2))
     status = Column(Enum(OrderStatus), default=OrderStatus.pending)
+    updated_at = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now, server_default=func.now())
+    version = Column(Integer, nullable=False, default=1, onupdate=text("orders.version + 1"), server_default="1")
 
     product = relationship('Product')
     user = relationship('User', back_populates='orders')
 
-    def serialize(self):
+    # ORM flushes check and bump the version, updating a row changed since it was read raises
+    # StaleDataError. Core updates bump it through onupdate.
+    __mapper_args__ = {"version_id_col": version}
+
+    __table_args__ = (
+        # A customer's orders, by id
+        live_index('ix_orders_live_user_id_id', 'user_id', 'id'),
+    )
+
+    # Serialized field name -> (column it is read from, how it is rendered),
+    # used to load and render sparse fieldsets
+    serialized_fields = {
+        "id": ("id", lambda order: order.id),
+        "product_id": ("product_id", lambda order: order.product_id),
+        "user_id": ("user_id", lambda order: order.user_id),
+        "quantity": ("quantity", lambda order: order.quantity),
+        "order_date": ("order_date", lambda order: order.order_date.isoformat()),
+        "total_price": ("total_price", lambda order: float(order.total_price)),
+        "status": ("status", lambda order: order.status.value),
+    }
+
+    def serialize(self, fields=None):
+        if fields is not None:
+            return {field: self.serialized_fields[field][1](self) for field in fields}
+
         return {
             "id": self.id,
             "product_id": self.product_id,
@@ -100,35 +206,100 @@ class Order(Base):
 
 
 
+class Job(Base):
+    __tablename__ = 'jobs'
 
+    id = Column(String(32), primary_key=True, default=lambda: secrets.token_hex(16))
+    kind = Column(String(50), nullable=False)
+    # Not a foreign key, the jobs of a deleted user are kept for auditing
+    owner_id = Column(Integer, nullable=False, index=True)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.pending)
+    processed = Column(Integer, nullable=False, default=0)
+    succeeded = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    errors = Column(JSON, nullable=False, default=list)
+    message = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
 
+    def serialize(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status.value,
+            "processed": self.processed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "errors": self.errors,
+            "message": self.message,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
 
 
 
 
+class RevokedToken(Base):
+    __tablename__ = 'revoked_tokens'
 
+    # The jti claim of the revoked token
+    jti = Column(String(32), primary_key=True)
+    # Rows are purged once the token would have expired anyway
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=False, default=datetime.now, index=True)
 
 
 
 
+class RateBucket(Base):
+    __tablename__ = 'rate_buckets'
 
+    # The token buckets of the rate limiters, when shared by the workers through the database
+    key = Column(String(255), primary_key=True)
+    tokens = Column(Float, nullable=False)
+    # Epoch seconds of the last take, idle buckets are purged once they would be full again
+    updated_at = Column(Float, nullable=False, index=True)
 
 
 
 
+class Reservation(Base):
+    __tablename__ = 'reservations'
 
+    # Snapshot of the stock held by customers, the live reservations are kept in memory
+    id = Column(String(32), primary_key=True)
+    # Not foreign keys, a reservation outliving its product or user simply expires
+    product_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
 
 
 
 
+class ProductStats(Base):
+    __tablename__ = 'product_stats'
 
+    # Kept apart from the products row, whose writes bump its version. Counted in memory by
+    # each worker and added here in batches, not a foreign key so counts never block a deletion.
+    product_id = Column(Integer, primary_key=True)
+    views = Column(BigInteger, nullable=False, default=0)
+    orders = Column(BigInteger, nullable=False, default=0)
+    # views + ORDER_WEIGHT * orders, for the most popular listing
+    popularity = Column(BigInteger, nullable=False, default=0, index=True)
+    updated_at = Column(DateTime, nullable=False, default=datetime.now)
 
 
 
 
+def archive_table(name: str, model) -> Table:
+    """
+    A table with the columns of a model but none of its constraints or indexes, long-deleted rows are moved there.
+    """
+    return Table(name, Base.metadata, *(Column(column.name, column.type, primary_key=column.primary_key)
+                                        for column in model.__table__.columns))
 
 
-
-
-
-
+businesses_archive = archive_table('businesses_archive', Business)
+products_archive = archive_table('products_archive', Product)
+orders_archive = archive_table('orders_archive', Order)
@@ -1,14 +1,26 @@
-from typing import Annotated, List
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from datetime import datetime
+from typing import Annotated, List, Optional, Union
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 import models
-from schema.order import OrderStatus
-from services.auth import get_current_user
-from schema.user import UserIn, UserRole
+from schema.common import FileFormat, StatusMessageResponse
+from schema.job import JobResponse
+from schema.order import OrderOut, OrderStatus
+from schema.product import ProductOut
+from services.auth import Principal, get_current_principal, revoke_tokens
+from services.dashboard import dashboard_cache
+from services.deletion import run_user_deletion
+from services.export import export_response
+from services.fields import load_fields, parse_fields
+from services.jobs import create_job
+from services.feeds import product_feeds
+from services.product import product_cache
+from schema.user import UserOut, UserRole
 from database import get_db
 from logger import logger
-from database import engine
 
 
 admin_router = APIRouter(
@@ -19,17 +31,16 @@ admin_router = APIRouter(
     # description="This router provides endpoints for performing administrative tasks, such as managing users and roles."
 )
 
-models.Base.metadata.create_all(bind=engine)
 
 db_dependency = Annotated[Session, Depends(get_db)]
 
 
-@admin_router.get("/", status_code=status.HTTP_200_OK)
+@admin_router.get("/", status_code=status.HTTP_200_OK, response_model=Union[List[UserOut], StatusMessageResponse])
 async def list_users(
     db: db_dependency,
     page: int = Query(1, description="Page number", gt=0),
     page_size: int = Query(10, description="Number of items per page", gt=0),
-    user: UserIn = Depends(get_current_user),
+    user: Principal = Depends(get_current_principal),
 ):
     """
     Retrieves a list of users with pagination. Only admins can access this endpoint.
@@ -38,7 +49,7 @@ async def list_users(
     db (Session): A database session object.
     page (int): The page number to retrieve. Defaults to 1.
     page_size (int): The number of items per page. Defaults to 10.
-    user (UserIn): The authenticated user object.
+    user (Principal): The authenticated user.
 
     Returns:
     List[models.User]: A list of users.
@@ -71,18 +82,23 @@ async def list_users(
 
 
 
-@admin_router.delete("/{id}", status_code=status.HTTP_200_OK)
-async def delete_user(db: db_dependency, id: int, user: UserIn = Depends(get_current_user)):
+@admin_router.delete("/{id}", status_code=status.HTTP_202_ACCEPTED, response_model=JobResponse)
+async def delete_user(db: db_dependency, id: int, background_tasks: BackgroundTasks,
+                      user: Principal = Depends(get_current_principal)):
     """
-    Deletes a user by id. Only admins can access this endpoint.
+    Deletes a user by id, with their businesses, products and orders. Only admins can access this endpoint.
+
+    The user's tokens are revoked at once. The rows are deleted by a background job in bounded
+    chunks, children first, whose progress is available from GET /job/{id}.
 
     Args:
     db (Session): A database session object.
     id (int): The id of the user to be deleted.
-    user (UserIn): The authenticated user object.
+    background_tasks (BackgroundTasks): Runs the deletion after the response is sent.
+    user (Principal): The authenticated user.
 
     Returns:
-    dict: A dictionary containing a success message if the user is deleted successfully.
+    dict: A dictionary containing a message and the deletion job.
 
     Raises:
     HTTPException: If the user is not an admin or if a database error occurs.
@@ -96,12 +112,17 @@ async def delete_user(db: db_dependency, id: int, user: UserIn = Depends(get_cur
         if not user_to_delete:
             raise HTTPException(status_code=404, detail="User not found")
 
-        db.delete(user_to_delete)
+        # The user's tokens stop working before their rows are gone
+        revoke_tokens(user_to_delete)
         db.commit()
 
+        job = create_job(db, "user_delete", user.id)
+        background_tasks.add_task(run_user_deletion, job.id, id)
+
         return {
             "status": "ok",
-            "message": "User deleted successfully"
+            "data": "User deletion started",
+            "job": job.serialize()
         }
 
     except SQLAlchemyError as e:
@@ -111,11 +132,11 @@ async def delete_user(db: db_dependency, id: int, user: UserIn = Depends(get_cur
 
 
 
-@admin_router.get("/get_products", status_code=status.HTTP_200_OK)
+@admin_router.get("/get_products", status_code=status.HTTP_200_OK, response_model=Union[List[ProductOut], StatusMessageResponse])
 async def list_products( db: db_dependency,
                          page: int = Query(1, description="Page number", gt=0), 
                         page_size: int = Query(10, description="Number of items per page", gt=0),
-                       user: UserIn = Depends(get_current_user)):
+                       user: Principal = Depends(get_current_principal)):
     
     """
     Retrieves a list of products with pagination. Only admins can access this endpoint.
@@ -124,7 +145,7 @@ async def list_products( db: db_dependency,
     db (Session): A database session object.
     page (int): The page number to retrieve. Defaults to 1.
     page_size (int): The number of items per page. Defaults to 10.
-    user (UserIn): The authenticated user object.
+    user (Principal): The authenticated user.
 
     Returns:
     List[models.Product]: A list of products.
@@ -149,7 +170,7 @@ async def list_products( db: db_dependency,
                 "message": "No products found"
             }
 
-        return products
+        return [product.serialize() for product in products]
     
     except SQLAlchemyError as e:
         db.rollback()
@@ -157,15 +178,15 @@ async def list_products( db: db_dependency,
         raise HTTPException(status_code=400, detail="Something went wrong. Please try again later")
 
 
-@admin_router.delete("/delete_products/{id}", status_code=status.HTTP_200_OK)
-async def delete_products(db: db_dependency, id: int, user: UserIn = Depends(get_current_user)):
+@admin_router.delete("/delete_products/{id}", status_code=status.HTTP_200_OK, response_model=StatusMessageResponse)
+async def delete_products(db: db_dependency, id: int, user: Principal = Depends(get_current_principal)):
     """
-    Deletes a product by id. Only admins can access this endpoint.
+    Soft deletes a product by id, the orders placed on it are kept. Only admins can access this endpoint.
 
     Args:
     db (Session): A database session object.
     id (int): The id of the product to be deleted.
-    user (UserIn): The authenticated user object.
+    user (Principal): The authenticated user.
 
     Returns:
     dict: A dictionary containing a success message if the product is deleted successfully.
@@ -182,8 +203,11 @@ async def delete_products(db: db_dependency, id: int, user: UserIn = Depends(get
         if not product_to_delete:
             raise HTTPException(status_code=404, detail="Product not found")
 
-        db.delete(product_to_delete)
+        product_to_delete.deleted_at = datetime.now()
         db.commit()
+        product_cache.delete(id)
+        product_feeds.removed(id)
+        dashboard_cache.clear()
 
         return {
             "status": "ok",
@@ -197,10 +221,10 @@ async def delete_products(db: db_dependency, id: int, user: UserIn = Depends(get
 
 
 
-@admin_router.get("/get_orders", status_code=status.HTTP_200_OK)
+@admin_router.get("/get_orders", status_code=status.HTTP_200_OK, response_model=Union[List[OrderOut], StatusMessageResponse])
 async def list_orders(db: db_dependency, page: int = Query(1, description="Page number", gt=0), 
                       page_size: int = Query(10, description="Number of items per page", gt=0)
-                      ,user: UserIn = Depends(get_current_user)):
+                      ,user: Principal = Depends(get_current_principal)):
     
     """
 
@@ -210,7 +234,7 @@ async def list_orders(db: db_dependency, page: int = Query(1, description="Page
     db (Session): A database session object.
     page (int): The page number to retrieve. Defaults to 1.
     page_size (int): The number of items per page. Defaults to 10.
-    user (UserIn): The authenticated user object.
+    user (Principal): The authenticated user.
 
     Returns:
     List[models.Order]: A list of orders.
@@ -234,7 +258,7 @@ async def list_orders(db: db_dependency, page: int = Query(1, description="Page
                 "message": "No orders found"
             }
 
-        return orders
+        return [order.serialize() for order in orders]
     
     except SQLAlchemyError as e:
         db.rollback()
@@ -244,12 +268,41 @@ async def list_orders(db: db_dependency, page: int = Query(1, description="Page
 
 
 
-@admin_router.put("/{id}", status_code=status.HTTP_200_OK)
+@admin_router.get("/export_orders", status_code=status.HTTP_200_OK, response_class=StreamingResponse)
+async def export_orders(user: Principal = Depends(get_current_principal),
+                        format: FileFormat = Query(FileFormat.csv, description="csv or ndjson"),
+                        fields: Optional[str] = Query(None, description="Comma separated order fields to export, e.g. id,user_id,status")):
+    """
+    Exports every order as a CSV or NDJSON download, streamed from a server-side cursor. Only admins can access this endpoint.
+
+    Args:
+    user (Principal): The authenticated user.
+    format (FileFormat): The format of the export. Defaults to csv.
+    fields (Optional[str]): Comma separated order fields to export. Defaults to all fields.
+
+    Returns:
+    StreamingResponse: All orders, ordered by id, as an attachment.
+
+    Raises:
+    HTTPException: If the user is not an admin or if an unknown field is requested.
+    """
+    if user is None or user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Only admins can access this endpoint")
+
+    selected_fields = parse_fields(fields, models.Order.serialized_fields)
+
+    statement = select(models.Order).options(*load_fields(models.Order, selected_fields)).order_by(models.Order.id)
+    return export_response(statement, models.Order, selected_fields, format, "orders")
+
+
+
+
+@admin_router.put("/{id}", status_code=status.HTTP_200_OK, response_model=StatusMessageResponse)
 async def update_order_status(
     db: db_dependency,
     id: int,
     new_status: OrderStatus,
-    user: UserIn = Depends(get_current_user),
+    user: Principal = Depends(get_current_principal),
 ):
     """
     Updates the status of an order by its ID. Only admins can access this endpoint.
@@ -258,7 +311,7 @@ async def update_order_status(
     db (Session): A database session object.
     id (int): The ID of the order to be updated.
     new_status (OrderStatus): The new status of the order.
-    user (UserIn): The authenticated user object.
+    user (Principal): The authenticated user.
 
     Returns:
     dict: A dictionary containing a success message if the order status is updated successfully.
@@ -277,6 +330,7 @@ async def update_order_status(
 
         order_to_update.status = new_status
         db.commit()
+        dashboard_cache.invalidate(order_to_update.user_id, "orders")
 
         return {
             "status": "ok",
@@ -5,9 +5,11 @@ from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.templating import Jinja2Templates
 from database import get_db
-from database import engine
 import models
-from services.auth import token_generator, very_token
+from schema.auth import LogoutRequest, RefreshRequest, TokenResponse
+from schema.common import MessageResponse
+from services.auth import (Principal, check_login_rate, decode_refresh_token, get_current_principal,
+                           refresh_tokens, revoke_token, token_generator, very_token)
 
 
 auth_router = APIRouter(
@@ -17,29 +19,79 @@ auth_router = APIRouter(
 )
 db_dependency = Annotated[Session, Depends(get_db)]
 
-models.Base.metadata.create_all(bind=engine)
 
 
 templates = Jinja2Templates(directory="templates")
 
-@auth_router.post('/token', status_code=status.HTTP_201_CREATED)
-async def generate_token(db: db_dependency, request_form: OAuth2PasswordRequestForm = Depends()):
+@auth_router.post('/token', status_code=status.HTTP_201_CREATED, response_model=TokenResponse)
+async def generate_token(db: db_dependency, request: Request, request_form: OAuth2PasswordRequestForm = Depends()):
     """
-    Generates an access token for the user.
+    Generates an access token and a refresh token for the user.
+
+    Login attempts are rate limited per client IP and per username, and the number of password
+    verifications running at once is capped. Attempts over either limit are rejected before
+    the password is hashed.
 
     Args:
+    request (Request): The HTTP request, read for the client IP.
     request_form (OAuth2PasswordRequestForm): The form data containing the username and password.
 
     Returns:
-    dict: A dictionary containing the generated access token and its type.
+    dict: A dictionary containing the access token, the refresh token, the token type and the access token's lifetime in seconds.
+
+    Raises:
+    HTTPException: If the username or password is incorrect (401), or there are too many login attempts (429).
+
+    """
+    check_login_rate(request.client.host if request.client else "unknown", request_form.username)
+    return await token_generator(db, request_form.username, request_form.password)
+
+
 
+@auth_router.post('/refresh', status_code=status.HTTP_201_CREATED, response_model=TokenResponse)
+async def refresh_token(db: db_dependency, request: RefreshRequest):
     """
-    token = await token_generator(db, request_form.username, request_form.password)
-    return {
-        'access_token': token,
-        'token_type': 'bearer',
-    }
+    Exchanges a refresh token for a new access token and refresh token. The refresh token can only be used once.
 
+    Args:
+    request (RefreshRequest): The refresh token.
+
+    Returns:
+    dict: A dictionary containing the new tokens, as returned by /auth/token.
+
+    Raises:
+    HTTPException: If the refresh token is invalid, expired or already used, or the user no longer exists.
+
+    """
+    return refresh_tokens(db, request.refresh_token)
+
+
+
+@auth_router.post('/logout', status_code=status.HTTP_200_OK, response_model=MessageResponse)
+async def logout(db: db_dependency, request: LogoutRequest, user: Principal = Depends(get_current_principal)):
+    """
+    Revokes the access token of the request and, when given, the user's refresh token.
+
+    Args:
+    request (LogoutRequest): The refresh token to revoke, optional.
+    user (Principal): The authenticated user.
+
+    Returns:
+    dict: A dictionary containing a confirmation message.
+
+    Raises:
+    HTTPException: If the refresh token is invalid or belongs to another user.
+
+    """
+    if request.refresh_token is not None:
+        payload = decode_refresh_token(request.refresh_token)
+        if payload["id"] != user.id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        revoke_token(db, payload)
+    revoke_token(db, {"jti": user.token_id, "exp": user.expires_at})
+    db.commit()
+
+    return {"status": "ok", "data": "Logged out successfully"}
 
 
 # @auth_router.get('/verification', response_class=HTMLResponse, status_code=status.HTTP_200_OK)
@@ -1,15 +1,25 @@
-from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from database import engine
+from typing import Annotated, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 import models
 from fastapi import File, UploadFile
 import secrets
-from PIL import Image
-from schema.user import UserIn
 from database import get_db
-from services.auth import get_current_user
-from schema.business import BusinessIn
+from services.auth import Principal, get_current_principal
+from services.dashboard import dashboard_cache
+from services.deletion import run_business_deletion
+from services.export import export_response
+from services.conditional import is_not_modified, make_etag, not_modified, set_validators
+from services.fields import load_fields, parse_fields
+from services.jobs import create_job
+from services.loader import Loader, get_loader
+from services.cursor import decode_cursor, encode_cursor
+from services.product import default_business_cache, default_business_flight, get_default_business_id, load_default_business_page, product_cache
+from schema.business import BusinessIn, BusinessListResponse, BusinessResponse, DefaultBusinessResponse
+from schema.common import FileFormat, FileUploadResponse, MessageResponse
+from schema.job import JobResponse
 from schema.user import UserRole
 
 
@@ -24,18 +34,17 @@ business_router = APIRouter(
 
 db_dependency = Annotated[Session, Depends(get_db)]
 
-models.Base.metadata.create_all(bind=engine)
 
 
-@business_router.post("/", status_code=status.HTTP_201_CREATED)
-async def create_business(db: db_dependency, business: BusinessIn, user: UserIn = Depends(get_current_user)):
+@business_router.post("/", status_code=status.HTTP_201_CREATED, response_model=BusinessResponse)
+async def create_business(db: db_dependency, business: BusinessIn, user: Principal = Depends(get_current_principal)):
     """
     Create a new business.
 
     Parameters:
     - db (Session): A database session object.
     - business (BusinessIn): A dictionary containing the business data to be created.
-    - user (UserIn): A dictionary containing the user data.
+    - user (Principal): The current user, retrieved from the access token.
 
     Returns:
     - dict: A dictionary containing the status, data, and the created business object.
@@ -47,13 +56,14 @@ async def create_business(db: db_dependency, business: BusinessIn, user: UserIn
         raise HTTPException(status_code=403, detail="Only business owners can create a business")
     try:
         # Create a new business object
-        business_obj = models.Business(**business.model_dump(), owner=user)
+        business_obj = models.Business(**business.model_dump(), owner_id=user.id)
         db.add(business_obj)
         db.commit()
+        dashboard_cache.invalidate(user.id, "businesses", "products")
 
         return {"status": "ok", 
                 "data": "Business created successfully",
-                "business": business_obj}
+                "business": business_obj.serialize()}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail="Failed to create business")
@@ -61,9 +71,9 @@ async def create_business(db: db_dependency, business: BusinessIn, user: UserIn
 
 
 
-@business_router.post("/business_logo/{id}", status_code=status.HTTP_201_CREATED)
+@business_router.post("/business_logo/{id}", status_code=status.HTTP_201_CREATED, response_model=FileUploadResponse)
 async def upload_business_logo(db: db_dependency, id: int, file: UploadFile = File(...), 
-                               user: UserIn = Depends(get_current_user)):
+                               user: Principal = Depends(get_current_principal)):
     """
     Upload a business logo.
 
@@ -71,7 +81,7 @@ async def upload_business_logo(db: db_dependency, id: int, file: UploadFile = Fi
     - db (Session): A database session object.
     - id (int): The ID of the business to which the logo will be uploaded.
     - file (UploadFile): The file object containing the business logo.
-    - user (UserIn): A dictionary containing the user data.
+    - user (Principal): The current user, retrieved from the access token.
 
     Returns:
     - dict: A dictionary containing the status, data, and the file URL of the uploaded business logo.
@@ -97,16 +107,21 @@ async def upload_business_logo(db: db_dependency, id: int, file: UploadFile = Fi
     with open(generated_name, "wb") as f:
         f.write(file_content)
 
-    # Resize the image using Pillow
+    # Resize the image using Pillow, imported lazily to keep worker startup fast
+    from PIL import Image
+
     img = Image.open(generated_name)
     img = img.resize(size=(200, 200))
     img.save(generated_name)
 
     try:
-        business = db.query(models.Business).filter(models.Business.id == id, models.Business.owner == user).first()
+        business = db.query(models.Business).filter(models.Business.id == id, models.Business.owner_id == user.id).first()
         if business:
             business.logo = token_name
             db.commit() 
+            # Cached product details embed the business, drop them all as this is rare
+            product_cache.clear()
+            dashboard_cache.invalidate(user.id, "businesses")
     except Exception as e:
         db.rollback() 
         raise HTTPException(
@@ -123,51 +138,50 @@ async def upload_business_logo(db: db_dependency, id: int, file: UploadFile = Fi
 
 
 
-@business_router.get("/me", status_code=status.HTTP_200_OK)
+@business_router.get("/me", status_code=status.HTTP_200_OK, response_model=BusinessListResponse, response_model_exclude_unset=True)
 async def get_user_business(db: db_dependency, 
-                            user: UserIn = Depends(get_current_user),
+                            loader: Loader = Depends(get_loader),
+                            user: Principal = Depends(get_current_principal),
                             page: int = Query(1, description="Page number", gt=0), 
-                            page_size: int = Query(10, description="Number of items per page", gt=0)):
+                            page_size: int = Query(10, description="Number of items per page", gt=0),
+                            fields: Optional[str] = Query(None, description="Comma separated product fields to return, e.g. product_id,name,new_price,product_image")):
     """
     Retrieve the user's businesses with pagination.
 
     Parameters:
     - db (Session): A database session object.
-    - user (UserIn): A dictionary containing the user data.
+    - loader (Loader): The request's batch loader.
+    - user (Principal): The current user, retrieved from the access token.
     - page (int): The page number.
     - page_size (int): The number of items per page.
+    - fields (Optional[str]): Comma separated product fields to return, defaults to all fields.
 
     Returns:
     - dict: A dictionary containing the status and the list of businesses owned by the user with pagination.
 
     Raises:
-    - HTTPException: If the user role is not 'BUSINESS_OWNER'.
+    - HTTPException: If the user role is not 'BUSINESS_OWNER' or if an unknown field is requested.
     """
     if user.role != UserRole.BUSINESS_OWNER:
         raise HTTPException(status_code=403, detail="Only business owners can retrieve their businesses")
 
+    selected_fields = parse_fields(fields, models.Product.serialized_fields)
+
     # Calculate the offset based on the page number and page size
     offset = (page - 1) * page_size
 
     # Query all businesses owned by the user with pagination
-    businesses = db.query(models.Business).filter_by(owner=user).offset(offset).limit(page_size).all()
+    businesses = db.query(models.Business).filter_by(owner_id=user.id).offset(offset).limit(page_size).all()
 
     if businesses:
         business_data_list = []
-        # Iterate over each business to retrieve associated products
+        # Load the products of every business of the page with one query
+        products_by_business = loader.products_of_businesses((business.id for business in businesses), selected_fields)
         for business in businesses:
-            products = db.query(models.Product).filter_by(business_id=business.id).all()
-
             # Serialize the business and product data for each business
             business_data = {
-                "business": {
-                    "business_id": business.id,
-                    "business_name": business.business_name,
-                    "city": business.city,
-                    "region": business.region,
-                    "business_description": business.business_description,
-                },
-                "products": [product.serialize() for product in products]
+                "business": business.serialize(),
+                "products": [product.serialize(selected_fields) for product in products_by_business[business.id]]
             }
             business_data_list.append(business_data)
 
@@ -179,10 +193,50 @@ async def get_user_business(db: db_dependency,
 
 
 
-@business_router.put("/{id}", status_code=status.HTTP_200_OK)
+@business_router.get("/{id}/export", status_code=status.HTTP_200_OK, response_class=StreamingResponse)
+async def export_business_products(db: db_dependency, id: int,
+                                   user: Principal = Depends(get_current_principal),
+                                   format: FileFormat = Query(FileFormat.csv, description="csv or ndjson"),
+                                   fields: Optional[str] = Query(None, description="Comma separated product fields to export, e.g. product_id,name,new_price,quantity")):
+    """
+    Export all products of a business as a CSV or NDJSON download.
+
+    The products are streamed to the client as they are read from a server-side cursor,
+    so the export does not need to page through GET /business/me.
+
+    Parameters:
+    - db (Session): A database session object.
+    - id (int): The ID of the business to export.
+    - user (Principal): The current user, retrieved from the access token.
+    - format (FileFormat): The format of the export, defaults to csv.
+    - fields (Optional[str]): Comma separated product fields to export, defaults to all fields.
+
+    Returns:
+    - StreamingResponse: The business' products, ordered by ID, as an attachment.
+
+    Raises:
+    - HTTPException: If the user is neither the business' owner nor an admin, if the business does not exist or if an unknown field is requested.
+    """
+    selected_fields = parse_fields(fields, models.Product.serialized_fields)
+
+    business = db.query(models.Business).filter_by(id=id).first()
+    if not business:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Business not found")
+    if business.owner_id != user.id and user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="You are not authorized to export this business")
+
+    statement = select(models.Product).options(*load_fields(models.Product, selected_fields))\
+        .where(models.Product.business_id == id).order_by(models.Product.id)
+    return export_response(statement, models.Product, selected_fields, format, f"business-{id}-products")
+
+
+
+
+
+@business_router.put("/{id}", status_code=status.HTTP_200_OK, response_model=MessageResponse)
 async def update_business(db: db_dependency, id: int, 
                           business_update: BusinessIn,
-                            user: UserIn = Depends(get_current_user)):
+                            user: Principal = Depends(get_current_principal)):
     """
     Update a business object.
 
@@ -190,7 +244,7 @@ async def update_business(db: db_dependency, id: int,
     - db (Session): A database session object.
     - id (int): The ID of the business to be updated.
     - business_update (BusinessIn): A dictionary containing the updated business data.
-    - user (UserIn): A dictionary containing the user data.
+    - user (Principal): The current user, retrieved from the access token.
 
     Returns:
     - dict: A dictionary containing the status and the updated business object.
@@ -205,14 +259,16 @@ async def update_business(db: db_dependency, id: int,
     business = db.query(models.Business).filter_by(id=id).first()
     if not business:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Business not found")
-    business_owner = business.owner
-    if user == business_owner:
+    if business.owner_id == user.id:
         # Update the business fields
         business.business_name = info["business_name"]
         business.city = info["city"]
         business.region = info["region"]
         business.business_description = info["business_description"]
         db.commit() 
+        # Cached product details embed the business, drop them all as this is rare
+        product_cache.clear()
+        dashboard_cache.invalidate(user.id, "businesses")
         return {"status": "ok", "data": "Business updated successfully"}
     
     else:
@@ -223,62 +279,90 @@ async def update_business(db: db_dependency, id: int,
 
 
 
-@business_router.get("/default", status_code=status.HTTP_200_OK)
-async def get_default_business(db: db_dependency, user: UserIn = Depends(get_current_user)):
+@business_router.get("/default", status_code=status.HTTP_200_OK, response_model=DefaultBusinessResponse)
+async def get_default_business(db: db_dependency, request: Request, response: Response,
+                               user: Principal = Depends(get_current_principal),
+                               cursor: Optional[str] = Query(None, description="The next_cursor of the previous page, omit for the first page"),
+                               page_size: int = Query(50, description="Number of products per page", gt=0, le=200)):
     """
-    Retrieve the default business.
+    Retrieve the default business and a page of its products.
+
+    The products are paginated by cursor over the (business_id, id) index, so every page costs
+    the same however many products the default business holds. The page's version counters are
+    read first with a narrow query, they build the ETag and a matching If-None-Match is answered
+    with 304. The serialized first page is cached and reused while its ETag is unchanged, and
+    concurrent requests for a page that changed share one load.
 
     Parameters:
     - db (Session): A database session object.
-    - user (UserIn): A dictionary containing the user data.
+    - request (Request): The incoming request, read for conditional headers.
+    - response (Response): The outgoing response, used to set the validators.
+    - user (Principal): The current user, retrieved from the access token.
+    - cursor (Optional[str]): The next_cursor of the previous page.
+    - page_size (int): The number of products per page.
 
     Returns:
-    - dict: A dictionary containing the status and the default business object.
+    - dict: A dictionary containing the status, the default business with a page of its products and the next page's cursor.
 
     Raises:
-    - HTTPException: If the user role is not 'BUSINESS_OWNER'.
+    - HTTPException: If the user role is not 'BUSINESS_OWNER', if the cursor is invalid or if the default business does not exist.
     """
     if user.role != UserRole.BUSINESS_OWNER:
         raise HTTPException(status_code=403, detail="Only business owners can access the default business")
 
-    # Query the default business by its name
-    default_business = db.query(models.Business).filter_by(business_name='Default Business').first()
-
-    if default_business:
-        # Query all products associated with the default business
-        products = db.query(models.Product).filter_by(business_id=default_business.id).all()
-
-        # Serialize the business and product data
-        business_data = {
-            "business": {
-                "business_id": default_business.id,
-                "business_name": default_business.business_name,
-                "city": default_business.city,
-                "region": default_business.region,
-                "business_description": default_business.business_description,
-                # Add other business fields as needed
-            },
-            "products": [product.serialize() for product in products]
-        }
-
-        return {"status": "ok", "data": business_data}
-    else:
+    after = decode_cursor(cursor)
+    default_business_id = get_default_business_id(db)
+    default_business = db.query(models.Business.version).filter_by(id=default_business_id).first()
+    if default_business is None:
         raise HTTPException(status_code=404, detail="Default Business not found")
 
-
-@business_router.delete("/{id}", status_code=status.HTTP_200_OK)
-async def delete_business(db: db_dependency, id: int, 
-                          user: UserIn = Depends(get_current_user)):
+    # Read the version counters of the page first, they are enough to answer a conditional request
+    query = db.query(models.Product.id, models.Product.version)\
+        .filter(models.Product.business_id == default_business_id)
+    if after is not None:
+        query = query.filter(models.Product.id > after)
+    page_validators = query.order_by(models.Product.id).limit(page_size + 1).all()
+    next_cursor = encode_cursor(page_validators[page_size - 1].id) if len(page_validators) > page_size else None
+    page_validators = page_validators[:page_size]
+
+    # The next cursor changes when a product is added after a full last page, its rows do not
+    etag = make_etag("default_business", default_business_id, default_business.version, after, page_size,
+                     [(row.id, row.version) for row in page_validators], next_cursor)
+    # No Last-Modified, a page whose rows were replaced by older ones would look unmodified
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
+
+    cached = default_business_cache.get(page_size) if after is None else None
+    if cached is not None and cached["etag"] == etag:
+        return cached["payload"]
+
+    # Concurrent requests for the same version of the page share one load
+    payload = await default_business_flight.do(etag, load_default_business_page, default_business_id,
+                                               [row.id for row in page_validators], next_cursor)
+    if after is None:
+        default_business_cache.set(page_size, {"etag": etag, "payload": payload})
+    return payload
+
+
+@business_router.delete("/{id}", status_code=status.HTTP_202_ACCEPTED, response_model=JobResponse)
+async def delete_business(db: db_dependency, id: int, background_tasks: BackgroundTasks,
+                          user: Principal = Depends(get_current_principal)):
     """
-    Delete a business object.
+    Delete a business object, with its products and their orders.
+
+    The deletion runs as a background job deleting the orders, then the products, then the
+    business in bounded chunks, and the request returns as soon as the job is created. Its
+    progress is available from GET /job/{id}.
 
     Parameters:
     - db (Session): A database session object.
     - id (int): The ID of the business to be deleted.
-    - user (UserIn): A dictionary containing the user data.
+    - background_tasks (BackgroundTasks): Runs the deletion after the response is sent.
+    - user (Principal): The current user, retrieved from the access token.
 
     Returns:
-    - dict: A dictionary containing the status and the message indicating that the business has been deleted successfully.
+    - dict: A dictionary containing the status, a message and the deletion job.
 
     Raises:
     - HTTPException: If the user role is not 'BUSINESS_OWNER' or if the business does not exist or if the current user is not the owner of the business.
@@ -286,16 +370,15 @@ async def delete_business(db: db_dependency, id: int,
     if user.role != UserRole.BUSINESS_OWNER:
         raise HTTPException(status_code=403, detail="Only business owners can delete their businesses")
     # Check if the business exists
-    business = db.query(models.Business).filter(models.Business.id == id).first()
-    if not business:
+    business_owner_id = db.query(models.Business.owner_id).filter(models.Business.id == id).first()
+    if not business_owner_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Business not found")
 
     # Check if the current user is the owner of the business
-    if business.owner_id != user.id:
+    if business_owner_id.owner_id != user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not authorized to delete this business")
 
-    # Delete the business from the database
-    db.delete(business)
-    db.commit()
+    job = create_job(db, "business_delete", user.id)
+    background_tasks.add_task(run_business_deletion, job.id, id)
 
-    return {"status": "ok", "message": "Business deleted successfully"}
\ No newline at end of file
+    return {"status": "ok", "data": "Business deletion started", "job": job.serialize()}
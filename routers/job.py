@@ -0,0 +1,40 @@
+from typing import Annotated
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+import models
+from database import get_db
+from schema.job import JobResponse
+from schema.user import UserRole
+from services.auth import Principal, get_current_principal
+
+
+job_router = APIRouter(
+    prefix="/job",
+    tags=["Job"],
+    responses={404: {"description": "Not found"}},
+)
+
+db_dependency = Annotated[Session, Depends(get_db)]
+
+
+@job_router.get("/{id}", status_code=status.HTTP_200_OK, response_model=JobResponse)
+async def get_job(db: db_dependency, id: str, user: Principal = Depends(get_current_principal)):
+    """
+    Retrieve the progress of a background job.
+
+    Args:
+        db (Session): Database session dependency.
+        id (str): The ID of the job, as returned when it was started.
+        user (Principal): The current user, retrieved through dependency injection.
+
+    Returns:
+        dict: A response dict with status and the job's progress and per-item errors.
+
+    Raises:
+        HTTPException: If the job does not exist or belongs to another user (404).
+    """
+    job = db.query(models.Job).filter_by(id=id).first()
+    if job is None or (job.owner_id != user.id and user.role != UserRole.ADMIN):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {"status": "ok", "data": f"Job is {job.status.value}", "job": job.serialize()}
@@ -1,12 +1,24 @@
-from typing import Annotated
+from datetime import datetime
+from typing import Annotated, Optional
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from database import engine
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 import models
 from database import get_db
-from schema.order import OrderIn, OrderStatus
-from schema.user import UserIn, UserRole
-from services.auth import get_current_user
+from schema.common import FileFormat, MessageResponse
+from schema.order import OrderIn, OrderListResponse, OrderResponse, OrderStatus, ReservationIn, ReservationResponse
+from schema.user import UserRole
+from services.auth import Principal, get_current_principal
+from services.dashboard import dashboard_cache
+from services.conditional import if_match_versions, is_not_modified, make_etag, make_version_etag, not_modified, precondition_failed, set_validators
+from services.export import export_response
+from services.fields import load_fields, parse_fields
+from services.feeds import product_feeds
+from services.loader import Loader, get_loader
+from services.product import product_cache
+from services.reservation import reservations
+from services.stats import popularity_counters
 
 
 
@@ -21,12 +33,12 @@ order_router = APIRouter(
     # description="This router provides endpoints for creating, retrieving, updating, and deleting orders."
 )
 
-models.Base.metadata.create_all(bind=engine)
 
 
 
-@order_router.post("/", status_code=status.HTTP_201_CREATED)
-async def create_order(db: db_dependency, order: OrderIn, user: UserIn = Depends(get_current_user)):
+@order_router.post("/", status_code=status.HTTP_201_CREATED, response_model=OrderResponse)
+async def create_order(db: db_dependency, order: OrderIn, loader: Loader = Depends(get_loader),
+                       user: Principal = Depends(get_current_principal)):
     """
      Create a new order.
 
@@ -34,44 +46,73 @@ async def create_order(db: db_dependency, order: OrderIn, user: UserIn = Depends
     The total price is calculated based on the product's price and the quantity ordered. The product
     quantity is also adjusted based on the order.
 
+    The stock is decremented by a single conditional UPDATE, which leaves the quantity held by
+    other customers' reservations untouched. An order naming one of the customer's reservations
+    of the product may use the stock it holds, the reservation is then released.
+
     Args:
         db (Session): Database session dependency.
         order (OrderIn): Pydantic model containing order details.
-        user (UserIn): The current user, retrieved through dependency injection.
+        loader (Loader): The request's batch loader.
+        user (Principal): The current user, retrieved through dependency injection.
 
     Returns:
         dict: A response dict with status, message, and serialized order data.
 
     Raises:
         HTTPException: If the user is not a customer (403).
+        HTTPException: If the quantity is not greater than 0 (400).
         HTTPException: If the product is not found (404).
         HTTPException: If the product is out of stock (400).
     """
     if user.role != UserRole.CUSTOMER:
         raise HTTPException(status_code=403, detail="Only customers can create an order")
-    
-    product = db.query(models.Product).filter_by(id=order.product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
 
-    if product.quantity < 1:
+    if order.quantity is None or order.quantity < 1:
+        raise HTTPException(status_code=400, detail="Quantity must be at least 1")
+
+    reservation = reservations.get(order.reservation_id) if order.reservation_id else None
+    if reservation is not None and (reservation.user_id != user.id or reservation.product_id != order.product_id):
+        reservation = None
+    held_by_others = reservations.held(order.product_id) - (reservation.quantity if reservation else 0)
+
+    # Deduct product quantity, if enough is left once the other reservations are served
+    product = db.scalars(
+        update(models.Product).where(
+            models.Product.id == order.product_id,
+            models.Product.deleted_at.is_(None),
+            models.Product.quantity >= order.quantity + held_by_others,
+        ).values(quantity=models.Product.quantity - order.quantity, version=models.Product.version + 1)
+        .returning(models.Product),
+        execution_options={"synchronize_session": False, "populate_existing": True},
+    ).first()
+    if product is None:
+        if not loader.product(order.product_id):
+            raise HTTPException(status_code=404, detail="Product not found")
         raise HTTPException(status_code=400, detail="Product out of stock")
 
     # Calculate the total price based on the product's price and the quantity
     order_total_price = product.new_price * order.quantity
 
-    # Deduct product quantity
-    product.quantity -= order.quantity
-
     new_order = models.Order(
         product_id=order.product_id,
         user_id=user.id,
+        quantity=order.quantity,
         total_price=order_total_price,
         status=OrderStatus.pending
     )
     
     db.add(new_order)
     db.commit()
+    if reservation is not None:
+        reservations.release(reservation.id)
+    popularity_counters.ordered(order.product_id)
+    # The product's stock changed
+    product_cache.delete(order.product_id)
+    product_feeds.saved(product)
+    dashboard_cache.invalidate(user.id, "orders")
+    business = loader.business(product.business_id)
+    dashboard_cache.invalidate(business.owner_id if business else None, "products")
 
     # Serialize the new_order object
     serialized_order = new_order.serialize()
@@ -79,20 +120,89 @@ async def create_order(db: db_dependency, order: OrderIn, user: UserIn = Depends
     return {"status": "ok", "data": "Order created successfully", "order": serialized_order}
 
 
-@order_router.put("/status/{id}", status_code=status.HTTP_200_OK)
-async def update_order_status(db: db_dependency, id: int, status: OrderStatus, 
-                              user: UserIn = Depends(get_current_user)):
+@order_router.post("/reservations", status_code=status.HTTP_201_CREATED, response_model=ReservationResponse)
+async def reserve_product(db: db_dependency, reservation: ReservationIn, user: Principal = Depends(get_current_principal)):
+    """
+    Reserve a quantity of a product.
+
+    This endpoint allows a customer to hold stock of a product, e.g. while it sits in their cart.
+    The quantity is held for `RESERVATION_TTL` seconds, it cannot be reserved or ordered by other
+    customers meanwhile. Pass the reservation's ID to create_order to use it.
+
+    Reservations are held in memory and checked against the product's current stock, read
+    with one primary key lookup of a single column. The products row is never written.
+
+    Args:
+        db (Session): Database session dependency.
+        reservation (ReservationIn): The product and the quantity to reserve.
+        user (Principal): The current user, retrieved through dependency injection.
+
+    Returns:
+        dict: A response dict with status and the reservation, with its expiry time.
+
+    Raises:
+        HTTPException: If the user is not a customer (403).
+        HTTPException: If the product is not found (404).
+        HTTPException: If not enough stock is left to reserve (400).
+    """
+    if user.role != UserRole.CUSTOMER:
+        raise HTTPException(status_code=403, detail="Only customers can reserve a product")
+
+    # Not the cached product, other workers' orders only invalidate their own cache
+    stock = db.query(models.Product.quantity).filter_by(id=reservation.product_id).scalar()
+    if stock is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    held = reservations.reserve(reservation.product_id, user.id, reservation.quantity, stock)
+    if held is None:
+        raise HTTPException(status_code=400, detail="Not enough stock left to reserve")
+
+    return {"status": "ok", "data": held.serialize()}
+
+
+@order_router.delete("/reservations/{reservation_id}", status_code=status.HTTP_200_OK, response_model=MessageResponse)
+async def release_reservation(reservation_id: str, user: Principal = Depends(get_current_principal)):
+    """
+    Release a reservation, returning its stock.
+
+    Args:
+        reservation_id (str): The ID of the reservation to release.
+        user (Principal): The current user, retrieved through dependency injection.
+
+    Returns:
+        dict: A response dict with status and a confirmation message.
+
+    Raises:
+        HTTPException: If the reservation is not found, has expired or is another customer's (404).
+    """
+    reservation = reservations.get(reservation_id)
+    if reservation is None or reservation.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+
+    reservations.release(reservation_id)
+    return {"status": "ok", "data": "Reservation released successfully"}
+
+
+@order_router.put("/status/{id}", status_code=status.HTTP_200_OK, response_model=OrderResponse)
+async def update_order_status(db: db_dependency, id: int, status: OrderStatus, request: Request, response: Response,
+                              user: Principal = Depends(get_current_principal)):
     """
     Update the status of an order.
 
     This endpoint allows a business owner to update the status of an order associated with their products.
     The business owner must be the owner of the business associated with the product in the order.
 
+    The order is updated by a single conditional UPDATE, restricted to the orders of the owner's
+    products and, when an If-Match header is given, to the order versions its entity tags name.
+    The response carries the ETag of the new version.
+
     Args:
         db (Session): Database session dependency.
         id (int): The ID of the order to update.
         status (OrderStatus): The new status for the order.
-        user (UserIn): The current user, retrieved through dependency injection.
+        request (Request): The incoming request, read for the If-Match header.
+        response (Response): The outgoing response, used to set the ETag.
+        user (Principal): The current user, retrieved through dependency injection.
 
     Returns:
         dict: A response dict with status, message, and serialized order data.
@@ -101,86 +211,166 @@ async def update_order_status(db: db_dependency, id: int, status: OrderStatus,
         HTTPException: If the user is not a business owner (403).
         HTTPException: If the order is not found (404).
         HTTPException: If the user is not the owner of the business associated with the product in the order (403).
+        HTTPException: If the order changed since the version named by If-Match (412).
     """
     # Check if the user is a business owner
     if user.role != UserRole.BUSINESS_OWNER:
         raise HTTPException(status_code=403, detail="Only business owners can update the status of their orders")
 
-    # Query the order to update
-    order_to_update = db.query(models.Order).filter_by(id=id).first()
-    if not order_to_update:
-        raise HTTPException(status_code=404, detail="Order not found")
-
-    # Query the product associated with the order
-    product = order_to_update.product
-
-    # Check if the user is the owner of the business associated with the product
-    if user.id != product.business.owner_id:
-        raise HTTPException(status_code=403, detail="Only the owner of the business can update the status of orders related to their products")
-
-    # Update the order status
-    order_to_update.status = status
+    # The products of the owner's businesses, the product may have been deleted since the order
+    owned_products = select(models.Product.id)\
+        .join(models.Business, models.Product.business_id == models.Business.id)\
+        .where(models.Business.owner_id == user.id)
+    criteria = [models.Order.id == id, models.Order.deleted_at.is_(None), models.Order.product_id.in_(owned_products)]
+    versions = if_match_versions(request, "order", id)
+    if versions is not None:
+        criteria.append(models.Order.version.in_(versions))
+
+    order_to_update = db.scalars(
+        update(models.Order).where(*criteria).values(status=status, version=models.Order.version + 1)
+        .returning(models.Order),
+        execution_options={"synchronize_session": False, "populate_existing": True, "include_deleted": True},
+    ).first()
+
+    if order_to_update is None:
+        # Nothing was updated, find out why
+        order_to_update = db.query(models.Order).filter_by(id=id).first()
+        if not order_to_update:
+            raise HTTPException(status_code=404, detail="Order not found")
+        owner_id = db.query(models.Business.owner_id)\
+            .join(models.Product, models.Product.business_id == models.Business.id)\
+            .filter(models.Product.id == order_to_update.product_id)\
+            .execution_options(include_deleted=True).scalar()
+        if owner_id is None or user.id != owner_id:
+            raise HTTPException(status_code=403, detail="Only the owner of the business can update the status of orders related to their products")
+        raise precondition_failed("The order was modified since it was read")
+
+    serialized_order = order_to_update.serialize()
+    set_validators(response, make_version_etag("order", id, order_to_update.version))
     db.commit()
+    dashboard_cache.invalidate(order_to_update.user_id, "orders")
 
     return {"status": "ok", "data": "Order status updated successfully",
-            "order": order_to_update.serialize()}
-
+            "order": serialized_order}
 
 
-
-@order_router.get("/", status_code=status.HTTP_200_OK)
-async def get_all_orders(db: db_dependency, 
-                         user: UserIn = Depends(get_current_user),
+@order_router.get("/", status_code=status.HTTP_200_OK, response_model=OrderListResponse, response_model_exclude_unset=True)
+async def get_all_orders(db: db_dependency, request: Request, response: Response,
+                         user: Principal = Depends(get_current_principal),
                          page: int = Query(1, description="Page number", gt=0), 
-                         page_size: int = Query(10, description="Number of items per page", gt=0)):
+                         page_size: int = Query(10, description="Number of items per page", gt=0),
+                         fields: Optional[str] = Query(None, description="Comma separated order fields to return, e.g. id,status,total_price")):
     """
     Retrieve all orders for a customer with pagination.
 
     This endpoint allows a customer to retrieve their orders with pagination support. The user can
-    specify the page number and the number of items per page.
+    specify the page number and the number of items per page, and narrow each order down to the
+    given fields. The page carries an ETag built from its row ids and versions, a matching
+    If-None-Match is answered with 304 before the orders are loaded.
 
     Args:
         db (Session): Database session dependency.
-        user (UserIn): The current user, retrieved through dependency injection.
+        request (Request): The incoming request, read for conditional headers.
+        response (Response): The outgoing response, used to set the validators.
+        user (Principal): The current user, retrieved through dependency injection.
         page (int): The page number to retrieve, defaults to 1.
         page_size (int): The number of items per page, defaults to 10.
+        fields (Optional[str]): Comma separated order fields to return, defaults to all fields.
 
     Returns:
         dict: A response dict with status and a list of serialized orders.
 
     Raises:
         HTTPException: If the user is not a customer (403).
+        HTTPException: If an unknown field is requested (400).
 
     """ 
     if user.role != UserRole.CUSTOMER:
         raise HTTPException(status_code=403, detail="Only customers can retrieve their orders")
 
+    selected_fields = parse_fields(fields, models.Order.serialized_fields)
+
     # Calculate the offset based on the page number and page size
     offset = (page - 1) * page_size
-    
-    # Query all orders associated with the user with pagination
-    user_orders = db.query(models.Order).filter_by(user_id=user.id).offset(offset).limit(page_size).all()
 
-    serialized_orders = [order.serialize() for order in user_orders]
+    # Read the version counters of the page first, they are enough to answer a conditional request
+    page_validators = db.query(models.Order.id, models.Order.version)\
+        .filter_by(user_id=user.id).order_by(models.Order.id).offset(offset).limit(page_size).all()
+    etag = make_etag("orders", user.id, page, page_size, selected_fields, [(row.id, row.version) for row in page_validators])
+    # No Last-Modified, a page whose rows were replaced by older ones would look unmodified
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
+
+    # Query the orders of the page, selecting only the requested columns
+    user_orders = db.query(models.Order).options(*load_fields(models.Order, selected_fields))\
+        .filter(models.Order.id.in_([row.id for row in page_validators])).order_by(models.Order.id).all()
+
+    serialized_orders = [order.serialize(selected_fields) for order in user_orders]
 
     return {"status": "ok", "data": serialized_orders}
 
 
 
 
-@order_router.put("/{id}", status_code=status.HTTP_200_OK)
-async def update_order(db: db_dependency, id: int, order: OrderIn, user: UserIn = Depends(get_current_user)):
+@order_router.get("/export", status_code=status.HTTP_200_OK, response_class=StreamingResponse)
+async def export_business_orders(user: Principal = Depends(get_current_principal),
+                                 format: FileFormat = Query(FileFormat.csv, description="csv or ndjson"),
+                                 fields: Optional[str] = Query(None, description="Comma separated order fields to export, e.g. id,product_id,status,total_price")):
+    """
+    Export the orders of a business owner's products as a CSV or NDJSON download.
+
+    This endpoint allows a business owner to download every order placed on the products of
+    their businesses, deleted products included. The orders are streamed to the client as they
+    are read from a server-side cursor, so memory use does not grow with the number of orders.
+
+    Args:
+        user (Principal): The current user, retrieved through dependency injection.
+        format (FileFormat): The format of the export, defaults to csv.
+        fields (Optional[str]): Comma separated order fields to export, defaults to all fields.
+
+    Returns:
+        StreamingResponse: The orders, ordered by ID, as an attachment.
+
+    Raises:
+        HTTPException: If the user is not a business owner (403).
+        HTTPException: If an unknown field is requested (400).
+    """
+    if user.role != UserRole.BUSINESS_OWNER:
+        raise HTTPException(status_code=403, detail="Only business owners can export the orders of their products")
+
+    selected_fields = parse_fields(fields, models.Order.serialized_fields)
+
+    statement = select(models.Order).options(*load_fields(models.Order, selected_fields))\
+        .join(models.Product, models.Order.product_id == models.Product.id)\
+        .join(models.Business, models.Product.business_id == models.Business.id)\
+        .where(models.Business.owner_id == user.id, models.Order.deleted_at.is_(None))\
+        .order_by(models.Order.id).execution_options(include_deleted=True)
+    return export_response(statement, models.Order, selected_fields, format, f"owner-{user.id}-orders")
+
+
+
+
+@order_router.put("/{id}", status_code=status.HTTP_200_OK, response_model=OrderResponse)
+async def update_order(db: db_dependency, id: int, order: OrderIn, request: Request, response: Response,
+                       user: Principal = Depends(get_current_principal)):
 
     """
     Update the quantity of an order.
 
     This endpoint allows a customer to update the quantity of an order they have placed.
 
+    The order is updated by a single conditional UPDATE, restricted to the customer's orders
+    and, when an If-Match header is given, to the order versions its entity tags name.
+    The response carries the ETag of the new version.
+
     Args:
         db (Session): Database session dependency.
         id (int): The ID of the order to update.
         order (OrderIn): Pydantic model containing the new order details.
-        user (UserIn): The current user, retrieved through dependency injection.
+        request (Request): The incoming request, read for the If-Match header.
+        response (Response): The outgoing response, used to set the ETag.
+        user (Principal): The current user, retrieved through dependency injection.
 
     Returns:
         dict: A response dict with status and serialized updated order data.
@@ -188,40 +378,53 @@ async def update_order(db: db_dependency, id: int, order: OrderIn, user: UserIn
     Raises:
         HTTPException: If the user is not a customer (403).
         HTTPException: If the order is not found (404).
+        HTTPException: If the order changed since the version named by If-Match (412).
 
     """
     if user.role != UserRole.CUSTOMER:
         raise HTTPException(status_code=403, detail="Only customers can update their orders")
 
-    order_to_update = db.query(models.Order).filter_by(id=id).first()
-    if not order_to_update:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-
-
-    order_to_update.quantity = order.quantity
-
+    criteria = [models.Order.id == id, models.Order.user_id == user.id, models.Order.deleted_at.is_(None)]
+    versions = if_match_versions(request, "order", id)
+    if versions is not None:
+        criteria.append(models.Order.version.in_(versions))
+
+    order_to_update = db.scalars(
+        update(models.Order).where(*criteria).values(quantity=order.quantity, version=models.Order.version + 1)
+        .returning(models.Order),
+        execution_options={"synchronize_session": False, "populate_existing": True},
+    ).first()
+
+    if order_to_update is None:
+        # Nothing was updated, either the order is not the customer's or it changed
+        if not db.query(models.Order.id).filter_by(id=id, user_id=user.id).first():
+            raise HTTPException(status_code=404, detail="Order not found")
+        raise precondition_failed("The order was modified since it was read")
+
+    serialized_order = order_to_update.serialize()
+    set_validators(response, make_version_etag("order", id, order_to_update.version))
     db.commit()
+    dashboard_cache.invalidate(user.id, "orders")
 
     return {"status": "ok", "data": "Order updated successfully",
-            "order": order_to_update.serialize()}
+            "order": serialized_order}
 
 
 
 
-@order_router.delete("/{id}", status_code=status.HTTP_200_OK)
-async def delete_order(db: db_dependency, id: int, user: UserIn = Depends(get_current_user)):
+@order_router.delete("/{id}", status_code=status.HTTP_200_OK, response_model=MessageResponse)
+async def delete_order(db: db_dependency, id: int, user: Principal = Depends(get_current_principal)):
 
     """
     Delete an order.
 
     This endpoint allows a customer to delete an order they have placed. Only the customer who 
-    placed the order can delete it.
+    placed the order can delete it. The order is soft deleted and kept out of every listing.
 
     Args:
         db (Session): Database session dependency.
         id (int): The ID of the order to delete.
-        user (UserIn): The current user, retrieved through dependency injection.
+        user (Principal): The current user, retrieved through dependency injection.
 
     Returns:
         dict: A response dict with status and a confirmation message.
@@ -242,8 +445,9 @@ async def delete_order(db: db_dependency, id: int, user: UserIn = Depends(get_cu
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Delete the order
-    db.delete(order)
+    order.deleted_at = datetime.now()
     db.commit()
+    dashboard_cache.invalidate(user.id, "orders")
     
     return {"status": "ok", "data": "Order deleted successfully"}
 
@@ -1,15 +1,27 @@
-from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from database import engine
+import os
+import tempfile
+from datetime import datetime
+from typing import Annotated, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 import models
 from fastapi import File, UploadFile
 import secrets
-from PIL import Image
-from schema.product import ProductIn, ProductUpdate
-from schema.user import UserIn, UserRole
+from schema.common import FileFormat, FileUploadResponse, ImportMode, MessageResponse
+from schema.job import JobResponse
+from schema.product import ProductBatchResponse, ProductBatchUpdate, ProductDetailResponse, ProductLookupResponse, ProductIn, ProductListResponse, ProductResponse, ProductUpdate
+from schema.user import UserRole
 from database import get_db
-from services.auth import get_current_user
+from services.auth import Principal, get_current_principal
+from services.dashboard import dashboard_cache
+from services.fields import load_fields, parse_fields
+from services.feeds import FEED_SIZE, product_feeds
+from services.conditional import if_match_versions, is_not_modified, make_etag, make_version_etag, not_modified, precondition_failed, set_validators
+from services.jobs import create_job
+from services.loader import Loader, get_loader
+from services.product import MAX_IMPORT_SIZE, batch_update_products, business_details, calculate_percentage_discount, get_default_business_id, load_product_detail, product_cache, product_flight, run_product_import
+from services.stats import popular_products, popularity_counters
 
 
 
@@ -24,10 +36,9 @@ product_router = APIRouter(
 
 
 db_dependency = Annotated[Session, Depends(get_db)]
-models.Base.metadata.create_all(bind=engine)
 
-@product_router.post("/products")
-async def add_new_product(db: db_dependency, product: ProductIn, user: UserIn = Depends(get_current_user)):
+@product_router.post("/products", response_model=ProductResponse)
+async def add_new_product(db: db_dependency, product: ProductIn, user: Principal = Depends(get_current_principal)):
 
     """
     Add a new product.
@@ -38,7 +49,7 @@ async def add_new_product(db: db_dependency, product: ProductIn, user: UserIn =
     Args:
         db (Session): Database session dependency.
         product (ProductIn): Pydantic model containing product details.
-        user (UserIn): The current user, retrieved through dependency injection.
+        user (Principal): The current user, retrieved through dependency injection.
 
     Returns:
         dict: A response dict with status, message, and serialized product data.
@@ -49,48 +60,29 @@ async def add_new_product(db: db_dependency, product: ProductIn, user: UserIn =
 
     product_data = product.model_dump()
     if product_data["original_price"] > 0:
-        product_data["percentage_discount"] = ((product_data["original_price"] - product_data["new_price"]) / product_data["original_price"]) * 100
+        product_data["percentage_discount"] = calculate_percentage_discount(product_data["original_price"], product_data["new_price"])
 
         product_obj = models.Product(**product_data)
         
-        # Fetch or create the default business
-        default_business = db.query(models.Business).filter_by(business_name='Default Business').first()
-        if not default_business:
-            default_business = models.Business(
-                business_name="Default Business",
-                city="Unspecified",
-                region="Unspecified",
-                business_description="Default business entity for products without specified business",
-                logo="default_logo.jpg",
-            )
-            db.add(default_business)
-            db.commit()
-
-        # Check if the product includes the business_id
-        if "business_id" in product_data and product_data["business_id"]:
-            business_id = product_data["business_id"]
-            # Fetch the business associated with the provided business_id
-            business = db.query(models.Business).filter_by(id=business_id).first()
+        # The default business' id is cached and it has no owner, products added to it need no lookup
+        default_business_id = get_default_business_id(db)
+        business_id = product_data["business_id"] or default_business_id
+
+        if business_id != default_business_id:
+            # Fetch the owner of the business associated with the provided business_id
+            business = db.query(models.Business.owner_id).filter_by(id=business_id).first()
             if not business:
                 raise HTTPException(status_code=404, detail="Business not found with the provided business_id")
-        else:
-            # If no business_id provided, associate product with default business
-            business = default_business
 
-        # Check if the business is the default business
-        is_default_business = business.business_name == 'Default Business'
-
-        # If it's the default business and it doesn't have an owner, skip authorization check
-        if is_default_business and not business.owner_id:
-            product_obj.business = business
-        else:
             # Check if the business belongs to the current user
             if business.owner_id != user.id:
                 raise HTTPException(status_code=403, detail="You are not authorized to associate a product with this business")
-            product_obj.business = business
+        product_obj.business_id = business_id
 
         db.add(product_obj)
         db.commit()
+        product_feeds.saved(product_obj)
+        dashboard_cache.invalidate(user.id, "products")
 
         # Serialize the product object for response
         product_data = product_obj.serialize()
@@ -106,60 +98,280 @@ async def add_new_product(db: db_dependency, product: ProductIn, user: UserIn =
 
 
 
-@product_router.get("/", status_code=status.HTTP_200_OK)
-async def get_all_products(db: db_dependency, 
-                           user: UserIn = Depends(get_current_user),
+# Content types of the import formats, used when no format is given
+IMPORT_CONTENT_TYPES = {
+    "text/csv": FileFormat.csv,
+    "application/x-ndjson": FileFormat.ndjson,
+    "application/ndjson": FileFormat.ndjson,
+}
+
+
+@product_router.post("/import", status_code=status.HTTP_202_ACCEPTED, response_model=JobResponse)
+async def import_products(db: db_dependency, request: Request, background_tasks: BackgroundTasks,
+                          user: Principal = Depends(get_current_principal),
+                          format: Optional[FileFormat] = Query(None, description="csv or ndjson, defaults to the request's Content-Type"),
+                          mode: ImportMode = Query(ImportMode.create, description="create new products, or update existing ones")):
+    """
+    Import products in bulk from a CSV or NDJSON upload.
+
+    This endpoint allows a business owner to upload a CSV file with a header row or one JSON
+    product per line as the raw request body. The body is streamed to a temporary file and the
+    products are validated and inserted in chunks by a background job, so the request returns
+    as soon as the upload is stored. Each row is validated like a product added through
+    POST /product/products and the progress and rejected rows are available from GET /job/{id}.
+    With mode=update each row changes an existing product like an item of PATCH /product/batch,
+    for updates too large for a single batch. Uploads larger than `MAX_IMPORT_SIZE` bytes are rejected.
+
+    Args:
+        db (Session): Database session dependency.
+        request (Request): The incoming request, its body is the file to import.
+        background_tasks (BackgroundTasks): Runs the import after the response is sent.
+        user (Principal): The current user, retrieved through dependency injection.
+        format (Optional[FileFormat]): The format of the upload, defaults to its Content-Type.
+        mode (ImportMode): Whether the rows are new products or changes to existing ones, defaults to create.
+
+    Returns:
+        dict: A response dict with status, message, and the import job.
+
+    Raises:
+        HTTPException: If the user is not a business owner (403).
+        HTTPException: If the format is neither given nor recognised from the Content-Type (415).
+        HTTPException: If the upload is larger than MAX_IMPORT_SIZE (413).
+    """
+    if user.role != UserRole.BUSINESS_OWNER:
+        raise HTTPException(status_code=403, detail="Only business owners can import products")
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    import_format = format or IMPORT_CONTENT_TYPES.get(content_type)
+    if import_format is None:
+        raise HTTPException(status_code=415, detail="Upload a text/csv or application/x-ndjson body, or pass ?format=")
+
+    too_large = HTTPException(status_code=413, detail=f"Uploads are limited to {MAX_IMPORT_SIZE} bytes")
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > MAX_IMPORT_SIZE:
+        raise too_large
+
+    # Spool the body to disk as it arrives, the import outlives the request. The
+    # Content-Length may be missing or wrong, the limit is enforced on the bytes received.
+    size = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{import_format.value}") as upload:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > MAX_IMPORT_SIZE:
+                break
+            upload.write(chunk)
+    if size > MAX_IMPORT_SIZE:
+        os.remove(upload.name)
+        raise too_large
+
+    job = create_job(db, "product_import", user.id)
+    background_tasks.add_task(run_product_import, job.id, upload.name, import_format.value, user.id, mode=mode.value)
+
+    return {"status": "ok", "data": "Product import started", "job": job.serialize()}
+
+
+
+
+@product_router.get("/", status_code=status.HTTP_200_OK, response_model=ProductListResponse, response_model_exclude_unset=True)
+async def get_all_products(db: db_dependency, request: Request, response: Response,
+                           user: Principal = Depends(get_current_principal),
                            page: int = Query(1, description="Page number", gt=0), 
-                           page_size: int = Query(10, description="Number of items per page", gt=0)):
+                           page_size: int = Query(10, description="Number of items per page", gt=0),
+                           fields: Optional[str] = Query(None, description="Comma separated product fields to return, e.g. product_id,name,new_price,product_image")):
     
     """
     Retrieve all products with pagination.
 
     This endpoint allows an authenticated user to retrieve a paginated list of all products. 
-    The user can specify the page number and the number of items per page.
+    The user can specify the page number and the number of items per page, and narrow each
+    product down to the given fields. The page carries an ETag built from its row ids and
+    versions, a matching If-None-Match is answered with 304 before the products are loaded.
 
     Args:
         db (Session): Database session dependency.
-        user (UserIn): The current user, retrieved through dependency injection.
+        request (Request): The incoming request, read for conditional headers.
+        response (Response): The outgoing response, used to set the validators.
+        user (Principal): The current user, retrieved through dependency injection.
         page (int): The page number to retrieve, defaults to 1.
         page_size (int): The number of items per page, defaults to 10.
+        fields (Optional[str]): Comma separated product fields to return, defaults to all fields.
 
     Returns:
         dict: A response dict with status and a list of product data.
 
     Raises:
         HTTPException: If the user is not authenticated (401).
+        HTTPException: If an unknown field is requested (400).
 
     """
     if not user:
         raise HTTPException(status_code=401, detail="Unauthorized, please login")
 
+    selected_fields = parse_fields(fields, models.Product.serialized_fields)
+
     # Calculate the offset based on the page number and page size
     offset = (page - 1) * page_size
-    
-    # Query all products with pagination
-    products = db.query(models.Product).offset(offset).limit(page_size).all()
+
+    # Read the version counters of the page first, they are enough to answer a conditional request
+    page_validators = db.query(models.Product.id, models.Product.version)\
+        .order_by(models.Product.id).offset(offset).limit(page_size).all()
+    etag = make_etag("products", page, page_size, selected_fields, [(row.id, row.version) for row in page_validators])
+    # No Last-Modified, a page whose rows were replaced by older ones would look unmodified
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_validators(response, etag)
+
+    # Query the products of the page, selecting only the requested columns
+    products = db.query(models.Product).options(*load_fields(models.Product, selected_fields))\
+        .filter(models.Product.id.in_([row.id for row in page_validators])).order_by(models.Product.id).all()
 
     return {
         "status": "ok",
-        "data": products
+        "data": [product.serialize(selected_fields) for product in products]
     }
 
 
-@product_router.get("/{id}", status_code=status.HTTP_200_OK)
-async def get_specific_product(db: db_dependency, id: int,
-                               user: UserIn = Depends(get_current_user)):
+@product_router.get("/deals", status_code=status.HTTP_200_OK, response_model=ProductListResponse)
+async def get_deals(user: Principal = Depends(get_current_principal),
+                    limit: int = Query(20, description="Number of products to return", gt=0, le=FEED_SIZE)):
+    """
+    Retrieve the products with the highest discounts.
+
+    The feed is kept in memory and updated on product writes, so it is served without
+    querying or sorting the products table. Concurrent reads of a stale feed share one rebuild.
+
+    Args:
+        user (Principal): The current user, retrieved through dependency injection.
+        limit (int): The number of products to return, defaults to 20.
+
+    Returns:
+        dict: A response dict with status and the discounted products, highest discount first.
+    """
+    return {"status": "ok", "data": await product_feeds.top("deals", limit)}
+
+
+@product_router.get("/newest", status_code=status.HTTP_200_OK, response_model=ProductListResponse)
+async def get_newest(user: Principal = Depends(get_current_principal),
+                     limit: int = Query(20, description="Number of products to return", gt=0, le=FEED_SIZE)):
+    """
+    Retrieve the most recently published products.
+
+    The feed is kept in memory and updated on product writes, so it is served without
+    querying or sorting the products table. Concurrent reads of a stale feed share one rebuild.
+
+    Args:
+        user (Principal): The current user, retrieved through dependency injection.
+        limit (int): The number of products to return, defaults to 20.
+
+    Returns:
+        dict: A response dict with status and the products, newest first.
+    """
+    return {"status": "ok", "data": await product_feeds.top("newest", limit)}
+
+
+@product_router.get("/popular", status_code=status.HTTP_200_OK, response_model=ProductListResponse)
+async def get_popular(user: Principal = Depends(get_current_principal),
+                      limit: int = Query(20, description="Number of products to return", gt=0, le=FEED_SIZE)):
+    """
+    Retrieve the most popular products, by views and orders.
+
+    Views and orders are counted in memory and added to the product statistics every few
+    seconds, the listing is read from the indexed popularity score and cached for a minute.
+
+    Args:
+        user (Principal): The current user, retrieved through dependency injection.
+        limit (int): The number of products to return, defaults to 20.
+
+    Returns:
+        dict: A response dict with status and the products, most popular first.
+    """
+    return {"status": "ok", "data": await popular_products(limit)}
+
+
+
+
+# Most products a batch lookup can ask for
+BATCH_LOOKUP_SIZE = 100
+
+
+@product_router.get("/batch", status_code=status.HTTP_200_OK, response_model=ProductLookupResponse, response_model_exclude_unset=True)
+async def get_products_by_ids(loader: Loader = Depends(get_loader), user: Principal = Depends(get_current_principal),
+                              ids: str = Query(..., description="Comma separated product IDs, e.g. 3,1,7"),
+                              fields: Optional[str] = Query(None, description="Comma separated product fields to return, add business_details to include the business")):
+    """
+    Retrieve several products by their IDs.
+
+    This endpoint serves the screens that list specific products, such as a cart or an order
+    history, in one request instead of one GET /product/{id} per product. The products, their
+    businesses and the business owners are each loaded with a single query.
+
+    Args:
+        loader (Loader): The request's batch loader.
+        user (Principal): The current user, retrieved through dependency injection.
+        ids (str): Comma separated product IDs, at most 100.
+        fields (Optional[str]): Comma separated fields to return, defaults to all fields with the business details.
+
+    Returns:
+        dict: A response dict with status, the products found in the requested order, and the missing IDs.
+
+    Raises:
+        HTTPException: If the IDs are not integers or more than 100 are requested (400).
+        HTTPException: If an unknown field is requested (400).
+    """
+    try:
+        product_ids = list(dict.fromkeys(int(id) for id in ids.split(",") if id.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+    if not product_ids or len(product_ids) > BATCH_LOOKUP_SIZE:
+        raise HTTPException(status_code=400, detail=f"Request between 1 and {BATCH_LOOKUP_SIZE} product IDs")
+
+    selected_fields = parse_fields(fields, [*models.Product.serialized_fields, "business_details"])
+    include_business = selected_fields is None or "business_details" in selected_fields
+    if selected_fields is not None:
+        selected_fields = [field for field in selected_fields if field != "business_details"]
+
+    products = loader.products(product_ids, selected_fields)
+    found = [product for product in products.values() if product is not None]
+    businesses = loader.businesses((product.business_id for product in found), with_owners=True) if include_business else {}
+
+    data = []
+    for product in found:
+        product_data = product.serialize(selected_fields)
+        business = businesses.get(product.business_id)
+        if business is not None:
+            product_data["business_details"] = business_details(business)
+        data.append(product_data)
+
+    return {"status": "ok", "data": data, "missing": [id for id, product in products.items() if product is None]}
+
+
+
+
+@product_router.get("/{id}", status_code=status.HTTP_200_OK, response_model=ProductDetailResponse, response_model_exclude_unset=True)
+async def get_specific_product(id: int, request: Request, response: Response,
+                               user: Principal = Depends(get_current_principal),
+                               fields: Optional[str] = Query(None, description="Comma separated product fields to return, add business_details to include the business")):
 
     """
     Retrieve specific product details.
 
     This endpoint allows an authenticated user to retrieve details of a specific product by its ID.
-    It also includes information about the business that owns the product.
+    It also includes information about the business that owns the product, unless `fields` is
+    given without `business_details`.
+
+    The product, its business and their validators are cached together for a short time and
+    every field selection is served from the cached entry. Concurrent requests missing the
+    cache share a single load, and a hot entry is refreshed by one request shortly before it
+    expires. The response carries ETag and Last-Modified headers built from the product and
+    business version counters, a matching If-None-Match (or If-Modified-Since) is answered with 304.
+    The ETag can be sent as If-Match to update the product only if it was not modified since.
 
     Args:
-        db (Session): Database session dependency.
         id (int): The ID of the product to retrieve.
-        user (UserIn): The current user, retrieved through dependency injection.
+        request (Request): The incoming request, read for conditional headers.
+        response (Response): The outgoing response, used to set the validators.
+        user (Principal): The current user, retrieved through dependency injection.
+        fields (Optional[str]): Comma separated fields to return, defaults to all fields.
 
     Returns:
         dict: A response dict with status, product data, and business details.
@@ -168,51 +380,52 @@ async def get_specific_product(db: db_dependency, id: int,
         HTTPException: If the user is not authenticated (401).
         HTTPException: If the product is not found (404).
         HTTPException: If the business associated with the product is not found (404).
+        HTTPException: If an unknown field is requested (400).
 
     """
 
     if not user:
         raise HTTPException(status_code=401, detail="Unauthorized, please login")
 
-    product = db.query(models.Product).filter_by(id=id).first()
-
-    if product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
+    selected_fields = parse_fields(fields, [*models.Product.serialized_fields, "business_details"])
+    include_business = selected_fields is None or "business_details" in selected_fields
+    if selected_fields is not None:
+        selected_fields = [field for field in selected_fields if field != "business_details"]
 
-    business = db.query(models.Business).filter_by(id=product.business_id).first()
-    if business is None:
-        raise HTTPException(status_code=404, detail="Business not found for the product")
+    # Hot entries are refreshed a little ahead of expiry by one request, concurrent misses share one load
+    cached = product_cache.get(id, early_refresh=1)
+    if cached is None:
+        cached = await product_flight.do(id, load_product_detail, id)
+        if cached is None:
+            raise HTTPException(status_code=404, detail="Product not found")
 
-    if business.owner:
-        owner_email = business.owner.email
-    else:
-        owner_email = None
+    # Counted in memory, the counts are written to the database in batches
+    popularity_counters.viewed(id)
 
-    return {
-        "status": "ok",
-        "data": product.serialize(),
-        "business_details": {
-            "name": business.business_name,
-            "city": business.city,
-            "region": business.region,
-            "description": business.business_description,
-            "logo": business.logo,
-            "business_id": business.id,
-            "owner_id": business.owner_id,
-            "email": owner_email,
-            "join_date": business.owner.join_date.strftime("%b %d %Y %H:%M:%S") if business.owner else None
-        },
-    }
+    # Led by the product's version, so the tag can be sent as If-Match to update the product
+    etag = make_version_etag("product", id, cached["versions"][0], cached["versions"], selected_fields, include_business)
+    if is_not_modified(request, etag, cached["last_modified"]):
+        return not_modified(etag, cached["last_modified"])
 
+    if selected_fields is None:
+        product_data = {"status": "ok", "data": cached["product"]}
+    else:
+        product_data = {"status": "ok", "data": {field: cached["product"][field] for field in selected_fields}}
 
+    if include_business:
+        if cached["business_details"] is None:
+            raise HTTPException(status_code=404, detail="Business not found for the product")
+        product_data["business_details"] = cached["business_details"]
 
+    set_validators(response, etag, cached["last_modified"])
+    return product_data
 
 
 
 
-@product_router.post("/product_image/{id}",status_code=status.HTTP_201_CREATED)
+@product_router.post("/product_image/{id}",status_code=status.HTTP_201_CREATED, response_model=FileUploadResponse)
 async def upload_product_image(db: db_dependency, id: int, file: UploadFile = File(...),
-                             user: UserIn = Depends(get_current_user)):
+                             user: Principal = Depends(get_current_principal)):
     
     """
     Upload a product image.
@@ -224,7 +437,7 @@ async def upload_product_image(db: db_dependency, id: int, file: UploadFile = Fi
         db (Session): Database session dependency.
         id (int): The ID of the product to associate the image with.
         file (UploadFile): The image file to upload.
-        user (UserIn): The current user, retrieved through dependency injection.
+        user (Principal): The current user, retrieved through dependency injection.
 
     Returns:
         dict: A response dict with status, a message, and the URL of the uploaded image.
@@ -257,6 +470,9 @@ async def upload_product_image(db: db_dependency, id: int, file: UploadFile = Fi
         f.write(file_content)
 
 
+    # Resize the image using Pillow, imported lazily to keep worker startup fast
+    from PIL import Image
+
     img = Image.open(generated_name)
     img = img.resize(size=(200, 200))
     img.save(generated_name)
@@ -265,10 +481,12 @@ async def upload_product_image(db: db_dependency, id: int, file: UploadFile = Fi
         product = db.query(models.Product).filter(models.Product.id == id).first()
         if product:
             business = product.business
-            owner = business.owner
-            if user == owner:
+            if business is not None and business.owner_id == user.id:
                 product.product_image = token_name
                 db.commit() 
+                product_cache.delete(id)
+                product_feeds.saved(product)
+                dashboard_cache.invalidate(user.id, "products")
             else:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
@@ -297,75 +515,164 @@ async def upload_product_image(db: db_dependency, id: int, file: UploadFile = Fi
 
     
 
-@product_router.put("/{id}", status_code=status.HTTP_200_OK)
-async def update_product(db: db_dependency, id: int, product_update: ProductUpdate, user: UserIn = Depends(get_current_user)):
+@product_router.patch("/batch", status_code=status.HTTP_200_OK, response_model=ProductBatchResponse)
+async def batch_update_product_prices(db: db_dependency, batch: ProductBatchUpdate, user: Principal = Depends(get_current_principal)):
+    """
+    Update the prices, stock and offers of many products at once.
+
+    This endpoint allows a business owner to reprice or restock many of their products in one
+    request. Ownership of every product is verified with a single query, then the changes are
+    applied with set-based UPDATE ... FROM (VALUES ...) statements that recompute each
+    product's percentage discount in the database. Fields left out of an item are unchanged.
+    The batch is applied in one transaction: either every product is updated or none is.
+    A batch holds at most 1000 products, larger updates go through POST /product/import?mode=update.
+
+    Args:
+        db (Session): Database session dependency.
+        batch (ProductBatchUpdate): The changes, one item per product.
+        user (Principal): The current user, retrieved through dependency injection.
+
+    Returns:
+        dict: A response dict with status, a message, and the number of updated products.
+
+    Raises:
+        HTTPException: If the user is not a business owner (403).
+        HTTPException: If a product appears more than once in the batch (400).
+        HTTPException: If some of the products are not found (404).
+        HTTPException: If some of the products belong to another owner's business (403).
+    """
+    if user.role != UserRole.BUSINESS_OWNER:
+        raise HTTPException(status_code=403, detail="Only business owners can update products")
+
+    product_ids = [item.product_id for item in batch.products]
+    if len(set(product_ids)) != len(product_ids):
+        raise HTTPException(status_code=400, detail="Each product can only be updated once per batch")
+
+    # Verify the ownership of the whole batch in one query
+    owners = dict(db.query(models.Product.id, models.Business.owner_id)
+                  .outerjoin(models.Business, models.Product.business_id == models.Business.id)
+                  .filter(models.Product.id.in_(product_ids)).all())
+    missing = [product_id for product_id in product_ids if product_id not in owners]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Products not found: {', '.join(map(str, missing))}")
+    not_owned = [product_id for product_id in product_ids if owners[product_id] != user.id]
+    if not_owned:
+        raise HTTPException(status_code=403, detail=f"You are not authorized to update products: {', '.join(map(str, not_owned))}")
+
+    updated = batch_update_products(db, batch.products, user.id)
+    db.commit()
+    for product_id in product_ids:
+        product_cache.delete(product_id)
+    product_feeds.invalidate()
+    dashboard_cache.invalidate(user.id, "products")
+
+    return {"status": "ok", "data": "Products updated successfully", "updated": updated}
+
+
+
+@product_router.put("/{id}", status_code=status.HTTP_200_OK, response_model=ProductResponse)
+async def update_product(db: db_dependency, id: int, product_update: ProductUpdate, request: Request, response: Response,
+                         user: Principal = Depends(get_current_principal)):
 
     """
     Update a product.
 
     This endpoint allows an authenticated business owner to update details of a specific product.
 
+    The product is updated by a single conditional UPDATE, restricted to the owner's businesses
+    and, when an If-Match header is given, to the product versions its entity tags name, so
+    concurrent edits never silently overwrite each other and no row lock is held. The response
+    carries the ETag of the new version, to send as If-Match with the next update.
+
     Args:
         db (Session): Database session dependency.
         id (int): The ID of the product to update.
         product_update (ProductUpdate): The updated product information.
-        user (UserIn): The current user, retrieved through dependency injection.
+        request (Request): The incoming request, read for the If-Match header.
+        response (Response): The outgoing response, used to set the ETag.
+        user (Principal): The current user, retrieved through dependency injection.
 
     Returns:
         dict: A response dict with status, a message, and the updated product data.
 
     Raises:
         HTTPException: If the user is not a business owner (403).
+        HTTPException: If the original price is not greater than 0 (400).
         HTTPException: If the product is not found (404).
         HTTPException: If the business associated with the product is not found (404).
         HTTPException: If the user is not the owner of the product's business (403).
-        HTTPException: If there is an error updating the database (500).
+        HTTPException: If the product changed since the version named by If-Match (412).
     """
     if user.role != UserRole.BUSINESS_OWNER:
         raise HTTPException(status_code=403, detail="Only business owners can update a product")
-    # Retrieve the product from the database
-    product = db.query(models.Product).filter_by(id=id).first()
-    if product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-
-    # Retrieve the associated business
-    business = db.query(models.Business).filter_by(id=product.business_id).first()
-    if business is None:
-        raise HTTPException(status_code=404, detail="Business not found for the product")
 
-    # Ensure that the user is the owner of the product's business
-    if user != business.owner:
-        raise HTTPException(
-            status_code=403, 
-            detail="You are not authorized to update this product"
-        )
+    if product_update.original_price <= 0:
+        raise HTTPException(status_code=400, detail="Original price cannot be 0")
 
-    product.name = product_update.name
-    if product_update.original_price > 0:
-        product.percentage_discount = ((product_update.original_price - product_update.new_price) / product_update.original_price) * 100
-    product.category = product_update.category
+    criteria = [
+        models.Product.id == id,
+        models.Product.deleted_at.is_(None),
+        models.Product.business_id.in_(
+            select(models.Business.id).where(models.Business.owner_id == user.id, models.Business.deleted_at.is_(None))),
+    ]
+    versions = if_match_versions(request, "product", id)
+    if versions is not None:
+        criteria.append(models.Product.version.in_(versions))
+
+    product = db.scalars(
+        update(models.Product).where(*criteria).values(
+            name=product_update.name,
+            category=product_update.category,
+            original_price=product_update.original_price,
+            new_price=product_update.new_price,
+            percentage_discount=calculate_percentage_discount(product_update.original_price, product_update.new_price),
+            offer_expiration_date=product_update.offer_expiration_date.date(),
+            quantity=product_update.quantity,
+            version=models.Product.version + 1,
+        ).returning(models.Product),
+        execution_options={"synchronize_session": False, "populate_existing": True},
+    ).first()
 
-    db.commit() 
+    if product is None:
+        # Nothing was updated, find out why
+        product = db.query(models.Product).filter_by(id=id).first()
+        if product is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        business = db.query(models.Business).filter_by(id=product.business_id).first()
+        if business is None:
+            raise HTTPException(status_code=404, detail="Business not found for the product")
+        if business.owner_id != user.id:
+            raise HTTPException(status_code=403, detail="You are not authorized to update this product")
+        raise precondition_failed("The product was modified since it was read")
+
+    serialized_product = product.serialize()
+    etag = make_version_etag("product", id, product.version)
+    db.commit()
+    product_cache.delete(id)
+    product_feeds.saved(product)
+    dashboard_cache.invalidate(user.id, "products")
+    set_validators(response, etag)
     return {
         "status": "ok", 
         "data": "Product updated successfully",
-        "product": product.serialize()
+        "product": serialized_product
         }
 
 
 
-@product_router.delete("/{id}", status_code=status.HTTP_200_OK)
-async def delete_product(db: db_dependency, id: int, user: UserIn = Depends(get_current_user)):
+@product_router.delete("/{id}", status_code=status.HTTP_200_OK, response_model=MessageResponse)
+async def delete_product(db: db_dependency, id: int, user: Principal = Depends(get_current_principal)):
 
     """
     Delete a product.
 
-    This endpoint allows an authenticated business owner to delete a specific product.
+    This endpoint allows an authenticated business owner to delete a specific product. The
+    product is soft deleted, so the orders placed on it keep their history.
 
     Args:
         db (Session): Database session dependency.
         id (int): The ID of the product to delete.
-        user (UserIn): The current user, retrieved through dependency injection.
+        user (Principal): The current user, retrieved through dependency injection.
 
     Returns:
         dict: A response dict with status and a message indicating the deletion success.
@@ -387,10 +694,12 @@ async def delete_product(db: db_dependency, id: int, user: UserIn = Depends(get_
     if business is None:
         raise HTTPException(status_code=404, detail="Business not found for the product")
 
-    owner = business.owner
-    if user == owner:
-        db.delete(product)  
+    if business.owner_id == user.id:
+        product.deleted_at = datetime.now()
         db.commit() 
+        product_cache.delete(id)
+        product_feeds.removed(id)
+        dashboard_cache.invalidate(user.id, "products")
         return {"status": "ok", "data": "Product deleted successfully"}
     else:
         raise HTTPException(
@@ -1,14 +1,18 @@
-from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.exc import SQLAlchemyError
+from typing import Annotated, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import EmailStr
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import Session
 import models
-from services.auth import get_current_user, get_hash_password 
-from schema.user import UserIn, UserRole, UserUpdate
-from services.user import is_email_exists, is_username_exists
+from services.auth import (Principal, get_current_principal, get_hash_password, revoke_tokens,
+                           too_many_requests)
+from schema.common import MessageResponse
+from schema.user import AvailabilityResponse, DashboardResponse, ProfileResponse, UserIn, UserUpdate
+from services.dashboard import build_dashboard, dashboard_cache
+from services.user import availability_limiter, find_taken, taken_identities
 from database import get_db
 from logger import logger
-from database import engine
 
 
 user_router = APIRouter(
@@ -19,16 +23,19 @@ user_router = APIRouter(
     # description="This router provides endpoints for user registration, login, profile update, and other user-related operations."
 )
 
-models.Base.metadata.create_all(bind=engine)
 db_dependency = Annotated[Session, Depends(get_db)]
 
 
 
-@user_router.post('/registration', status_code=status.HTTP_201_CREATED)
+@user_router.post('/registration', status_code=status.HTTP_201_CREATED, response_model=MessageResponse)
 async def user_registration(db: db_dependency, user: UserIn):
     """
     Registers a new user.
 
+    The username and email are checked in at most one query, skipped when the in-memory filters
+    show both are free, before the password is hashed. A registration racing another for the
+    same username or email is caught by the unique constraints.
+
     Parameters:
     - db (db_dependency): A dependency that provides a database session.
     - user (UserIn): A UserIn object containing the user's registration information.
@@ -42,24 +49,36 @@ async def user_registration(db: db_dependency, user: UserIn):
     - HTTPException with status code 400 and "Something went wrong. Please try again later" detail if a database error occurs.
     """
     try: 
+        username_taken, email_taken = find_taken(db, user.username, user.email)
+        if username_taken:
+            raise HTTPException(status_code=400, detail="Username already exists")
+        if email_taken:
+            raise HTTPException(status_code=400, detail="Email already exists")
+
         user_info = user.model_dump()
-        user_info["password"] = get_hash_password(user.password)
+        user_info["password"] = await run_in_threadpool(get_hash_password, user.password)
         user_info["role"] = user.role.value
 
         new_user = models.User(**user_info)
 
-        if is_username_exists(db, user.username):
-            raise HTTPException(status_code=400, detail="Username already exists")
-        if is_email_exists(db, user.email):
-            raise HTTPException(status_code=400, detail="Email already exists")
-        
         db.add(new_user)
         db.commit()
+        taken_identities.added(user.username, user.email)
 
         return {
                 "status": "ok",
-                "data": f"Hello {new_user.username}, Thanks for choosing our services. Please check your email inbox and click on the link to confirm your registration"
+                "data": f"Hello {user.username}, Thanks for choosing our services. Please check your email inbox and click on the link to confirm your registration"
             }
+    except IntegrityError as e:
+        db.rollback()
+        # Registered concurrently, read which of the two was taken
+        username_taken, email_taken = find_taken(db, user.username, user.email, precheck=False)
+        if username_taken:
+            raise HTTPException(status_code=400, detail="Username already exists")
+        if email_taken:
+            raise HTTPException(status_code=400, detail="Email already exists")
+        logger.error(f"Database error occurred: {e}")
+        raise HTTPException(status_code=400, detail="Something went wrong. Please try again later")
     except SQLAlchemyError as e:
         db.rollback()
         logger.error(f"Database error occurred: {e}")
@@ -68,11 +87,53 @@ async def user_registration(db: db_dependency, user: UserIn):
 
 
 
+@user_router.get('/availability', status_code=status.HTTP_200_OK, response_model=AvailabilityResponse,
+                 response_model_exclude_none=True)
+async def check_availability(db: db_dependency, request: Request,
+                             username: Optional[str] = Query(None, description="Username to check"),
+                             email: Optional[EmailStr] = Query(None, description="Email to check")):
+    """
+    Checks whether a username and/or an email are still available, for live signup forms.
+
+    Names missing from the in-memory filters are answered without a query, the others with a
+    single one. The answer is advisory, registration re-checks it.
+
+    Parameters:
+    - db (db_dependency): A dependency that provides a database session.
+    - request (Request): The HTTP request, read for the client IP.
+    - username (Optional[str]): The username to check.
+    - email (Optional[EmailStr]): The email to check.
+
+    Returns:
+    - A dictionary with, for each of the given username and email, whether it is available.
+
+    Raises:
+    - HTTPException with status code 400 if neither a username nor an email is given.
+    - HTTPException with status code 429 if the client checks too often.
+    """
+    if username is None and email is None:
+        raise HTTPException(status_code=400, detail="Give a username or an email to check")
+
+    wait = availability_limiter.hit(request.client.host if request.client else "unknown")
+    if wait:
+        raise too_many_requests("Too many availability checks, please try again later", wait)
+
+    username_taken, email_taken = find_taken(db, username, email)
+
+    return {
+        "status": "ok",
+        "data": {
+            "username": None if username is None else not username_taken,
+            "email": None if email is None else not email_taken,
+        }
+    }
+
+
 
-@user_router.post('/me', status_code=status.HTTP_201_CREATED)
+
+@user_router.post('/me', status_code=status.HTTP_201_CREATED, response_model=Optional[DashboardResponse])
 async def user_login(
-    db: db_dependency,
-    user: UserIn = Depends(get_current_user),
+    user: Principal = Depends(get_current_principal),
     business_page: int = Query(1, description="Page number for businesses", gt=0),
     business_page_size: int = Query(10, description="Number of businesses per page", gt=0),
     product_page: int = Query(1, description="Page number for products", gt=0),
@@ -83,9 +144,11 @@ async def user_login(
     """
     Retrieves user's profile along with their businesses, products, and orders.
 
+    The profile, businesses, products and orders are independent sections, loaded concurrently
+    on separate connections and cached per user until a write changes them.
+
     Parameters:
-    - db (db_dependency): A dependency that provides a database session.
-    - user (UserIn): A UserIn object containing the user's login information.
+    - user (Principal): The current user, retrieved from the access token.
     - business_page (int): The page number for businesses.
     - business_page_size (int): The number of businesses per page.
     - product_page (int): The page number for products.
@@ -102,100 +165,27 @@ async def user_login(
     if user is None:
         raise HTTPException(status_code=401, detail="Unauthorized, please login")
 
-    if user.role == UserRole.BUSINESS_OWNER:
-        # Calculate the offset for businesses
-        business_offset = (business_page - 1) * business_page_size
-
-        # Retrieve businesses associated with the user with pagination
-        businesses = db.query(models.Business).filter(models.Business.owner_id == user.id).offset(business_offset).limit(business_page_size).all()
-
-        business_data = []
-        for business in businesses:
-            # Calculate the offset for products
-            product_offset = (product_page - 1) * product_page_size
-
-            # Retrieve products associated with the business with pagination
-            products = db.query(models.Product).filter(models.Product.business_id == business.id).offset(product_offset).limit(product_page_size).all()
-
-            business_details = {
-                "business_id": business.id,
-                "business_name": business.business_name,
-                "city": business.city,
-                "region": business.region,
-                "business_description": business.business_description,
-                "logo": "localhost:8000/static/images/" + business.logo,
-            }
-
-            serialized_products = [product.serialize() for product in products]
-
-            business_data.append({
-                "business_details": business_details,
-                "products": serialized_products
-            })
-
-        user_details = {
-            "user_id": user.id,
-            "username": user.username,
-            "email": user.email,
-            "verified": user.is_verified,
-            "joined_date": user.join_date.strftime("%b %d %Y %H:%M:%S") if user.join_date else None,
-        }
-
-        return {
-            "status": "ok",
-            "data": {
-                "user_details": user_details,
-                "businesses": business_data
-            }
-        }
-
-    elif user.role == UserRole.CUSTOMER:
-        # Calculate the offset for orders
-        order_offset = (order_page - 1) * order_page_size
-
-        # Retrieve orders associated with the user with pagination
-        orders = db.query(models.Order).filter(models.Order.user_id == user.id).offset(order_offset).limit(order_page_size).all()
+    dashboard = await build_dashboard(user.id, user.role, business_page, business_page_size,
+                                      product_page, product_page_size, order_page, order_page_size)
+    if dashboard is None:
+        return None
 
-        user_details = {
-            "user_id": user.id,
-            "username": user.username,
-            "email": user.email,
-            "verified": user.is_verified,
-            "joined_date": user.join_date.strftime("%b %d %Y %H:%M:%S") if user.join_date else None,
-        }
-
-        if orders:
-            serialized_orders = [order.serialize() for order in orders]
-            return {
-                "status": "ok",
-                "data": {
-                    "user_details": user_details,
-                    "orders": serialized_orders
-                }
-            }
-        else:
-            return {
-                "status": "ok",
-                "data": {
-                    "user_details": user_details,
-                    "orders": []
-                }
-            }
+    return {"status": "ok", "data": dashboard}
 
 
 
 
 
-@user_router.put('/', status_code=status.HTTP_200_OK)
+@user_router.put('/', status_code=status.HTTP_200_OK, response_model=ProfileResponse)
 async def update_profile(db: db_dependency, user_update: UserUpdate, 
-                         user: UserIn = Depends(get_current_user)):
+                         user: Principal = Depends(get_current_principal)):
     """
-    Updates the profile of the currently authenticated user.
+    Updates the profile of the currently authenticated user. Changing the password revokes every token issued before.
    
     Parameters:
     - db (db_dependency): A dependency that provides a database session.
     - user_update (UserUpdate): A UserUpdate object containing the updated user information.
-    - user (UserIn): A UserIn object containing the user's login information.
+    - user (Principal): The current user, retrieved from the access token.
 
     Returns:
     - A dictionary containing a success message and the updated user's information.
@@ -212,10 +202,14 @@ async def update_profile(db: db_dependency, user_update: UserUpdate,
 
         if user_update.username:
             db_user.username = user_update.username
+            taken_identities.added(username=user_update.username)
         if user_update.password:
             db_user.password = get_hash_password(user_update.password)
+            # Tokens issued before the password change stop working
+            revoke_tokens(db_user)
 
         db.commit()
+        dashboard_cache.invalidate(user.id, "user")
 
         db.refresh(db_user)
 
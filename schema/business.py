@@ -1,9 +1,41 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
+from schema.product import ProductOut
 
 
 class BusinessIn(BaseModel):
     business_name: str
     city: str = 'Unspecified'
     region: str = 'Unspecified'
-    business_description: Optional[str] = None
\ No newline at end of file
+    business_description: Optional[str] = None
+
+
+class BusinessOut(BaseModel):
+    business_id: int
+    business_name: str
+    city: str
+    region: str
+    business_description: Optional[str] = None
+
+
+class BusinessProducts(BaseModel):
+    business: BusinessOut
+    products: List[ProductOut]
+
+
+class BusinessResponse(BaseModel):
+    status: str
+    data: str
+    business: BusinessOut
+
+
+class BusinessListResponse(BaseModel):
+    status: str
+    data: List[BusinessProducts]
+
+
+class DefaultBusinessResponse(BaseModel):
+    status: str
+    data: BusinessProducts
+    # Pass as ?cursor= to get the next page, None on the last page
+    next_cursor: Optional[str] = None
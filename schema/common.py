@@ -0,0 +1,48 @@
+from enum import Enum
+from typing import Dict
+from pydantic import BaseModel
+
+
+class FileFormat(str, Enum):
+    csv = 'csv'
+    ndjson = 'ndjson'
+
+
+class ImportMode(str, Enum):
+    # New products, or changes to existing ones like a batch update
+    create = 'create'
+    update = 'update'
+
+
+class WelcomeResponse(BaseModel):
+    message: str
+
+
+class MessageResponse(BaseModel):
+    status: str
+    data: str
+
+
+class StatusMessageResponse(BaseModel):
+    status: str
+    message: str
+
+
+class FileUploadResponse(BaseModel):
+    status: str
+    data: str
+    file_url: str
+
+
+class CompressionMetrics(BaseModel):
+    compressed_responses: int
+    skipped_responses: int
+    bytes_in: int
+    bytes_out: int
+    compression_ratio: float
+    by_encoding: Dict[str, int]
+
+
+class CompressionMetricsResponse(BaseModel):
+    status: str
+    data: CompressionMetrics
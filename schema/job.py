@@ -0,0 +1,35 @@
+from datetime import datetime
+from enum import Enum
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class JobStatus(str, Enum):
+    pending = 'pending'
+    running = 'running'
+    completed = 'completed'
+    failed = 'failed'
+
+
+class JobError(BaseModel):
+    row: int
+    errors: List[str]
+
+
+class JobOut(BaseModel):
+    job_id: str
+    kind: str
+    status: JobStatus
+    processed: int
+    succeeded: int
+    failed: int
+    errors: List[JobError]
+    message: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
+class JobResponse(BaseModel):
+    status: str
+    data: str
+    job: JobOut
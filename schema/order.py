@@ -1,8 +1,8 @@
 from datetime import datetime
 from enum import Enum
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class OrderStatus(str, Enum):
@@ -19,8 +19,48 @@ class OrderBase(BaseModel):
 
 class OrderIn(OrderBase):
     order_date: datetime
+    # A reservation of the product by the customer, its held stock is used for the order
+    reservation_id: Optional[str] = None
     # total_price: float
     # status: OrderStatus = OrderStatus.pending
 
 class OrderUpdate(BaseModel):
-    quantity: int
\ No newline at end of file
+    quantity: int
+
+class OrderOut(BaseModel):
+    # Every field is optional so sparse fieldsets (?fields=) validate
+    id: Optional[int] = None
+    product_id: Optional[int] = None
+    user_id: Optional[int] = None
+    quantity: Optional[int] = None
+    order_date: Optional[datetime] = None
+    total_price: Optional[float] = None
+    status: Optional[OrderStatus] = None
+
+
+class OrderResponse(BaseModel):
+    status: str
+    data: str
+    order: OrderOut
+
+
+class OrderListResponse(BaseModel):
+    status: str
+    data: List[OrderOut]
+
+
+class ReservationIn(BaseModel):
+    product_id: int
+    quantity: int = Field(1, gt=0)
+
+
+class ReservationOut(BaseModel):
+    reservation_id: str
+    product_id: int
+    quantity: int
+    expires_at: datetime
+
+
+class ReservationResponse(BaseModel):
+    status: str
+    data: ReservationOut
@@ -1,6 +1,6 @@
-from datetime import datetime
-from typing import Optional
-from pydantic import BaseModel
+from datetime import date, datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field
 
 
 class ProductIn(BaseModel):
@@ -20,3 +20,75 @@ class ProductUpdate(BaseModel):
     new_price: float
     offer_expiration_date: datetime
     quantity: int
+
+
+class ProductBatchItem(BaseModel):
+    # Omitted fields keep their current value
+    product_id: int
+    original_price: Optional[float] = Field(None, gt=0)
+    new_price: Optional[float] = Field(None, ge=0)
+    quantity: Optional[int] = Field(None, ge=0)
+    offer_expiration_date: Optional[datetime] = None
+
+
+class ProductBatchUpdate(BaseModel):
+    # Larger jobs go through the product import, which streams its file
+    products: List[ProductBatchItem] = Field(..., min_length=1, max_length=1000)
+
+
+class ProductOut(BaseModel):
+    # Every field is optional so sparse fieldsets (?fields=) validate
+    product_id: Optional[int] = None
+    name: Optional[str] = None
+    category: Optional[str] = None
+    new_price: Optional[float] = None
+    percentage_discount: Optional[float] = None
+    offer_expiration_date: Optional[date] = None
+    product_image: Optional[str] = None
+    date_published: Optional[date] = None
+    quantity: Optional[int] = None
+
+
+class ProductResponse(BaseModel):
+    status: str
+    data: str
+    product: ProductOut
+
+
+class ProductListResponse(BaseModel):
+    status: str
+    data: List[ProductOut]
+
+
+class ProductBatchResponse(BaseModel):
+    status: str
+    data: str
+    updated: int
+
+
+class BusinessDetails(BaseModel):
+    name: str
+    city: str
+    region: str
+    description: Optional[str] = None
+    logo: str
+    business_id: int
+    owner_id: Optional[int] = None
+    email: Optional[str] = None
+    join_date: Optional[str] = None
+
+
+class ProductDetailResponse(BaseModel):
+    status: str
+    data: ProductOut
+    business_details: Optional[BusinessDetails] = None
+
+
+class ProductWithBusiness(ProductOut):
+    business_details: Optional[BusinessDetails] = None
+
+
+class ProductLookupResponse(BaseModel):
+    status: str
+    data: List[ProductWithBusiness]
+    missing: List[int]
@@ -1,13 +1,12 @@
+from datetime import datetime
 from enum import Enum
 import re
-from typing import Optional
-from pydantic import BaseModel, EmailStr, Field, validator
-from database import SessionLocal
+from typing import List, Optional, Union
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, validator
+from schema.order import OrderOut
+from schema.product import ProductOut
 
 
-
-session = SessionLocal()
-
 class UserRole(str, Enum):
     BUSINESS_OWNER = "business_owner"
     CUSTOMER = "customer"
@@ -124,11 +123,65 @@ class UserUpdate(BaseModel):
 
 
 
+class Availability(BaseModel):
+    username: Optional[bool] = None
+    email: Optional[bool] = None
+
+
+class AvailabilityResponse(BaseModel):
+    status: str
+    data: Availability
+
+
+class UserOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    username: str
+    email: str
+    is_verified: Optional[bool] = None
+    join_date: Optional[datetime] = None
+    role: UserRole
+
+
+class ProfileResponse(BaseModel):
+    status: str
+    data: str
+    user: UserOut
+
+
+class UserDetails(BaseModel):
+    user_id: int
+    username: str
+    email: str
+    verified: Optional[bool] = None
+    joined_date: Optional[str] = None
+
+
+class DashboardBusinessDetails(BaseModel):
+    business_id: int
+    business_name: str
+    city: str
+    region: str
+    business_description: Optional[str] = None
+    logo: str
 
 
+class DashboardBusiness(BaseModel):
+    business_details: DashboardBusinessDetails
+    products: List[ProductOut]
 
 
+class BusinessOwnerDashboard(BaseModel):
+    user_details: UserDetails
+    businesses: List[DashboardBusiness]
 
 
+class CustomerDashboard(BaseModel):
+    user_details: UserDetails
+    orders: List[OrderOut]
 
 
+class DashboardResponse(BaseModel):
+    status: str
+    data: Union[BusinessOwnerDashboard, CustomerDashboard]
@@ -1,5 +1,13 @@
+import math
+import os
+import secrets
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from passlib.context import CryptContext
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import Annotated, List
 from dotenv import dotenv_values
@@ -9,6 +17,10 @@ import jwt
 from database import get_db
 import models
 from logger import logger
+from schema.user import UserRole
+from services.cache import TTLCache
+from services.ratelimit import RateLimiter, make_bucket_store
+from services.revocation import revocation_list
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
 
@@ -18,12 +30,93 @@ config_credentials = dotenv_values(".env")
 
 oath2_scheme = OAuth2PasswordBearer(tokenUrl='/auth/token')
 
+# Lifetime of an access token, kept short since a stolen one can only be revoked by its jti
+ACCESS_TOKEN_EXPIRE_MINUTES = int(config_credentials.get("ACCESS_TOKEN_EXPIRE_MINUTES") or 15)
+# Lifetime of a refresh token, which is exchanged for a new pair of tokens
+REFRESH_TOKEN_EXPIRE_DAYS = int(config_credentials.get("REFRESH_TOKEN_EXPIRE_DAYS") or 14)
+
+# Where the login buckets are kept: "memory", per worker, or "database", shared by the workers
+login_rate_store = make_bucket_store(config_credentials.get("LOGIN_RATE_STORE"))
+# Login attempts allowed per client IP and per username: a burst, then one every few seconds
+login_ip_limiter = RateLimiter(rate=float(config_credentials.get("LOGIN_RATE_PER_IP") or 1), burst=20,
+                               store=login_rate_store, prefix="login-ip:")
+login_username_limiter = RateLimiter(rate=float(config_credentials.get("LOGIN_RATE_PER_USERNAME") or 0.2), burst=5,
+                                     store=login_rate_store, prefix="login-username:")
+# Seconds between two purges of the idle login buckets
+LOGIN_BUCKET_PURGE_INTERVAL = 60
+# Password verifications running at once in the worker, bcrypt is CPU bound
+MAX_CONCURRENT_PASSWORD_CHECKS = int(config_credentials.get("MAX_CONCURRENT_PASSWORD_CHECKS") or os.cpu_count() or 4)
+password_checks = threading.BoundedSemaphore(MAX_CONCURRENT_PASSWORD_CHECKS)
+
+# Current token version of each user, tokens carrying an older version are revoked.
+# Revocations made in another worker are seen once its entry expires.
+token_versions = TTLCache(maxsize=100_000, ttl=60)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    The authenticated user as described by their access token, without loading the user row.
+    """
+    id: int
+    username: str
+    role: UserRole
+    token_version: int
+    # The access token's jti and expiry, to revoke it
+    token_id: str
+    expires_at: int
+
+
+def too_many_requests(detail: str, retry_after: float):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def check_login_rate(client_ip: str, username: str):
+    """
+    Count a login attempt against the limits of its client IP, then of the username.
+
+    An attempt refused for its IP is not counted against the username, so a throttled client
+    cannot keep draining the attempts of a username and lock its owner out.
+
+    Raises:
+        HTTPException: If either limit is exceeded (429), before any password is hashed.
+    """
+    wait = login_ip_limiter.hit(client_ip) or login_username_limiter.hit(username.lower())
+    if wait:
+        raise too_many_requests("Too many login attempts, please try again later", wait)
+
+
+def purge_login_buckets() -> int:
+    """Scheduled task dropping the login buckets idle long enough to be full again. Returns their number."""
+    return login_rate_store.purge(max(login_ip_limiter.refill_time, login_username_limiter.refill_time))
+
 
 async def authenticate_user(db: db_dependency, username, password):
+    """
+    Return the user if the password matches, False otherwise.
+
+    The password is verified in the threadpool so bcrypt does not block the event loop, and
+    only while fewer than MAX_CONCURRENT_PASSWORD_CHECKS verifications are running.
+
+    Raises:
+        HTTPException: If the worker is already verifying as many passwords as allowed (429).
+    """
     user = db.query(User).filter(User.username == username).first()
-    if user and verify_password(password, user.password):
-        return user
-    return False
+    if not user:
+        return False
+
+    if not password_checks.acquire(blocking=False):
+        raise too_many_requests("Too many login attempts in progress, please try again later", 1)
+    try:
+        verified = await run_in_threadpool(verify_password, password, user.password)
+    finally:
+        password_checks.release()
+
+    return user if verified else False
 
 
 async def token_generator(db: db_dependency, username: str, password: str):
@@ -35,38 +128,203 @@ async def token_generator(db: db_dependency, username: str, password: str):
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    token_data = {
+    return issue_tokens(user)
+
+
+def issue_tokens(user: User) -> dict:
+    """
+    Issue a short-lived access token and a refresh token to a user.
+
+    Both carry the user's token version and a random jti, by which either can be revoked.
+
+    Args:
+        user (User): The user.
+
+    Returns:
+        dict: The access and refresh tokens, the token type and the access token's lifetime in seconds.
+    """
+    issued_at = datetime.now(timezone.utc)
+    access_token = encode_token({
+        "id": user.id,
+        "username": user.username,
+        "role": user.role.value,
+        "ver": user.token_version,
+        "type": "access",
+        "jti": secrets.token_hex(16),
+        "iat": issued_at,
+        "exp": issued_at + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    })
+    refresh_token = encode_token({
         "id": user.id,
-        "username": user.username
+        "ver": user.token_version,
+        "type": "refresh",
+        "jti": secrets.token_hex(16),
+        "iat": issued_at,
+        "exp": issued_at + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    })
+    token_versions.set(user.id, user.token_version)
+
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
     }
 
-    token = jwt.encode(token_data, config_credentials['SECRET'])
 
-    return token
+def decode_refresh_token(refresh_token: str) -> dict:
+    """
+    Decode a refresh token.
+
+    Raises:
+        HTTPException: If the token is expired, invalid or not a refresh token (401).
+    """
+    try:
+        payload = decode_token(refresh_token)
+        if payload.get("type") != "refresh" or "jti" not in payload or "id" not in payload:
+            raise jwt.exceptions.InvalidTokenError()
+    except jwt.exceptions.ExpiredSignatureError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
+    except jwt.exceptions.InvalidTokenError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    return payload
+
+
+def revoke_token(db: Session, payload: dict):
+    """
+    Revoke one token by its jti, the caller commits.
+
+    Args:
+        db (Session): The caller's database session.
+        payload (dict): The token's claims.
+    """
+    revocation_list.revoke(db, payload["jti"], datetime.fromtimestamp(payload["exp"]))
+
+
+def refresh_tokens(db: Session, refresh_token: str) -> dict:
+    """
+    Exchange a refresh token for a new pair of tokens, the refresh token is revoked.
+
+    The revocation is inserted before the new tokens are issued, so of concurrent requests
+    with the same refresh token only one succeeds.
+
+    Raises:
+        HTTPException: If the refresh token is invalid, expired or revoked, or the user no longer exists (401).
+    """
+    payload = decode_refresh_token(refresh_token)
+    if revocation_list.is_revoked(db, payload["jti"]):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
 
+    user = db.query(User).filter(User.id == payload["id"]).first()
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    if user.token_version != payload["ver"]:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
 
-async def get_current_user(db: db_dependency, token: str = Depends(oath2_scheme)):
+    db.add(models.RevokedToken(jti=payload["jti"], expires_at=datetime.fromtimestamp(payload["exp"])))
     try:
-        payload = jwt.decode(token, config_credentials['SECRET'], algorithms=['HS256'])
-        user = db.query(User).filter(User.id == payload.get("id")).first()
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
+    revocation_list.revoked(payload["jti"])
 
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+    return issue_tokens(user)
 
-    except jwt.exceptions.DecodeError:
+
+def get_token_version(db: Session, user_id: int):
+    """
+    Return the current token version of a user, None if the user does not exist.
+
+    Args:
+        db (Session): Database session, only used when the version is not cached.
+        user_id (int): The ID of the user.
+    """
+    version = token_versions.get(user_id)
+    if version is None:
+        version = db.query(User.token_version).filter(User.id == user_id).scalar()
+        if version is not None:
+            token_versions.set(user_id, version)
+    return version
+
+
+def revoke_tokens(user: User):
+    """
+    Revoke every token issued to a user so far, the caller commits.
+
+    Args:
+        user (User): The user, loaded in the caller's session.
+    """
+    user.token_version += 1
+    token_versions.delete(user.id)
+
+
+async def get_current_principal(db: db_dependency, token: str = Depends(oath2_scheme)) -> Principal:
+    """
+    Authenticate a request from its access token alone.
+
+    The role and identity come from the token's claims. The token's jti is checked against
+    the in-memory revocation filter and its version against the user's current one, which is
+    cached, so a request costs no database read in the common case while revoked tokens are
+    still rejected.
+
+    Raises:
+        HTTPException: If the token is invalid, expired or revoked, or the user no longer exists (401).
+    """
+    try:
+        payload = decode_token(token)
+        if payload.get("type") != "access":
+            raise jwt.exceptions.InvalidTokenError()
+        principal = Principal(id=payload["id"], username=payload["username"],
+                              role=UserRole(payload["role"]), token_version=payload["ver"],
+                              token_id=payload["jti"], expires_at=payload["exp"])
+    except jwt.exceptions.ExpiredSignatureError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token expired",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    except (jwt.exceptions.InvalidTokenError, KeyError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except Exception as e:
+
+    if revocation_list.is_revoked(db, principal.token_id):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    current_version = get_token_version(db, principal.id)
+    if current_version is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Authentication error",
+            detail="User not found",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if current_version != principal.token_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return principal
+
+
+async def get_current_user(db: db_dependency, principal: Principal = Depends(get_current_principal)):
+    """
+    Authenticate a request and load the full user row, for endpoints that need more than the token's claims.
+    """
+    user = db.query(User).filter(User.id == principal.id).first()
+
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
@@ -74,6 +332,12 @@ async def get_current_user(db: db_dependency, token: str = Depends(oath2_scheme)
 
 
 
+def encode_token(token_data: dict) -> str:
+    return jwt.encode(token_data, config_credentials['SECRET'], algorithm='HS256')
+
+def decode_token(token: str) -> dict:
+    return jwt.decode(token, config_credentials['SECRET'], algorithms=['HS256'])
+
 def get_hash_password(password):
     return pwd_context.hash(password)
 
@@ -83,8 +347,7 @@ def verify_password(plain_password, hashed_password):
 
 async def very_token(db: db_dependency, token: str):
     try:
-        payload = jwt.decode(token, config_credentials["SECRET"],
-                            algorithms=['HS256'])
+        payload = decode_token(token)
         user = db.query(models.User).filter(models.User.id == payload.get("id")).first()
 
     except:
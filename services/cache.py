@@ -0,0 +1,66 @@
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    A small thread-safe LRU cache whose entries expire after `ttl` seconds.
+
+    The cache is per worker process, so entries are only invalidated by writes
+    made in the same worker; the TTL bounds how stale other workers can get.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, early_refresh: float = 0):
+        """
+        Return the cached value of `key`, or `default` if it is missing or expired.
+
+        With `early_refresh` (XFetch's beta, 1 is a good default) an entry is also reported
+        missing shortly before it expires, with a probability growing as expiry nears and with
+        the time its value took to compute. One of many concurrent readers then refreshes a hot
+        entry ahead of time while the others keep reading it, instead of all of them missing
+        together when it expires.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at, delta = entry
+            now = time.monotonic()
+            if expires_at <= now:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+        if early_refresh and now - delta * early_refresh * math.log(1.0 - random.random()) >= expires_at:
+            return default
+        return value
+
+    def set(self, key, value, ttl: float = None, delta: float = 0):
+        """
+        Cache `value` for `ttl` seconds, `delta` is how long it took to compute, in seconds.
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at, delta)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
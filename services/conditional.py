@@ -0,0 +1,97 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Set
+from fastapi import HTTPException, Request, Response, status
+
+
+def make_etag(*parts) -> str:
+    """
+    Build a strong entity tag from the values that identify a representation,
+    e.g. the resource id, its version counters and the requested fields.
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def version_token(kind: str, id: int, version: int) -> str:
+    # Binds a version counter to one resource, so a tag cannot pass for another resource's
+    digest = hashlib.blake2b(repr((kind, id, version)).encode(), digest_size=8).hexdigest()
+    return f"{version}-{digest}"
+
+
+def make_version_etag(kind: str, id: int, version: int, *parts) -> str:
+    """
+    Build a strong entity tag of a single row's representation, led by a token of the row's
+    version that an If-Match precondition on a write to the row is checked against. Further
+    parts, e.g. the requested fields, tell the representations of the same version apart.
+    """
+    token = version_token(kind, id, version)
+    if parts:
+        token += "." + hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    return f'"{token}"'
+
+
+def if_match_versions(request: Request, kind: str, id: int) -> Optional[Set[int]]:
+    """
+    Read the versions of a row an If-Match precondition accepts, None when any version is accepted.
+    Only the tags made by make_version_etag for this row match, weak tags never do.
+    """
+    if_match = request.headers.get("if-match")
+    if if_match is None:
+        return None
+    tags = [tag.strip() for tag in if_match.split(",")]
+    if "*" in tags:
+        return None
+    versions = set()
+    for tag in tags:
+        if not (len(tag) > 1 and tag.startswith('"') and tag.endswith('"')):
+            continue
+        token = tag[1:-1].split(".", 1)[0]
+        version = token.partition("-")[0]
+        if version.isdigit() and token == version_token(kind, id, int(version)):
+            versions.add(int(version))
+    return versions
+
+
+def precondition_failed(detail: str = "The resource was modified since it was read"):
+    return HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=detail)
+
+
+def http_date(value: datetime) -> str:
+    # Naive datetimes are stored in the server's local time
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    Evaluate If-None-Match and, when it is absent, If-Modified-Since against the current validators.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.astimezone(timezone.utc).replace(microsecond=0) <= since
+
+    return False
+
+
+def set_validators(response: Response, etag: str, last_modified: Optional[datetime] = None):
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = http_date(last_modified)
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag, last_modified)
+    return response
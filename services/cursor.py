@@ -0,0 +1,37 @@
+import base64
+from typing import Optional
+from fastapi import HTTPException, status
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    Encode the id of the last row of a page into an opaque cursor for the next page.
+
+    Args:
+        last_id (int): The id of the last row returned.
+
+    Returns:
+        str: A URL-safe cursor.
+    """
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    """
+    Decode a cursor into the id the next page starts after.
+
+    Args:
+        cursor (Optional[str]): A cursor from a previous page, None for the first page.
+
+    Returns:
+        Optional[int]: The id to continue after, or None for the first page.
+
+    Raises:
+        HTTPException: If the cursor is malformed (400).
+    """
+    if not cursor:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
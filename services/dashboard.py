@@ -0,0 +1,186 @@
+import asyncio
+from collections import OrderedDict
+from typing import Callable, Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+import models
+from database import SessionLocal
+from schema.user import UserRole
+from services.cache import TTLCache
+
+
+# Seconds a dashboard section is cached, bounds the staleness of writes made in other workers
+DASHBOARD_TTL = 30
+# Pages kept per cached section, the least recently used is dropped past it
+DASHBOARD_PAGES_PER_SECTION = 4
+
+
+class DashboardCache:
+    """
+    The sections of the users' dashboards, cached per user and section.
+
+    Each (user, section) entry holds the section for the few pages last requested, so a write
+    invalidates all pages of the section at once and varying the query parameters cannot grow
+    an entry past `pages_per_section`.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = DASHBOARD_TTL,
+                 pages_per_section: int = DASHBOARD_PAGES_PER_SECTION):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.pages_per_section = pages_per_section
+
+    def get(self, user_id: int, section: str, key):
+        pages = self._cache.get((user_id, section))
+        if pages is None or key not in pages:
+            return None
+        pages.move_to_end(key)
+        return pages[key]
+
+    def set(self, user_id: int, section: str, key, value):
+        pages = self._cache.get((user_id, section))
+        if pages is None:
+            pages = OrderedDict()
+            self._cache.set((user_id, section), pages)
+        pages[key] = value
+        pages.move_to_end(key)
+        while len(pages) > self.pages_per_section:
+            pages.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[int], *sections: str):
+        """Drop the given sections of a user's dashboard, every section when none is given."""
+        if user_id is None:
+            return
+        for section in sections or ("user", "businesses", "products", "orders"):
+            self._cache.delete((user_id, section))
+
+    def clear(self):
+        """Drop every dashboard, after writes touching many users."""
+        self._cache.clear()
+
+
+dashboard_cache = DashboardCache()
+
+
+def load_user_details(user_id: int) -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        if user is None:
+            return None
+        return {
+            "user_id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "verified": user.is_verified,
+            "joined_date": user.join_date.strftime("%b %d %Y %H:%M:%S") if user.join_date else None,
+        }
+    finally:
+        db.close()
+
+
+def business_page(owner_id: int, offset: int, limit: int):
+    return select(models.Business.id).where(models.Business.owner_id == owner_id)\
+        .order_by(models.Business.id).offset(offset).limit(limit)
+
+
+def load_businesses(owner_id: int, offset: int, limit: int) -> list:
+    db = SessionLocal()
+    try:
+        businesses = db.query(models.Business).filter(models.Business.id.in_(business_page(owner_id, offset, limit)))\
+            .order_by(models.Business.id).all()
+        return [{
+            "business_id": business.id,
+            "business_name": business.business_name,
+            "city": business.city,
+            "region": business.region,
+            "business_description": business.business_description,
+            "logo": "localhost:8000/static/images/" + business.logo,
+        } for business in businesses]
+    finally:
+        db.close()
+
+
+def load_business_products(owner_id: int, business_offset: int, business_limit: int,
+                           offset: int, limit: int) -> dict:
+    """
+    Load a page of the products of each business in a page of an owner's businesses, in one
+    query ranking the products of each business. Returns {business id: serialized products}.
+    """
+    db = SessionLocal()
+    try:
+        ranked = select(models.Product.id, func.row_number().over(
+            partition_by=models.Product.business_id, order_by=models.Product.id).label("position"))\
+            .where(models.Product.business_id.in_(business_page(owner_id, business_offset, business_limit)))\
+            .subquery()
+        products = db.query(models.Product).join(ranked, models.Product.id == ranked.c.id)\
+            .filter(ranked.c.position > offset, ranked.c.position <= offset + limit)\
+            .order_by(models.Product.business_id, models.Product.id).all()
+        products_by_business = {}
+        for product in products:
+            products_by_business.setdefault(product.business_id, []).append(product.serialize())
+        return products_by_business
+    finally:
+        db.close()
+
+
+def load_orders(user_id: int, offset: int, limit: int) -> list:
+    db = SessionLocal()
+    try:
+        orders = db.query(models.Order).filter(models.Order.user_id == user_id)\
+            .order_by(models.Order.id).offset(offset).limit(limit).all()
+        return [order.serialize() for order in orders]
+    finally:
+        db.close()
+
+
+async def load_section(user_id: int, section: str, loader: Callable, *args):
+    """Return a cached dashboard section, or load it in the threadpool with its own session."""
+    value = dashboard_cache.get(user_id, section, args)
+    if value is None:
+        value = await run_in_threadpool(loader, *args)
+        if value is not None:
+            dashboard_cache.set(user_id, section, args, value)
+    return value
+
+
+async def build_dashboard(user_id: int, role: UserRole, business_page: int, business_page_size: int,
+                          product_page: int, product_page_size: int,
+                          order_page: int, order_page_size: int) -> Optional[dict]:
+    """
+    Assemble a user's dashboard from its sections, loaded concurrently on separate connections.
+
+    Returns:
+        Optional[dict]: The dashboard, None if the user does not exist or is an admin.
+    """
+    if role == UserRole.BUSINESS_OWNER:
+        business_offset = (business_page - 1) * business_page_size
+        product_offset = (product_page - 1) * product_page_size
+        user_details, businesses, products = await asyncio.gather(
+            load_section(user_id, "user", load_user_details, user_id),
+            load_section(user_id, "businesses", load_businesses, user_id, business_offset, business_page_size),
+            load_section(user_id, "products", load_business_products, user_id, business_offset,
+                         business_page_size, product_offset, product_page_size),
+        )
+        if user_details is None:
+            return None
+        return {
+            "user_details": user_details,
+            "businesses": [{
+                "business_details": business,
+                "products": products.get(business["business_id"], [])
+            } for business in businesses]
+        }
+
+    if role == UserRole.CUSTOMER:
+        user_details, orders = await asyncio.gather(
+            load_section(user_id, "user", load_user_details, user_id),
+            load_section(user_id, "orders", load_orders, user_id, (order_page - 1) * order_page_size, order_page_size),
+        )
+        if user_details is None:
+            return None
+        return {
+            "user_details": user_details,
+            "orders": orders
+        }
+
+    return None
@@ -0,0 +1,212 @@
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from sqlalchemy import Table, delete, exists, insert, select, update
+from sqlalchemy.orm import Session
+import models
+from database import SessionLocal
+from logger import logger
+from schema.job import JobStatus
+from services.auth import token_versions
+from services.dashboard import dashboard_cache
+from services.feeds import product_feeds
+from services.jobs import finish_job, record_job_progress
+from services.product import product_cache
+
+
+# Rows deleted per statement and transaction, bounds the locks held and the memory used
+DELETE_CHUNK_SIZE = 1000
+# Days a soft-deleted row stays in its table before compaction archives it
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+# Seconds between two compactions
+COMPACTION_INTERVAL = int(os.getenv("COMPACTION_INTERVAL", "3600"))
+
+
+def delete_in_chunks(db: Session, job: models.Job, model, criterion, chunk_size: int = DELETE_CHUNK_SIZE) -> int:
+    """
+    Delete the rows of a table matching a criterion, soft-deleted ones included, by chunks of
+    primary keys, committing each chunk.
+
+    No row is loaded into the session, each chunk is one indexed SELECT of ids and one DELETE.
+
+    Args:
+        db (Session): Database session.
+        job (models.Job): The running job, its counters are updated with each chunk.
+        model: The mapped class of the table.
+        criterion: The rows to delete.
+        chunk_size (int): Rows deleted per chunk.
+
+    Returns:
+        int: Number of rows deleted.
+    """
+    deleted = 0
+    while True:
+        ids = db.scalars(select(model.id).where(criterion).limit(chunk_size)
+                         .execution_options(include_deleted=True)).all()
+        if not ids:
+            return deleted
+        db.execute(delete(model).where(model.id.in_(ids)))
+        record_job_progress(job, processed=len(ids), succeeded=len(ids))
+        db.commit()
+        deleted += len(ids)
+
+
+def soft_delete_in_chunks(db: Session, job: models.Job, model, criterion, chunk_size: int = DELETE_CHUNK_SIZE) -> int:
+    """
+    Soft delete the live rows of a table matching a criterion, like delete_in_chunks.
+
+    Returns:
+        int: Number of rows deleted.
+    """
+    deleted = 0
+    while True:
+        ids = db.scalars(select(model.id).where(criterion).limit(chunk_size)).all()
+        if not ids:
+            return deleted
+        db.execute(update(model).where(model.id.in_(ids)).values(deleted_at=datetime.now()),
+                   execution_options={"synchronize_session": False})
+        record_job_progress(job, processed=len(ids), succeeded=len(ids))
+        db.commit()
+        deleted += len(ids)
+
+
+def soft_delete_businesses(db: Session, job: models.Job, business_ids, chunk_size: int = DELETE_CHUNK_SIZE):
+    """
+    Soft delete businesses with their products. The orders of the products are kept as order history.
+    """
+    soft_delete_in_chunks(db, job, models.Product, models.Product.business_id.in_(business_ids), chunk_size)
+    soft_delete_in_chunks(db, job, models.Business, models.Business.id.in_(business_ids), chunk_size)
+
+
+def run_deletion(job_id: str, delete_rows: Callable[[Session, models.Job], None]):
+    """
+    Run a cascade deletion as a background job, in its own session. The rows deleted
+    before a failure stay deleted, running the deletion again resumes it.
+    """
+    db = SessionLocal()
+    try:
+        job = db.get(models.Job, job_id)
+        job.status = JobStatus.running
+        db.commit()
+
+        delete_rows(db, job)
+
+        finish_job(job, JobStatus.completed)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Deletion {job_id} failed: {e}")
+        job = db.get(models.Job, job_id)
+        # The job may have been removed, there is then nothing to record
+        if job is not None:
+            finish_job(job, JobStatus.failed, message=f"Deletion stopped: {e}")
+            db.commit()
+    finally:
+        db.close()
+        # Cached product details, feeds and dashboards may show any of the deleted rows
+        product_cache.clear()
+        product_feeds.invalidate()
+        dashboard_cache.clear()
+
+
+def run_business_deletion(job_id: str, business_id: int, chunk_size: int = DELETE_CHUNK_SIZE):
+    """
+    Background job soft deleting a business and its products, their orders are kept.
+
+    Args:
+        job_id (str): The ID of the job tracking the deletion.
+        business_id (int): The ID of the business.
+        chunk_size (int): Rows deleted per chunk.
+    """
+    run_deletion(job_id, lambda db, job: soft_delete_businesses(db, job, [business_id], chunk_size))
+
+
+def run_user_deletion(job_id: str, user_id: int, chunk_size: int = DELETE_CHUNK_SIZE):
+    """
+    Background job deleting a user and their orders. Their businesses and products are soft
+    deleted and detached from the user, the orders other customers placed on them are kept.
+
+    Args:
+        job_id (str): The ID of the job tracking the deletion.
+        user_id (int): The ID of the user.
+        chunk_size (int): Rows deleted per chunk.
+    """
+    def delete_rows(db: Session, job: models.Job):
+        business_ids = select(models.Business.id).where(models.Business.owner_id == user_id)
+        soft_delete_businesses(db, job, business_ids, chunk_size)
+        # The businesses stay in their table, without the owner about to be deleted
+        db.execute(update(models.Business).where(models.Business.owner_id == user_id).values(owner_id=None),
+                   execution_options={"synchronize_session": False})
+        db.commit()
+        delete_in_chunks(db, job, models.Order, models.Order.user_id == user_id, chunk_size)
+        delete_in_chunks(db, job, models.User, models.User.id == user_id, chunk_size)
+        token_versions.delete(user_id)
+
+    run_deletion(job_id, delete_rows)
+
+
+def archive_deleted(db: Session, model, archive: Table, deleted_before: datetime, *criteria,
+                    batch_size: int = DELETE_CHUNK_SIZE) -> int:
+    """
+    Move the rows of a table soft deleted before a date to its archive table, by batches, committing each batch.
+
+    Args:
+        db (Session): Database session.
+        model: The mapped class of the table.
+        archive (Table): The archive table, with the same columns.
+        deleted_before (datetime): Rows deleted before this are moved.
+        criteria: Further conditions, e.g. that no other row still references the row.
+        batch_size (int): Rows moved per batch.
+
+    Returns:
+        int: Number of rows moved.
+    """
+    table = model.__table__
+    moved = 0
+    while True:
+        ids = db.scalars(select(table.c.id).where(table.c.deleted_at < deleted_before, *criteria)
+                         .order_by(table.c.id).limit(batch_size)).all()
+        if not ids:
+            return moved
+        db.execute(insert(archive).from_select([column.name for column in table.columns],
+                                               select(table).where(table.c.id.in_(ids))))
+        db.execute(delete(table).where(table.c.id.in_(ids)))
+        db.commit()
+        moved += len(ids)
+
+
+def compact_deleted_rows(db: Session, deleted_before: Optional[datetime] = None,
+                         batch_size: int = DELETE_CHUNK_SIZE) -> dict:
+    """
+    Archive the long-deleted orders, products and businesses, children first. A product is
+    only archived once no order references it, and a business once no product does, so the
+    order history of deleted products stays in place.
+
+    Returns:
+        dict: Number of rows moved per table.
+    """
+    deleted_before = deleted_before or datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    orders, products, businesses = models.Order.__table__, models.Product.__table__, models.Business.__table__
+    return {
+        "orders": archive_deleted(db, models.Order, models.orders_archive, deleted_before,
+                                  batch_size=batch_size),
+        "products": archive_deleted(db, models.Product, models.products_archive, deleted_before,
+                                    ~exists().where(orders.c.product_id == products.c.id),
+                                    batch_size=batch_size),
+        "businesses": archive_deleted(db, models.Business, models.businesses_archive, deleted_before,
+                                      ~exists().where(products.c.business_id == businesses.c.id),
+                                      batch_size=batch_size),
+    }
+
+
+def run_compaction():
+    """
+    Scheduled task archiving long-deleted rows, in its own session.
+    """
+    db = SessionLocal()
+    try:
+        moved = compact_deleted_rows(db)
+        if any(moved.values()):
+            logger.info(f"Archived deleted rows: {moved}")
+    finally:
+        db.close()
@@ -0,0 +1,86 @@
+import csv
+import io
+from typing import Iterator, List, Optional
+import orjson
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+from database import SessionLocal
+from schema.common import FileFormat
+
+
+# Rows fetched from the server-side cursor and written to the client per chunk
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_MEDIA_TYPES = {
+    FileFormat.csv: "text/csv; charset=utf-8",
+    FileFormat.ndjson: "application/x-ndjson",
+}
+
+
+def stream_export(statement: Select, model, fields: Optional[List[str]], export_format: FileFormat,
+                  batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """
+    Stream the rows selected by a statement as CSV or NDJSON, one chunk per fetched batch.
+
+    The rows are read through a server-side cursor with `yield_per`, and each batch is
+    serialized and expunged from the session before the next one is fetched, so memory stays
+    flat however many rows the export has. The request's session is closed before a streaming
+    response is sent, so the export opens its own.
+
+    Args:
+        statement (Select): A select of `model` entities, ordered as they should be exported.
+        model: The model class, defines `serialized_fields`.
+        fields (Optional[List[str]]): Serialized fields to export, defaults to every field.
+        export_format (FileFormat): csv (with a header row) or ndjson (one JSON object per line).
+        batch_size (int): Rows fetched from the cursor per chunk.
+
+    Yields:
+        bytes: The encoded chunks of the export.
+    """
+    columns = fields or list(model.serialized_fields)
+    db = SessionLocal()
+    try:
+        result = db.execute(statement.execution_options(yield_per=batch_size))
+        if export_format == FileFormat.csv:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for batch in result.scalars().partitions():
+                # serialize(columns) renders the fields in the order of columns
+                writer.writerows(row.serialize(columns).values() for row in batch)
+                db.expunge_all()
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            # An empty export still has its header row
+            if buffer.tell():
+                yield buffer.getvalue().encode()
+        else:
+            for batch in result.scalars().partitions():
+                chunk = b"".join(orjson.dumps(row.serialize(columns)) + b"\n" for row in batch)
+                db.expunge_all()
+                yield chunk
+    finally:
+        db.close()
+
+
+def export_response(statement: Select, model, fields: Optional[List[str]], export_format: FileFormat,
+                    filename: str) -> StreamingResponse:
+    """
+    Build the streaming download response of an export.
+
+    Args:
+        statement (Select): A select of `model` entities, ordered as they should be exported.
+        model: The model class, defines `serialized_fields`.
+        fields (Optional[List[str]]): Serialized fields to export, defaults to every field.
+        export_format (FileFormat): csv or ndjson.
+        filename (str): The download's file name, without extension.
+
+    Returns:
+        StreamingResponse: The export, sent as an attachment.
+    """
+    return StreamingResponse(
+        stream_export(statement, model, fields, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format.value}"'},
+    )
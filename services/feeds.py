@@ -0,0 +1,143 @@
+import threading
+from bisect import insort
+from typing import Callable, List
+from sqlalchemy.orm import Session
+import models
+from database import SessionLocal
+from services.singleflight import SingleFlight
+
+
+# Products kept per feed, more than a page can ask for so removals rarely empty a page
+FEED_SIZE = 200
+# Seconds between two rebuilds of the feeds from the database
+FEED_REFRESH_INTERVAL = 60
+
+
+class ProductFeed:
+    """
+    The top products of the catalog by a sort key, kept in memory as a bounded sorted list.
+
+    The feed is rebuilt from one indexed ORDER BY ... LIMIT query and kept current by
+    applying product writes to it, a read is a slice of the list. A removal from a full feed
+    may leave out a product ranked just beyond it, the feed is then marked stale and rebuilt
+    before the next read.
+
+    Args:
+        order_by: The columns of the database query, best first, ending with a unique column.
+        key (Callable): Sort key of a product, ascending is best first. Must agree with order_by.
+        include (Callable): Whether a product belongs in the feed at all.
+        where: Filter of the database query, must agree with include.
+        size (int): Number of products kept.
+    """
+
+    def __init__(self, order_by, key: Callable, include: Callable, where=None, size: int = FEED_SIZE):
+        self.order_by = order_by
+        self.key = key
+        self.include = include
+        self.where = where
+        self.size = size
+        self.stale = True
+        self._entries = []  # (key, product id, payload), best first
+        self._lock = threading.Lock()
+
+    def rebuild(self, db: Session):
+        query = db.query(models.Product)
+        if self.where is not None:
+            query = query.filter(self.where)
+        products = query.order_by(*self.order_by).limit(self.size).all()
+        entries = sorted((self.key(product), product.id, product.serialize()) for product in products)
+        with self._lock:
+            self._entries = entries
+            self.stale = False
+
+    def top(self, limit: int) -> List[dict]:
+        with self._lock:
+            return [payload for _, _, payload in self._entries[:limit]]
+
+    def saved(self, product: models.Product):
+        with self._lock:
+            was_full = len(self._entries) >= self.size
+            removed = self._discard(product.id)
+            if self.include(product):
+                entry = (self.key(product), product.id, product.serialize())
+                if len(self._entries) < self.size or entry < self._entries[-1]:
+                    insort(self._entries, entry)
+                    del self._entries[self.size:]
+                    return
+            if removed and was_full:
+                self.stale = True
+
+    def removed(self, product_id: int):
+        with self._lock:
+            was_full = len(self._entries) >= self.size
+            if self._discard(product_id) and was_full:
+                self.stale = True
+
+    def _discard(self, product_id: int) -> bool:
+        for index, (_, entry_id, _) in enumerate(self._entries):
+            if entry_id == product_id:
+                del self._entries[index]
+                return True
+        return False
+
+
+class ProductFeeds:
+    """
+    The storefront feeds, updated together on product writes.
+    """
+
+    def __init__(self):
+        self._flight = SingleFlight()
+        self.feeds = {
+            # Highest discount first
+            "deals": ProductFeed(
+                order_by=(models.Product.percentage_discount.desc(), models.Product.id.desc()),
+                key=lambda product: (-product.percentage_discount, -product.id),
+                include=lambda product: (product.percentage_discount or 0) > 0,
+                where=models.Product.percentage_discount > 0,
+            ),
+            # Most recently published first
+            "newest": ProductFeed(
+                order_by=(models.Product.date_published.desc(), models.Product.id.desc()),
+                key=lambda product: (-product.date_published.toordinal(), -product.id),
+                include=lambda product: product.date_published is not None,
+                where=models.Product.date_published.isnot(None),
+            ),
+        }
+
+    async def top(self, name: str, limit: int) -> List[dict]:
+        """Read a feed, a stale feed is rebuilt first by one of the concurrent readers."""
+        feed = self.feeds[name]
+        if feed.stale:
+            await self._flight.do(name, self.rebuild, name)
+        return feed.top(limit)
+
+    def rebuild(self, name: str):
+        """Rebuild a feed in its own session."""
+        db = SessionLocal()
+        try:
+            self.feeds[name].rebuild(db)
+        finally:
+            db.close()
+
+    def saved(self, product: models.Product):
+        """Apply a created or updated product, which must be fully loaded."""
+        for feed in self.feeds.values():
+            feed.saved(product)
+
+    def removed(self, product_id: int):
+        for feed in self.feeds.values():
+            feed.removed(product_id)
+
+    def invalidate(self):
+        """Rebuild every feed on its next read, after bulk writes."""
+        for feed in self.feeds.values():
+            feed.stale = True
+
+    def refresh(self):
+        """Rebuild every feed, picks up the writes made by other workers."""
+        for name in self.feeds:
+            self.rebuild(name)
+
+
+product_feeds = ProductFeeds()
@@ -0,0 +1,51 @@
+from typing import List, Optional
+from fastapi import HTTPException, status
+from sqlalchemy.orm import load_only
+
+
+def parse_fields(fields: Optional[str], allowed) -> Optional[List[str]]:
+    """
+    Parse a comma separated `fields` query parameter into a list of field names.
+
+    Args:
+        fields (Optional[str]): The raw query parameter, e.g. "product_id,name,new_price".
+        allowed: The field names the endpoint can return.
+
+    Returns:
+        Optional[List[str]]: The requested fields in order without duplicates, or None to return every field.
+
+    Raises:
+        HTTPException: If one of the requested fields is unknown (400).
+    """
+    if not fields:
+        return None
+
+    requested = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}",
+        )
+    return requested or None
+
+
+def load_fields(model, fields: Optional[List[str]], *extra_columns: str):
+    """
+    Build the loader options that only select the columns needed to serialize `fields`.
+
+    Args:
+        model: A model class defining `serialized_fields`.
+        fields (Optional[List[str]]): Serialized field names, None selects every column.
+        extra_columns (str): Additional column names the endpoint needs, e.g. foreign keys.
+
+    Returns:
+        list: A `load_only` option, or no options when every column is needed.
+    """
+    if fields is None:
+        return []
+
+    columns = {model.serialized_fields[field][0] for field in fields if field in model.serialized_fields}
+    columns.update(extra_columns)
+    # The primary key is always loaded, so an empty projection still loads the identity
+    return [load_only(*(getattr(model, column) for column in columns or {"id"}))]
@@ -0,0 +1,43 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+import models
+from schema.job import JobStatus
+
+
+# Only the first errors are stored on the job, the failed counter still counts every row
+MAX_JOB_ERRORS = 1000
+
+
+def create_job(db: Session, kind: str, owner_id: int) -> models.Job:
+    job = models.Job(kind=kind, owner_id=owner_id, status=JobStatus.pending, errors=[])
+    db.add(job)
+    db.commit()
+    return job
+
+
+def record_job_progress(job: models.Job, processed: int = 0, succeeded: int = 0, errors=(),
+                        failed: Optional[int] = None):
+    """
+    Add a processed batch to the job's counters, the caller commits it.
+
+    Args:
+        job (models.Job): The running job.
+        processed (int): Number of items processed in the batch.
+        succeeded (int): Number of items that were processed successfully.
+        errors: Error entries of the failed items, e.g. {"row": 3, "errors": ["..."]}.
+        failed (Optional[int]): Number of failed items, defaults to one per error entry.
+    """
+    job.processed += processed
+    job.succeeded += succeeded
+    job.failed += len(errors) if failed is None else failed
+    room = MAX_JOB_ERRORS - len(job.errors)
+    if errors and room > 0:
+        # Reassign rather than append so the JSON column is flagged as changed
+        job.errors = job.errors + list(errors)[:room]
+
+
+def finish_job(job: models.Job, status: JobStatus, message: Optional[str] = None):
+    job.status = status
+    job.message = message
+    job.finished_at = datetime.now()
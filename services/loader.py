@@ -0,0 +1,76 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+from fastapi import Depends
+from sqlalchemy.orm import Session
+import models
+from database import get_db
+from services.fields import load_fields
+
+
+class Loader:
+    """
+    Request-scoped batch loader of products, businesses and business owners.
+
+    Every lookup collects the requested IDs and loads the ones not seen yet in this request
+    with a single IN (...) query, so serving N products costs three queries rather than three
+    per product. Rows stay in the request's session, relationships between loaded rows (e.g.
+    `business.owner`) are then resolved from the identity map without another query.
+
+    Args:
+        db (Session): The request's database session.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self._rows = defaultdict(dict)  # model -> {id: row or None}
+
+    def load_many(self, model, ids: Iterable[int], *options) -> Dict[int, Optional[object]]:
+        """
+        Load rows by primary key, returning {id: row}, with None for the IDs that do not exist.
+        """
+        rows = self._rows[model]
+        ids = [id for id in dict.fromkeys(ids) if id is not None]
+        missing = [id for id in ids if id not in rows]
+        if missing:
+            for row in self.db.query(model).options(*options).filter(model.id.in_(missing)):
+                rows[row.id] = row
+            for id in missing:
+                rows.setdefault(id, None)
+        return {id: rows[id] for id in ids}
+
+    def products(self, ids: Iterable[int], fields: Optional[List[str]] = None) -> Dict[int, Optional[models.Product]]:
+        return self.load_many(models.Product, ids, *load_fields(models.Product, fields, "business_id"))
+
+    def product(self, id: int) -> Optional[models.Product]:
+        return self.products([id])[id]
+
+    def businesses(self, ids: Iterable[int], with_owners: bool = False) -> Dict[int, Optional[models.Business]]:
+        businesses = self.load_many(models.Business, ids)
+        if with_owners:
+            self.load_many(models.User, (business.owner_id for business in businesses.values() if business))
+        return businesses
+
+    def business(self, id: int) -> Optional[models.Business]:
+        return self.businesses([id])[id] if id is not None else None
+
+    def products_of_businesses(self, business_ids: Iterable[int],
+                               fields: Optional[List[str]] = None) -> Dict[int, List[models.Product]]:
+        """
+        Load the products of several businesses with one query, returning {business id: products}.
+        """
+        business_ids = list(business_ids)
+        products = defaultdict(list)
+        if business_ids:
+            query = self.db.query(models.Product).options(*load_fields(models.Product, fields, "business_id"))\
+                .filter(models.Product.business_id.in_(business_ids)).order_by(models.Product.id)
+            for product in query:
+                self._rows[models.Product][product.id] = product
+                products[product.business_id].append(product)
+        return {business_id: products[business_id] for business_id in business_ids}
+
+
+def get_loader(db: Session = Depends(get_db)) -> Loader:
+    """
+    Dependency providing the request's loader, shared by every dependency of the request.
+    """
+    return Loader(db)
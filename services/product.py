@@ -0,0 +1,530 @@
+import csv
+import json
+import os
+import time
+from datetime import date
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import DECIMAL, Date, Integer, cast, column, func, insert, literal, or_, select, union_all, update, values
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+import models
+from database import SessionLocal
+from logger import logger
+from schema.job import JobStatus
+from schema.product import ProductBatchItem, ProductIn
+from services.cache import TTLCache
+from services.dashboard import dashboard_cache
+from services.feeds import product_feeds
+from services.singleflight import SingleFlight
+from services.jobs import finish_job, record_job_progress
+
+
+# Product detail validators and serialized payloads, keyed by product id
+product_cache = TTLCache(maxsize=10_000, ttl=30)
+# Concurrent cache misses of a product share one load
+product_flight = SingleFlight()
+# Concurrent reads of a default business page share one load
+default_business_flight = SingleFlight()
+# Serialized first pages of the default business, reused while their ETag is unchanged
+default_business_cache = TTLCache(maxsize=32, ttl=300)
+
+
+def calculate_percentage_discount(original_price: float, new_price: float) -> float:
+    """
+    Calculate the percentage discount of a product's new price against its original price.
+
+    Args:
+        original_price (float): The original price of the product, must be greater than 0.
+        new_price (float): The discounted price of the product.
+
+    Returns:
+        float: The discount as a percentage of the original price.
+    """
+    return ((original_price - new_price) / original_price) * 100
+
+
+def calculate_percentage_discounts(original_prices: List[float], new_prices: List[float]) -> List[float]:
+    """
+    Calculate the percentage discounts of a batch of products in one pass.
+
+    Args:
+        original_prices (List[float]): The original prices, all greater than 0.
+        new_prices (List[float]): The discounted prices, in the same order.
+
+    Returns:
+        List[float]: The discounts as percentages of the original prices.
+    """
+    return list(map(calculate_percentage_discount, original_prices, new_prices))
+
+
+# Products updated per UPDATE ... FROM (VALUES ...) statement by a batch update
+BATCH_UPDATE_CHUNK_SIZE = 5000
+# SQLite joins at most this many SELECTs in one compound statement
+SQLITE_MAX_COMPOUND_SELECT = 500
+# The columns of a batch update's changes
+BATCH_UPDATE_COLUMNS = [
+    column("id", Integer),
+    column("original_price", DECIMAL(12, 2)),
+    column("new_price", DECIMAL(12, 2)),
+    column("quantity", Integer),
+    column("offer_expiration_date", Date),
+]
+
+
+def batch_update_products(db: Session, items: List[ProductBatchItem], owner_id: int,
+                          chunk_size: int = BATCH_UPDATE_CHUNK_SIZE) -> int:
+    """
+    Apply price, stock and offer changes to many products with set-based UPDATE statements.
+
+    Each chunk of items is sent as a single UPDATE ... FROM (VALUES ...) joined on the product
+    id, omitted (NULL) values keep the current column value and the percentage discount is
+    recomputed by the database from the resulting prices. SQLite cannot name the columns of a
+    VALUES list, the chunk is a UNION ALL of SELECTs there. Only products of the owner's
+    businesses are updated, their version and updated_at are bumped. The caller commits.
+
+    Args:
+        db (Session): Database session.
+        items (List[ProductBatchItem]): The changes, at most one per product.
+        owner_id (int): The business owner the products must belong to.
+        chunk_size (int): Products updated per statement.
+
+    Returns:
+        int: The number of products updated.
+    """
+    updated = 0
+    products = models.Product.__table__
+    postgres = db.get_bind().dialect.name == "postgresql"
+    if not postgres:
+        chunk_size = min(chunk_size, SQLITE_MAX_COMPOUND_SELECT)
+    for start in range(0, len(items), chunk_size):
+        rows = [
+            (item.product_id, item.original_price, item.new_price, item.quantity,
+             item.offer_expiration_date.date() if item.offer_expiration_date else None)
+            for item in items[start:start + chunk_size]
+        ]
+        if postgres:
+            changes = values(*BATCH_UPDATE_COLUMNS, name="changes").data(rows)
+            # Cast the VALUES columns, a column that is NULL on every row has no type otherwise
+            change = {change.name: cast(changes.c[change.name], change.type) for change in BATCH_UPDATE_COLUMNS}
+        else:
+            changes = union_all(*(select(*(literal(value, type_=change.type).label(change.name)
+                                           for change, value in zip(BATCH_UPDATE_COLUMNS, row)))
+                                  for row in rows)).subquery("changes")
+            change = changes.c
+
+        original_price = func.coalesce(change["original_price"], products.c.original_price)
+        new_price = func.coalesce(change["new_price"], products.c.new_price)
+        owned_businesses = select(models.Business.id).where(models.Business.owner_id == owner_id).scalar_subquery()
+
+        statement = update(products)\
+            .where(products.c.id == change["id"], products.c.business_id.in_(owned_businesses),
+                   products.c.deleted_at.is_(None))\
+            .values(
+                original_price=original_price,
+                new_price=new_price,
+                percentage_discount=(original_price - new_price) * 100 / func.nullif(original_price, 0),
+                quantity=func.coalesce(change["quantity"], products.c.quantity),
+                offer_expiration_date=func.coalesce(change["offer_expiration_date"], products.c.offer_expiration_date),
+            )
+        updated += db.execute(statement).rowcount
+    return updated
+
+
+def business_details(business: models.Business) -> dict:
+    """
+    Build the details of a product's business embedded in product detail responses.
+
+    Args:
+        business (models.Business): The business, its owner is loaded if it has one.
+
+    Returns:
+        dict: The business' details and its owner's email and join date.
+    """
+    owner = business.owner
+    return {
+        "name": business.business_name,
+        "city": business.city,
+        "region": business.region,
+        "description": business.business_description,
+        "logo": business.logo,
+        "business_id": business.id,
+        "owner_id": business.owner_id,
+        "email": owner.email if owner else None,
+        "join_date": owner.join_date.strftime("%b %d %Y %H:%M:%S") if owner else None
+    }
+
+
+def load_product_detail(id: int) -> Optional[dict]:
+    """
+    Load a product's full detail and its validators in its own session, and cache them.
+
+    Runs in the threadpool through product_flight, so one load serves every concurrent request
+    for the product. Sparse fieldsets are cut from the cached full payload.
+
+    Args:
+        id (int): The ID of the product.
+
+    Returns:
+        Optional[dict]: The cache entry: version counters, Last-Modified time, the serialized
+        product and its business details (None without a business), or None if the product
+        does not exist.
+    """
+    started = time.monotonic()
+    db = SessionLocal()
+    try:
+        product = db.query(models.Product).filter_by(id=id).first()
+        if product is None:
+            product_cache.delete(id)
+            return None
+        business = db.query(models.Business).filter_by(id=product.business_id).first() if product.business_id else None
+
+        entry = product_validators(product.version, product.updated_at,
+                                   business.version if business else None, business.updated_at if business else None)
+        entry["product"] = product.serialize()
+        entry["business_details"] = business_details(business) if business else None
+    finally:
+        db.close()
+
+    product_cache.set(id, entry, delta=time.monotonic() - started)
+    return entry
+
+
+def product_validators(product_version, product_updated_at, business_version=None, business_updated_at=None) -> dict:
+    """
+    Build the cached validators of a product detail response.
+
+    Args:
+        product_version (int): The product's version counter.
+        product_updated_at (datetime): When the product was last modified.
+        business_version (Optional[int]): The owning business' version counter.
+        business_updated_at (Optional[datetime]): When the owning business was last modified.
+
+    Returns:
+        dict: The version counters used for the ETag and the Last-Modified time.
+    """
+    last_modified = max(filter(None, (product_updated_at, business_updated_at)))
+    return {"versions": (product_version, business_version), "last_modified": last_modified}
+
+
+# The default business never changes once provisioned, its id is resolved once per process
+_default_business_id: Optional[int] = None
+
+
+def get_default_business_id(db: Session) -> int:
+    """
+    Resolve the id of the default business products without a business are added to.
+
+    The business is provisioned by a migration and has no owner. Its id is looked up on the
+    first call and cached for the lifetime of the process, so adding products does not query
+    it. It is still created here if a database lacks it.
+
+    Args:
+        db (Session): Database session, only used on the first call.
+
+    Returns:
+        int: The id of the default business.
+    """
+    global _default_business_id
+    if _default_business_id is None:
+        default_business = db.query(models.Business).filter_by(business_name='Default Business').first()
+        if not default_business:
+            default_business = models.Business(
+                business_name="Default Business",
+                city="Unspecified",
+                region="Unspecified",
+                business_description="Default business entity for products without specified business",
+                logo="default_logo.jpg",
+            )
+            db.add(default_business)
+            db.commit()
+        _default_business_id = default_business.id
+    return _default_business_id
+
+
+def load_default_business_page(business_id: int, product_ids: List[int], next_cursor: Optional[str]) -> dict:
+    """
+    Load and serialize a page of the default business in its own session.
+
+    Runs in the threadpool through default_business_flight, so one load serves every
+    concurrent request for the page.
+
+    Args:
+        business_id (int): The id of the default business.
+        product_ids (List[int]): The ids of the page's products, in order.
+        next_cursor (Optional[str]): The cursor of the next page, None on the last page.
+
+    Returns:
+        dict: The response payload of the page.
+    """
+    db = SessionLocal()
+    try:
+        default_business = db.get(models.Business, business_id)
+        products = db.query(models.Product).filter(models.Product.id.in_(product_ids)).order_by(models.Product.id).all()
+        return {
+            "status": "ok",
+            "data": {
+                "business": default_business.serialize(),
+                "products": [product.serialize() for product in products]
+            },
+            "next_cursor": next_cursor
+        }
+    finally:
+        db.close()
+
+
+# Rows validated and inserted per transaction by a product import
+IMPORT_CHUNK_SIZE = 1000
+# Largest import upload accepted, in bytes
+MAX_IMPORT_SIZE = int(os.getenv("MAX_IMPORT_SIZE", str(100 * 1024 * 1024)))
+
+
+def read_import_rows(path: str, import_format: str) -> Iterator[Tuple[int, object]]:
+    """
+    Stream the rows of an uploaded import file without reading it into memory.
+
+    Args:
+        path (str): Path of the uploaded file.
+        import_format (str): "csv" (with a header row) or "ndjson" (one JSON object per line).
+
+    Yields:
+        Tuple[int, object]: The 1-based row number and the row as a dict, or the
+        ValueError raised while parsing a malformed NDJSON line.
+    """
+    if import_format == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as upload:
+            for number, row in enumerate(csv.DictReader(upload), start=1):
+                # Empty cells are missing values, not empty strings
+                yield number, {key: value for key, value in row.items() if key is not None and value != ""}
+    else:
+        with open(path, encoding="utf-8") as upload:
+            for number, line in enumerate(upload, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    yield number, e
+
+
+def validation_errors(e: ValidationError) -> List[str]:
+    """Describe the errors of an import row that failed validation, one per field."""
+    return [f"{'.'.join(map(str, error['loc'])) or 'row'}: {error['msg']}" for error in e.errors()]
+
+
+def validate_import_rows(rows, allowed_business_ids: set, default_business_id: int) -> Tuple[List[dict], List[dict]]:
+    """
+    Validate a chunk of import rows the way a single product is validated when it is added.
+
+    Args:
+        rows: (row number, row) pairs from read_import_rows.
+        allowed_business_ids (set): Businesses the importing owner can add products to.
+        default_business_id (int): Business of the rows without a business_id.
+
+    Returns:
+        Tuple[List[dict], List[dict]]: The product rows ready to insert and the errors of the rejected rows.
+    """
+    products, errors = [], []
+    for number, row in rows:
+        if isinstance(row, Exception):
+            errors.append({"row": number, "errors": [f"Invalid JSON: {row}"]})
+            continue
+        try:
+            product = ProductIn.model_validate(row)
+        except ValidationError as e:
+            errors.append({"row": number, "errors": validation_errors(e)})
+            continue
+        if product.original_price <= 0:
+            errors.append({"row": number, "errors": ["Original price cannot be 0"]})
+            continue
+        business_id = product.business_id or default_business_id
+        if business_id not in allowed_business_ids:
+            errors.append({"row": number, "errors": ["You are not authorized to associate a product with this business"]})
+            continue
+
+        product_data = product.model_dump()
+        product_data["business_id"] = business_id
+        product_data["offer_expiration_date"] = product.offer_expiration_date.date()
+        products.append(product_data)
+
+    discounts = calculate_percentage_discounts([product["original_price"] for product in products],
+                                               [product["new_price"] for product in products])
+    for product, discount in zip(products, discounts):
+        product["percentage_discount"] = discount
+    return products, errors
+
+
+def validate_update_rows(db: Session, rows, owner_id: int) -> Tuple[List[ProductBatchItem], List[dict]]:
+    """
+    Validate a chunk of update import rows the way the items of a batch update are validated.
+
+    Args:
+        db (Session): Database session, the ownership of the chunk is checked with one query.
+        rows: (row number, row) pairs from read_import_rows.
+        owner_id (int): The business owner the products must belong to.
+
+    Returns:
+        Tuple[List[ProductBatchItem], List[dict]]: The changes ready to apply and the errors of the rejected rows.
+    """
+    changes, errors = [], []
+    for number, row in rows:
+        if isinstance(row, Exception):
+            errors.append({"row": number, "errors": [f"Invalid JSON: {row}"]})
+            continue
+        try:
+            changes.append((number, ProductBatchItem.model_validate(row)))
+        except ValidationError as e:
+            errors.append({"row": number, "errors": validation_errors(e)})
+
+    owners = dict(db.query(models.Product.id, models.Business.owner_id)
+                  .outerjoin(models.Business, models.Product.business_id == models.Business.id)
+                  .filter(models.Product.id.in_([item.product_id for _, item in changes])).all())
+    items, product_ids = [], set()
+    for number, item in changes:
+        if item.product_id not in owners:
+            errors.append({"row": number, "errors": ["Product not found"]})
+        elif owners[item.product_id] != owner_id:
+            errors.append({"row": number, "errors": ["You are not authorized to update this product"]})
+        elif item.product_id in product_ids:
+            # A single UPDATE cannot apply two changes to the same row
+            errors.append({"row": number, "errors": ["Product already updated by an earlier row of the same chunk"]})
+        else:
+            product_ids.add(item.product_id)
+            items.append(item)
+    return items, errors
+
+
+def run_product_import(job_id: str, path: str, import_format: str, owner_id: int,
+                       chunk_size: int = IMPORT_CHUNK_SIZE, mode: str = "create"):
+    """
+    Import the products of an uploaded file in chunks, recording the progress on its job.
+
+    Runs as a background task after the response was sent, so it opens its own session.
+    Rows are validated like POST /product/products, the valid rows of each chunk are
+    inserted with one executemany and committed together, and rejected rows are reported
+    on the job with their row number. In "update" mode rows are changes to existing
+    products, validated and applied like PATCH /product/batch, one statement per chunk.
+    The uploaded file is removed when the import ends.
+
+    Args:
+        job_id (str): The ID of the job tracking the import.
+        path (str): Path of the uploaded file.
+        import_format (str): "csv" or "ndjson".
+        owner_id (int): The ID of the business owner importing the products.
+        chunk_size (int): Rows validated and written per transaction.
+        mode (str): "create" or "update".
+    """
+    db = SessionLocal()
+    try:
+        job = db.get(models.Job, job_id)
+        job.status = JobStatus.running
+        db.commit()
+
+        default_business_id = get_default_business_id(db)
+        allowed_business_ids = {business_id for business_id, in
+                                db.query(models.Business.id).filter_by(owner_id=owner_id)}
+        allowed_business_ids.add(default_business_id)
+
+        rows = read_import_rows(path, import_format)
+        while chunk := list(islice(rows, chunk_size)):
+            if mode == "update":
+                products, errors = validate_update_rows(db, chunk, owner_id)
+            else:
+                products, errors = validate_import_rows(chunk, allowed_business_ids, default_business_id)
+            if products:
+                try:
+                    if mode == "update":
+                        batch_update_products(db, products, owner_id, chunk_size)
+                    else:
+                        db.execute(insert(models.Product), products)
+                except SQLAlchemyError as e:
+                    db.rollback()
+                    logger.error(f"Database error occurred: {e}")
+                    errors.append({"row": chunk[0][0], "errors": [f"Rows {chunk[0][0]}-{chunk[-1][0]} could not be saved"]})
+                    # Every row of the chunk failed with the write
+                    record_job_progress(job, processed=len(chunk), errors=errors, failed=len(chunk))
+                    db.commit()
+                    continue
+            record_job_progress(job, processed=len(chunk), succeeded=len(products), errors=errors)
+            db.commit()
+            if mode == "update":
+                for item in products:
+                    product_cache.delete(item.product_id)
+
+        finish_job(job, JobStatus.completed)
+        db.commit()
+        product_feeds.invalidate()
+        dashboard_cache.invalidate(owner_id, "products")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Product import {job_id} failed: {e}")
+        job = db.get(models.Job, job_id)
+        # The job may have been removed, there is then nothing to record
+        if job is not None:
+            finish_job(job, JobStatus.failed, message=f"Import stopped: {e}")
+            db.commit()
+    finally:
+        db.close()
+        os.remove(path)
+
+
+# Expired offers reverted per UPDATE statement by the offer sweeper
+OFFER_SWEEP_BATCH_SIZE = 1000
+
+
+def sweep_expired_offers(db: Session, today: Optional[date] = None, batch_size: int = OFFER_SWEEP_BATCH_SIZE) -> int:
+    """
+    Revert the products whose offer expired to their original price.
+
+    The expired offers are found through the partial offer_expiration_date index of the active
+    offers, which reverted offers leave, so a sweep only reads the offers left to revert. They
+    are reverted in batches of set-based UPDATEs, each committed on its own so a large backlog
+    does not hold long locks. The cached payloads of the reverted products are dropped. Other workers' cached
+    payloads expire with the cache TTL.
+
+    Args:
+        db (Session): Database session.
+        today (Optional[date]): Offers that expired before this day are reverted, defaults to today.
+        batch_size (int): Products reverted per statement.
+
+    Returns:
+        int: The number of products reverted.
+    """
+    today = today or date.today()
+    products = models.Product.__table__
+    reverted = 0
+    while True:
+        expired = select(products.c.id)\
+            .where(products.c.offer_expiration_date < today,
+                   # Implies the predicate of ix_products_active_offer_expiration_date (models.ACTIVE_OFFERS)
+                   products.c.deleted_at.is_(None),
+                   or_(products.c.new_price != products.c.original_price, products.c.percentage_discount != 0))\
+            .order_by(products.c.id).limit(batch_size).scalar_subquery()
+        statement = update(products).where(products.c.id.in_(expired))\
+            .values(new_price=products.c.original_price, percentage_discount=0)\
+            .returning(products.c.id)
+        product_ids = db.execute(statement).scalars().all()
+        db.commit()
+
+        for product_id in product_ids:
+            product_cache.delete(product_id)
+        if product_ids:
+            product_feeds.invalidate()
+            dashboard_cache.clear()
+        reverted += len(product_ids)
+        if len(product_ids) < batch_size:
+            return reverted
+
+
+def run_offer_sweep():
+    """
+    Scheduled task reverting expired offers, in its own session.
+    """
+    db = SessionLocal()
+    try:
+        reverted = sweep_expired_offers(db)
+        if reverted:
+            logger.info(f"Reverted {reverted} expired offers")
+    finally:
+        db.close()
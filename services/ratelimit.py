@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+import models
+from database import SessionLocal
+
+
+def take_token(tokens: float, updated_at: float, now: float, rate: float, burst: int) -> Tuple[float, float]:
+    """
+    Refill a bucket for the time elapsed since its last take, then take one token from it.
+
+    Returns:
+        Tuple[float, float]: The tokens left, and 0 if a token was taken, otherwise the seconds until one is available.
+    """
+    # Clocks of different hosts may disagree, a bucket is never drained by going back in time
+    tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryBucketStore:
+    """
+    Token buckets kept in the worker's memory, the least recently used are dropped past `maxsize`.
+
+    Each worker counts the attempts it serves, so with several workers a client gets up to
+    their number times the limits. DatabaseBucketStore shares the buckets instead.
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Take one token from the bucket of `key`.
+
+        Args:
+            key (str): The bucket.
+            rate (float): Tokens added per second.
+            burst (int): Capacity of the bucket, a new bucket starts full.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds until one is available.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens, wait = take_token(tokens, updated_at, now, rate, burst)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def purge(self, idle: float) -> int:
+        """Drop the buckets untouched for `idle` seconds, returns their number."""
+        idle_before = time.monotonic() - idle
+        with self._lock:
+            keys = [key for key, (_, updated_at) in self._buckets.items() if updated_at < idle_before]
+            for key in keys:
+                del self._buckets[key]
+        return len(keys)
+
+
+class DatabaseBucketStore:
+    """
+    Token buckets kept in the rate_buckets table, shared by every worker and host.
+
+    Each take is one short transaction in its own session: the bucket's row is created full
+    if missing, locked, refilled and written back. Idle rows are removed by `purge`.
+    """
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        """Take one token from the bucket of `key`, like MemoryBucketStore.take."""
+        now = time.time()
+        table = models.RateBucket.__table__
+        db = SessionLocal()
+        try:
+            dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+            db.execute(dialect.insert(table).values(key=key, tokens=burst, updated_at=now)
+                       .on_conflict_do_nothing(index_elements=[table.c.key]))
+            tokens, updated_at = db.execute(select(table.c.tokens, table.c.updated_at)
+                                            .where(table.c.key == key).with_for_update()).one()
+            tokens, wait = take_token(tokens, updated_at, now, rate, burst)
+            db.execute(update(table).where(table.c.key == key).values(tokens=tokens, updated_at=max(now, updated_at)))
+            db.commit()
+        finally:
+            db.close()
+        return wait
+
+    def purge(self, idle: float) -> int:
+        """Delete the buckets untouched for `idle` seconds, in its own session. Returns their number."""
+        table = models.RateBucket.__table__
+        db = SessionLocal()
+        try:
+            deleted = db.execute(delete(table).where(table.c.updated_at < time.time() - idle)).rowcount
+            db.commit()
+        finally:
+            db.close()
+        return deleted
+
+
+BucketStore = Union[MemoryBucketStore, DatabaseBucketStore]
+
+
+def make_bucket_store(name: Optional[str]) -> BucketStore:
+    """Return the bucket store configured by name, "memory" (the default) or "database"."""
+    if name in (None, "", "memory"):
+        return MemoryBucketStore()
+    if name == "database":
+        return DatabaseBucketStore()
+    raise ValueError(f"Unknown rate limit store: {name}")
+
+
+class RateLimiter:
+    """
+    A token bucket rate limiter: each key may make `burst` attempts at once, then `rate` per second.
+
+    Args:
+        rate (float): Attempts allowed per second once the burst is spent.
+        burst (int): Attempts allowed at once.
+        store: Where the buckets are kept, defaults to the worker's memory.
+        prefix (str): Prepended to the keys, so limiters can share a store.
+    """
+
+    def __init__(self, rate: float, burst: int, store: Optional[BucketStore] = None, prefix: str = ""):
+        self.rate = rate
+        self.burst = burst
+        self.store = store or MemoryBucketStore()
+        self.prefix = prefix
+
+    @property
+    def refill_time(self) -> float:
+        """Seconds an empty bucket takes to be full again, an idle bucket older than this can be dropped."""
+        return self.burst / self.rate
+
+    def hit(self, key: str) -> float:
+        """Record an attempt, returns 0 if it is allowed, otherwise the seconds to wait."""
+        return self.store.take(self.prefix + key, self.rate, self.burst)
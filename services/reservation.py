@@ -0,0 +1,183 @@
+import heapq
+import os
+import secrets
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import delete, insert, or_, select
+import models
+from database import SessionLocal
+
+
+# Seconds a reservation holds its stock
+RESERVATION_TTL = int(os.getenv("RESERVATION_TTL", "600"))
+# Seconds between two sweeps of the expired reservations
+RESERVATION_SWEEP_INTERVAL = 5
+# Seconds between two snapshots of the reservations to the database, which also load those of the other workers
+RESERVATION_SNAPSHOT_INTERVAL = int(os.getenv("RESERVATION_SNAPSHOT_INTERVAL", "10"))
+
+
+class Reservation(NamedTuple):
+    id: str
+    product_id: int
+    user_id: int
+    quantity: int
+    expires_at: datetime
+
+    def serialize(self):
+        return {
+            "reservation_id": self.id,
+            "product_id": self.product_id,
+            "quantity": self.quantity,
+            "expires_at": self.expires_at.isoformat()
+        }
+
+
+class ReservationBook:
+    """
+    The stock held by the customers' reservations, in memory.
+
+    The quantity held on each product is kept as a running total, so checking the stock left
+    to reserve or to order is constant-time and never reads or locks the products row. Expired
+    reservations are popped from a heap by every call and by a scheduled sweep.
+
+    Each worker keeps its own book. A snapshot writes the reservations made and removed in the
+    worker since the previous one to the reservations table, then loads those of the other
+    workers, so a hold is seen by every worker within a snapshot interval and survives a restart.
+    The products row stays the authority on the stock, orders decrement it with a conditional update.
+
+    Args:
+        ttl (float): Seconds a reservation holds its stock.
+    """
+
+    def __init__(self, ttl: float = RESERVATION_TTL):
+        self.ttl = ttl
+        self._reservations: Dict[str, Reservation] = {}
+        self._held: Dict[int, int] = {}
+        self._expiry: List[Tuple[datetime, str]] = []
+        self._lock = threading.Lock()
+        # Reservations made and removed since the previous snapshot
+        self._added: Dict[str, Reservation] = {}
+        self._removed = set()
+
+    def _insert(self, reservation: Reservation):
+        self._reservations[reservation.id] = reservation
+        self._held[reservation.product_id] = self._held.get(reservation.product_id, 0) + reservation.quantity
+        heapq.heappush(self._expiry, (reservation.expires_at, reservation.id))
+
+    def _discard(self, reservation_id: str) -> Optional[Reservation]:
+        reservation = self._reservations.pop(reservation_id, None)
+        if reservation is not None:
+            held = self._held[reservation.product_id] - reservation.quantity
+            if held:
+                self._held[reservation.product_id] = held
+            else:
+                del self._held[reservation.product_id]
+        return reservation
+
+    def _expire(self, now: datetime) -> int:
+        expired = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, reservation_id = heapq.heappop(self._expiry)
+            reservation = self._reservations.get(reservation_id)
+            # Entries of released reservations are left in the heap and skipped here
+            if reservation is not None and reservation.expires_at == expires_at:
+                self._discard(reservation_id)
+                # Expired rows are purged by the snapshot
+                self._added.pop(reservation_id, None)
+                expired += 1
+        return expired
+
+    def held(self, product_id: int) -> int:
+        """Return the quantity of a product held by the live reservations."""
+        with self._lock:
+            self._expire(datetime.now())
+            return self._held.get(product_id, 0)
+
+    def reserve(self, product_id: int, user_id: int, quantity: int, stock: int) -> Optional[Reservation]:
+        """
+        Hold a quantity of a product for the TTL.
+
+        Args:
+            product_id (int): The ID of the product.
+            user_id (int): The ID of the customer.
+            quantity (int): The quantity to hold.
+            stock (int): The product's current stock.
+
+        Returns:
+            Optional[Reservation]: The reservation, None if the stock not yet held is short.
+        """
+        now = datetime.now()
+        with self._lock:
+            self._expire(now)
+            if stock - self._held.get(product_id, 0) < quantity:
+                return None
+            reservation = Reservation(secrets.token_hex(16), product_id, user_id, quantity,
+                                      now + timedelta(seconds=self.ttl))
+            self._insert(reservation)
+            self._added[reservation.id] = reservation
+            return reservation
+
+    def get(self, reservation_id: str) -> Optional[Reservation]:
+        """Return a live reservation."""
+        with self._lock:
+            self._expire(datetime.now())
+            return self._reservations.get(reservation_id)
+
+    def release(self, reservation_id: str) -> Optional[Reservation]:
+        """Remove a reservation, once cancelled or turned into an order. Returns it, None if it was not live."""
+        with self._lock:
+            reservation = self._discard(reservation_id)
+            if reservation is not None and self._added.pop(reservation_id, None) is None:
+                self._removed.add(reservation_id)
+            return reservation
+
+    def expire(self) -> int:
+        """Drop the expired reservations, returns their number."""
+        with self._lock:
+            return self._expire(datetime.now())
+
+    def snapshot(self):
+        """
+        Write the reservations made and removed since the previous snapshot, purge the expired
+        ones, then replace the reservations of the other workers by the table's. Runs in its own session.
+        """
+        with self._lock:
+            added, removed = self._added, self._removed
+            self._added, self._removed = {}, set()
+        now = datetime.now()
+        reservations = models.Reservation.__table__
+        db = SessionLocal()
+        try:
+            try:
+                db.execute(delete(reservations).where(
+                    or_(reservations.c.id.in_(removed), reservations.c.expires_at <= now)))
+                rows = [reservation._asdict() for reservation in added.values() if reservation.expires_at > now]
+                if rows:
+                    db.execute(insert(reservations), rows)
+                db.commit()
+            except Exception:
+                # Written with the next snapshot
+                with self._lock:
+                    self._added = {**added, **self._added}
+                    self._removed |= removed
+                raise
+            stored = db.execute(select(reservations).where(reservations.c.expires_at > now)).all()
+        finally:
+            db.close()
+
+        with self._lock:
+            stored_ids = set()
+            for row in stored:
+                stored_ids.add(row.id)
+                # Skip the reservations this worker released while the table was read
+                if row.id not in self._reservations and row.id not in self._removed:
+                    self._insert(Reservation(row.id, row.product_id, row.user_id, row.quantity, row.expires_at))
+            # The reservations missing from the table were released by another worker,
+            # except those made here since the snapshot started
+            for reservation_id in [reservation_id for reservation_id in self._reservations
+                                   if reservation_id not in stored_ids and reservation_id not in self._added]:
+                self._discard(reservation_id)
+
+
+reservations = ReservationBook()
@@ -0,0 +1,131 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+import models
+from database import SessionLocal
+from services.bloom import BloomFilter
+from services.cache import TTLCache
+
+
+# Seconds between two reads of the revocations made by other workers
+REVOCATION_SYNC_INTERVAL = int(os.getenv("REVOCATION_SYNC_INTERVAL", "5"))
+# Seconds between two rebuilds of the filter, which drop the expired revocations
+REVOCATION_REBUILD_INTERVAL = int(os.getenv("REVOCATION_REBUILD_INTERVAL", "3600"))
+# A sync re-reads this many seconds before the previous one, for rows committed late
+REVOCATION_SYNC_OVERLAP = 60
+
+
+class RevocationList:
+    """
+    The revoked token ids, held in memory as a Bloom filter of the revoked_tokens table.
+
+    A token whose id is not in the filter is not revoked, which answers almost every check
+    without a database call. A hit may be a false positive and is confirmed against the table.
+    Each worker keeps its own filter: its revocations are added at once, those of other workers
+    when the filter is next synced. Until the filter is first loaded every check reads the table.
+
+    Args:
+        capacity (int): Minimum number of revocations the filter is sized for.
+        error_rate (float): False positive rate of the filter at capacity.
+    """
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.loaded = False
+        self._filter = BloomFilter(capacity, error_rate)
+        # Confirmed hits, false positives only until the next sync could have revoked them
+        self._confirmed = TTLCache(maxsize=10_000, ttl=REVOCATION_REBUILD_INTERVAL)
+        self._lock = threading.Lock()
+        # Revocations added while a rebuild is reading the table, replayed into the new filter
+        self._pending = None
+        self._synced_at = datetime.now()
+
+    def _add(self, jti: str):
+        with self._lock:
+            if jti not in self._filter:
+                self._filter.add(jti)
+            if self._pending is not None:
+                self._pending.append(jti)
+
+    def is_revoked(self, db: Session, jti: str) -> bool:
+        """
+        Return whether a token id was revoked.
+
+        Args:
+            db (Session): Database session, only used to confirm a filter hit.
+            jti (str): The token's jti claim.
+        """
+        if self.loaded and jti not in self._filter:
+            return False
+        revoked = self._confirmed.get(jti)
+        if revoked is None:
+            revoked = db.query(models.RevokedToken.jti).filter(models.RevokedToken.jti == jti).first() is not None
+            self._confirmed.set(jti, revoked, ttl=None if revoked else REVOCATION_SYNC_INTERVAL)
+        return revoked
+
+    def revoke(self, db: Session, jti: str, expires_at: datetime):
+        """
+        Revoke a token id, the caller commits.
+
+        Args:
+            db (Session): The caller's database session.
+            jti (str): The token's jti claim.
+            expires_at (datetime): When the token expires, its row is purged after that.
+        """
+        db.merge(models.RevokedToken(jti=jti, expires_at=expires_at))
+        self.revoked(jti)
+
+    def revoked(self, jti: str):
+        """Apply a revocation already written to the table."""
+        self._add(jti)
+        self._confirmed.set(jti, True)
+
+    def sync(self):
+        """Add the revocations recently written by every worker, in its own session."""
+        started = datetime.now()
+        since = self._synced_at - timedelta(seconds=REVOCATION_SYNC_OVERLAP)
+        db = SessionLocal()
+        try:
+            rows = db.query(models.RevokedToken.jti).filter(models.RevokedToken.revoked_at >= since).all()
+        finally:
+            db.close()
+        for row in rows:
+            self._add(row.jti)
+        self._synced_at = started
+
+    def rebuild(self):
+        """
+        Purge the expired revocations and rebuild the filter from the table, in its own session.
+        The filter is sized for twice the revocations read, so it keeps its error rate as more are added.
+        """
+        started = datetime.now()
+        with self._lock:
+            self._pending = []
+        try:
+            db = SessionLocal()
+            try:
+                db.query(models.RevokedToken).filter(models.RevokedToken.expires_at < started)\
+                    .delete(synchronize_session=False)
+                db.commit()
+                jtis = db.scalars(db.query(models.RevokedToken.jti).statement).all()
+            finally:
+                db.close()
+            bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+            for jti in jtis:
+                bloom.add(jti)
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for jti in self._pending:
+                if jti not in bloom:
+                    bloom.add(jti)
+            self._filter, self._pending = bloom, None
+        self._synced_at = started
+        self.loaded = True
+
+
+revocation_list = RevocationList()
@@ -0,0 +1,50 @@
+import asyncio
+from typing import Callable, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from logger import logger
+
+
+class Scheduler:
+    """
+    Runs periodic maintenance tasks in the background of the application's event loop.
+
+    Tasks are plain (blocking) functions run in the threadpool, so they open their own
+    database sessions. Every worker process runs its own scheduler, tasks must therefore be
+    safe to run concurrently from several workers.
+    """
+
+    def __init__(self):
+        self._tasks: List[Tuple[str, float, Callable[[], object]]] = []
+        self._running: List[asyncio.Task] = []
+
+    def every(self, interval: float, func: Callable[[], object], name: Optional[str] = None):
+        """
+        Register a task to run every `interval` seconds, starting one interval after startup.
+
+        Args:
+            interval (float): Seconds between the end of one run and the start of the next.
+            func (Callable): The task, called without arguments.
+            name (Optional[str]): Name used in the logs, defaults to the function's name.
+        """
+        self._tasks.append((name or func.__name__, interval, func))
+
+    async def _run(self, name: str, interval: float, func: Callable[[], object]):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await run_in_threadpool(func)
+            except Exception as e:
+                # A failed run is retried on the next interval
+                logger.error(f"Scheduled task {name} failed: {e}")
+
+    def start(self):
+        self._running = [asyncio.create_task(self._run(*task)) for task in self._tasks]
+
+    async def stop(self):
+        for task in self._running:
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        self._running = []
+
+
+scheduler = Scheduler()
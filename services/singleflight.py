@@ -0,0 +1,55 @@
+import asyncio
+from typing import Any, Callable, Dict, Hashable
+from fastapi.concurrency import run_in_threadpool
+
+
+class _Abandoned(Exception):
+    """Set on the future of a load whose caller was cancelled, e.g. by a client disconnecting."""
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent loads of the same key into a single call.
+
+    The first caller of a key runs the (blocking) load in the threadpool, callers arriving while
+    it is in flight await its result instead of running their own. A waiter gives up after
+    `timeout` seconds and runs the load itself, so a stuck load cannot stall every request for
+    its key. If the caller running the load is cancelled, the waiters retry at once and the
+    first of them runs the load for the others. The coalescing is per worker process.
+
+    Args:
+        timeout (float): Seconds a caller waits for an in-flight load before running its own.
+    """
+
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[..., Any], *args) -> Any:
+        future = self._in_flight.get(key)
+        if future is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except asyncio.TimeoutError:
+                return await run_in_threadpool(func, *args)
+            except _Abandoned:
+                return await self.do(key, func, *args)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await run_in_threadpool(func, *args)
+        except BaseException as e:
+            # A cancellation is not the waiters' error, they are woken to retry
+            future.set_exception(e if isinstance(e, Exception) else _Abandoned())
+            # Mark the exception as retrieved, the caller re-raises it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    def __len__(self):
+        return len(self._in_flight)
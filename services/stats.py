@@ -0,0 +1,124 @@
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+import models
+from database import SessionLocal
+from services.cache import TTLCache
+from services.feeds import FEED_SIZE
+from services.singleflight import SingleFlight
+
+
+# Seconds between two flushes of the counters to the database
+STATS_FLUSH_INTERVAL = int(os.getenv("STATS_FLUSH_INTERVAL", "5"))
+# Views an order counts for in the popularity score
+ORDER_WEIGHT = 10
+# Seconds the most popular listing is cached
+POPULAR_TTL = 60
+
+
+def upsert_stats(db: Session, rows: List[dict]):
+    """
+    Add view and order counts to the product_stats table, in one batched INSERT ... ON CONFLICT
+    DO UPDATE, creating the missing rows.
+
+    Args:
+        db (Session): Database session.
+        rows (List[dict]): The counts to add, keyed by the table's columns.
+    """
+    table = models.ProductStats.__table__
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(table)
+    statement = statement.on_conflict_do_update(index_elements=[table.c.product_id], set_={
+        "views": table.c.views + statement.excluded.views,
+        "orders": table.c.orders + statement.excluded.orders,
+        "popularity": table.c.popularity + statement.excluded.popularity,
+        "updated_at": statement.excluded.updated_at,
+    })
+    db.execute(statement, rows)
+
+
+class PopularityCounters:
+    """
+    The product views and orders counted since the last flush, in memory.
+
+    Counting is a dict increment, so tracking adds no database call to the hottest reads. A
+    scheduled flush adds the counts of every product to the product_stats table in one batched
+    upsert. Each worker counts and flushes on its own, the upserts add up in the table. Counts
+    not yet flushed are lost if the worker is killed, at most one flush interval's worth.
+    """
+
+    def __init__(self):
+        self._counts: Dict[int, List[int]] = {}  # product id -> [views, orders]
+        self._lock = threading.Lock()
+
+    def _count(self, product_id: int, views: int, orders: int):
+        with self._lock:
+            counts = self._counts.get(product_id)
+            if counts is None:
+                self._counts[product_id] = [views, orders]
+            else:
+                counts[0] += views
+                counts[1] += orders
+
+    def viewed(self, product_id: int):
+        self._count(product_id, 1, 0)
+
+    def ordered(self, product_id: int):
+        self._count(product_id, 0, 1)
+
+    def flush(self) -> int:
+        """Add the counts to the product_stats table, in its own session. Returns the number of products flushed."""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        if not counts:
+            return 0
+
+        now = datetime.now()
+        # Sorted, so the flushes of several workers lock the rows in the same order
+        rows = [{"product_id": product_id, "views": views, "orders": orders,
+                 "popularity": views + ORDER_WEIGHT * orders, "updated_at": now}
+                for product_id, (views, orders) in sorted(counts.items())]
+        db = SessionLocal()
+        try:
+            upsert_stats(db, rows)
+            db.commit()
+        except Exception:
+            # Added back, flushed with the next batch
+            for product_id, (views, orders) in counts.items():
+                self._count(product_id, views, orders)
+            raise
+        finally:
+            db.close()
+        return len(rows)
+
+
+popularity_counters = PopularityCounters()
+
+
+def load_popular_products() -> List[dict]:
+    """Load the most popular live products, in its own session."""
+    db = SessionLocal()
+    try:
+        products = db.query(models.Product)\
+            .join(models.ProductStats, models.ProductStats.product_id == models.Product.id)\
+            .order_by(models.ProductStats.popularity.desc(), models.Product.id.desc())\
+            .limit(FEED_SIZE).all()
+        return [product.serialize() for product in products]
+    finally:
+        db.close()
+
+
+popular_cache = TTLCache(maxsize=1, ttl=POPULAR_TTL)
+popular_flight = SingleFlight()
+
+
+async def popular_products(limit: int) -> List[dict]:
+    """Return the most popular products, most popular first. Concurrent misses share one load."""
+    products = popular_cache.get("popular")
+    if products is None:
+        products = await popular_flight.do("popular", load_popular_products)
+        popular_cache.set("popular", products)
+    return products[:limit]
@@ -1,17 +1,144 @@
-from typing import Annotated
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Annotated, Optional, Tuple
 from fastapi import Depends
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
-from database import get_db
+from database import SessionLocal, get_db
 from models import User
+from services.bloom import BloomFilter
+from services.ratelimit import RateLimiter
 
 
 
 db_dependency = Annotated[Session, Depends(get_db)]
 
-def is_username_exists(db: db_dependency, username: str) -> bool:
-    user = db.query(User).filter(User.username == username).first()
-    return user is not None
+# Seconds between two reads of the users registered in other workers
+USER_FILTER_SYNC_INTERVAL = int(os.getenv("USER_FILTER_SYNC_INTERVAL", "10"))
+# Seconds between two rebuilds of the filters, which drop deleted users and old usernames
+USER_FILTER_REBUILD_INTERVAL = int(os.getenv("USER_FILTER_REBUILD_INTERVAL", "3600"))
+# A sync re-reads this many seconds before the previous one, for rows committed late
+USER_FILTER_SYNC_OVERLAP = 60
 
-def is_email_exists(db: db_dependency, email: str) -> bool:
-    user = db.query(User).filter(User.email == email).first()
-    return user is not None
\ No newline at end of file
+# Availability checks allowed per client IP, a signup form checks as the user types
+availability_limiter = RateLimiter(rate=2, burst=30)
+
+
+class TakenIdentities:
+    """
+    The usernames and emails in use, held in memory as two Bloom filters of the users table.
+
+    A username or email missing from its filter is free, so most signup checks need no query.
+    A hit may be a false positive and is confirmed against the table. Each worker keeps its own
+    filters: its registrations are added at once, those of other workers when the filters are
+    next synced, so a check may briefly report a just-registered name free. The unique
+    constraints remain the authority. Until the filters are first loaded every check reads the table.
+
+    Args:
+        capacity (int): Minimum number of users the filters are sized for.
+        error_rate (float): False positive rate of the filters at capacity.
+    """
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.loaded = False
+        self._usernames = BloomFilter(capacity, error_rate)
+        self._emails = BloomFilter(capacity, error_rate)
+        self._lock = threading.Lock()
+        # Identities added while a rebuild is reading the table, replayed into the new filters
+        self._pending = None
+        self._synced_at = datetime.now()
+
+    def might_be_taken(self, username: Optional[str] = None, email: Optional[str] = None) -> Tuple[bool, bool]:
+        """Return whether the username and the email may be in use, False for those not given."""
+        return (username is not None and (not self.loaded or username in self._usernames),
+                email is not None and (not self.loaded or email in self._emails))
+
+    def added(self, username: Optional[str] = None, email: Optional[str] = None):
+        """Apply a username or email written to the table."""
+        with self._lock:
+            for bloom, value in ((self._usernames, username), (self._emails, email)):
+                if value is not None and value not in bloom:
+                    bloom.add(value)
+            if self._pending is not None:
+                self._pending.append((username, email))
+
+    def sync(self):
+        """Add the users recently registered in every worker, in its own session."""
+        started = datetime.now()
+        since = self._synced_at - timedelta(seconds=USER_FILTER_SYNC_OVERLAP)
+        db = SessionLocal()
+        try:
+            rows = db.query(User.username, User.email).filter(User.join_date >= since).all()
+        finally:
+            db.close()
+        for row in rows:
+            self.added(row.username, row.email)
+        self._synced_at = started
+
+    def rebuild(self):
+        """
+        Rebuild the filters from the users table, in its own session. They are sized for twice
+        the users read, so they keep their error rate as more register.
+        """
+        started = datetime.now()
+        with self._lock:
+            self._pending = []
+        try:
+            db = SessionLocal()
+            try:
+                count = db.query(User.id).count()
+                usernames = BloomFilter(max(self.capacity, 2 * count), self.error_rate)
+                emails = BloomFilter(max(self.capacity, 2 * count), self.error_rate)
+                for row in db.query(User.username, User.email).yield_per(1000):
+                    usernames.add(row.username)
+                    emails.add(row.email)
+            finally:
+                db.close()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for username, email in self._pending:
+                if username is not None:
+                    usernames.add(username)
+                if email is not None:
+                    emails.add(email)
+            self._usernames, self._emails, self._pending = usernames, emails, None
+        self._synced_at = started
+        self.loaded = True
+
+
+taken_identities = TakenIdentities()
+
+
+def find_taken(db: Session, username: Optional[str] = None, email: Optional[str] = None,
+               precheck: bool = True) -> Tuple[bool, bool]:
+    """
+    Return whether the username and the email are in use, in at most one query.
+
+    Args:
+        db (Session): Database session.
+        username (Optional[str]): The username to look up, if any.
+        email (Optional[str]): The email to look up, if any.
+        precheck (bool): Skip the query for those missing from the in-memory filters.
+    """
+    if precheck:
+        check_username, check_email = taken_identities.might_be_taken(username, email)
+    else:
+        check_username, check_email = username is not None, email is not None
+
+    criteria = []
+    if check_username:
+        criteria.append(User.username == username)
+    if check_email:
+        criteria.append(User.email == email)
+    if not criteria:
+        return False, False
+
+    rows = db.query(User.username, User.email).filter(or_(*criteria)).limit(2).all()
+    return (check_username and any(row.username == username for row in rows),
+            check_email and any(row.email == email for row in rows))
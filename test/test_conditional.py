@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from starlette.requests import Request
+from services.conditional import http_date, if_match_versions, is_not_modified, make_etag, make_version_etag
+
+
+def make_request(**headers):
+    raw_headers = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "headers": raw_headers})
+
+
+def test_make_etag_depends_on_every_part():
+    assert make_etag("product", 1, (1, 1)) == make_etag("product", 1, (1, 1))
+    assert make_etag("product", 1, (1, 1)) != make_etag("product", 1, (2, 1))
+
+
+def test_if_none_match():
+    etag = make_etag("product", 1)
+    assert is_not_modified(make_request(if_none_match=etag), etag)
+    assert is_not_modified(make_request(if_none_match=f'"other", W/{etag}'), etag)
+    assert not is_not_modified(make_request(if_none_match='"other"'), etag)
+
+
+def test_if_modified_since():
+    last_modified = datetime(2024, 5, 23, 16, 6, 22)
+    etag = make_etag("product", 1)
+    assert is_not_modified(make_request(if_modified_since=http_date(last_modified)), etag, last_modified)
+    earlier = http_date(last_modified - timedelta(seconds=1))
+    assert not is_not_modified(make_request(if_modified_since=earlier), etag, last_modified)
+
+
+def test_if_match_versions():
+    etag = make_version_etag("product", 1, 3, (3, 1), None, True)
+    assert if_match_versions(make_request(), "product", 1) is None
+    assert if_match_versions(make_request(if_match="*"), "product", 1) is None
+    both = f'{etag}, {make_version_etag("product", 1, 5)}'
+    assert if_match_versions(make_request(if_match=both), "product", 1) == {3, 5}
+    # The tags of other rows, weak, forged and foreign tags match no version
+    assert if_match_versions(make_request(if_match=etag), "product", 2) == set()
+    assert if_match_versions(make_request(if_match=etag), "order", 1) == set()
+    assert if_match_versions(make_request(if_match=f"W/{etag}"), "product", 1) == set()
+    assert if_match_versions(make_request(if_match='"3-anything"'), "product", 1) == set()
+    assert if_match_versions(make_request(if_match=make_etag("product", 1)), "product", 1) == set()
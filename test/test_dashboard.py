@@ -0,0 +1,16 @@
+from services.dashboard import DashboardCache
+
+
+def test_sections_keep_the_last_pages_requested():
+    cache = DashboardCache(pages_per_section=2)
+    cache.set(1, "orders", (0, 10), ["first"])
+    cache.set(1, "orders", (10, 10), ["second"])
+    assert cache.get(1, "orders", (0, 10)) == ["first"]
+    # The least recently used page is dropped
+    cache.set(1, "orders", (20, 10), ["third"])
+    assert cache.get(1, "orders", (10, 10)) is None
+    assert cache.get(1, "orders", (0, 10)) == ["first"]
+    assert len(cache._cache.get((1, "orders"))) == 2
+
+    cache.invalidate(1, "orders")
+    assert cache.get(1, "orders", (0, 10)) is None
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import sessionmaker
+import models
+from schema.job import JobStatus
+from services import deletion
+from services.deletion import compact_deleted_rows, delete_in_chunks
+from services.jobs import create_job
+
+
+def test_delete_in_chunks():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([models.User(id=1, username="owner1", email="o@x.com", password="x"),
+                models.Business(id=1, business_name="Shop", owner_id=1),
+                models.Product(id=1, name="P1", category="c", new_price=1, business_id=1)])
+    for id in range(1, 6):
+        db.add(models.Order(id=id, product_id=1, user_id=1 if id < 5 else 2, total_price=1))
+    db.commit()
+    job = create_job(db, "user_delete", 1)
+
+    deletes = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: deletes.append(statement) if statement.startswith("DELETE") else None)
+    assert delete_in_chunks(db, job, models.Order, models.Order.user_id == 1, chunk_size=3) == 4
+
+    # 4 orders by chunks of 3
+    assert len(deletes) == 2
+    assert job.processed == 4
+    assert db.query(models.Order.id).all() == [(5,)]
+    db.close()
+    engine.dispose()
+
+
+def test_user_deletion_keeps_the_orders_of_other_customers(monkeypatch):
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(deletion, "SessionLocal", Session)
+    db = Session()
+    db.add_all([models.User(id=1, username="seller", email="a@x.com", password="x"),
+                models.User(id=2, username="customer", email="b@x.com", password="x"),
+                models.Business(id=1, business_name="Shop", owner_id=1),
+                models.Product(id=1, name="P1", category="c", new_price=1, business_id=1),
+                models.Product(id=2, name="P2", category="c", new_price=1, business_id=1),
+                models.Order(id=1, product_id=1, user_id=2, total_price=1),
+                models.Order(id=2, product_id=2, user_id=1, total_price=1)])
+    db.commit()
+    job = create_job(db, "user_delete", 1)
+
+    deletion.run_user_deletion(job.id, 1)
+
+    db.expire_all()
+    assert db.get(models.Job, job.id).status == JobStatus.completed
+    assert db.query(models.User.id).all() == [(2,)]
+    # The customer's order survives, the seller's own one is gone
+    assert db.query(models.Order.id, models.Order.user_id).all() == [(1, 2)]
+    # The business and products are soft deleted and detached from the deleted user
+    assert db.query(models.Product).count() == 0
+    assert db.query(models.Business).count() == 0
+    business = db.query(models.Business).execution_options(include_deleted=True).one()
+    assert business.owner_id is None and business.deleted_at is not None
+    db.close()
+    engine.dispose()
+
+
+def test_soft_deleted_rows_are_hidden_then_archived():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    long_ago = datetime.now() - timedelta(days=365)
+    db.add_all([models.User(id=1, username="owner1", email="o@x.com", password="x"),
+                models.Business(id=1, business_name="Shop", owner_id=1),
+                # Deleted, but its order keeps it in place
+                models.Product(id=1, name="Ordered", category="c", new_price=1, business_id=1, deleted_at=long_ago),
+                models.Product(id=2, name="Unordered", category="c", new_price=1, business_id=1, deleted_at=long_ago),
+                models.Product(id=3, name="Recent", category="c", new_price=1, business_id=1, deleted_at=datetime.now()),
+                models.Order(id=1, product_id=1, user_id=1, total_price=1)])
+    db.commit()
+
+    assert db.query(models.Product).count() == 0
+    assert db.query(models.Product).execution_options(include_deleted=True).count() == 3
+    # Orders keep their history
+    assert db.query(models.Order).count() == 1
+
+    assert compact_deleted_rows(db) == {"orders": 0, "products": 1, "businesses": 0}
+    assert db.scalar(select(func.count()).select_from(models.products_archive)) == 1
+    assert [id for id, in db.query(models.Product.id).execution_options(include_deleted=True)] == [1, 3]
+    db.close()
+    engine.dispose()
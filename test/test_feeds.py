@@ -0,0 +1,50 @@
+from datetime import date
+import models
+from services.feeds import ProductFeed
+
+
+def make_product(id, discount):
+    return models.Product(id=id, name=f"P{id}", category="c", new_price=1, percentage_discount=discount,
+                          offer_expiration_date=date(2030, 1, 1), product_image="p.jpg",
+                          date_published=date(2024, 1, 1), quantity=1)
+
+
+def make_feed(size=3):
+    feed = ProductFeed(order_by=(), key=lambda product: (-product.percentage_discount, -product.id),
+                       include=lambda product: product.percentage_discount > 0, size=size)
+    feed.stale = False
+    return feed
+
+
+def test_saved_products_are_ranked_and_bounded():
+    feed = make_feed()
+    for id, discount in [(1, 10), (2, 30), (3, 20), (4, 5)]:
+        feed.saved(make_product(id, discount))
+    assert [product["product_id"] for product in feed.top(10)] == [2, 3, 1]
+
+    feed.saved(make_product(1, 50))
+    assert [product["product_id"] for product in feed.top(2)] == [1, 2]
+
+
+def test_dropping_out_of_a_full_feed_marks_it_stale():
+    feed = make_feed(size=2)
+    feed.saved(make_product(1, 10))
+    feed.saved(make_product(2, 20))
+    feed.saved(make_product(2, 0))
+    assert feed.stale
+
+    feed = make_feed(size=2)
+    feed.saved(make_product(1, 10))
+    feed.saved(make_product(2, 20))
+    feed.removed(7)
+    assert not feed.stale
+    feed.removed(1)
+    assert feed.stale
+
+
+def test_removing_from_a_partial_feed_keeps_it_fresh():
+    feed = make_feed(size=2)
+    feed.saved(make_product(1, 10))
+    feed.removed(1)
+    assert not feed.stale
+    assert feed.top(10) == []
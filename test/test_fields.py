@@ -0,0 +1,25 @@
+import pytest
+from fastapi import HTTPException
+import models
+from services.fields import parse_fields
+
+
+def test_parse_fields_returns_none_without_fields():
+    assert parse_fields(None, models.Product.serialized_fields) is None
+    assert parse_fields("", models.Product.serialized_fields) is None
+
+
+def test_parse_fields_strips_and_deduplicates():
+    fields = parse_fields(" name,product_id,name ", models.Product.serialized_fields)
+    assert fields == ["name", "product_id"]
+
+
+def test_parse_fields_rejects_unknown_fields():
+    with pytest.raises(HTTPException) as exc_info:
+        parse_fields("name,password", models.Product.serialized_fields)
+    assert exc_info.value.status_code == 400
+
+
+def test_sparse_serialize_only_reads_requested_fields():
+    product = models.Product(id=1, name="Hat")
+    assert product.serialize(["product_id", "name"]) == {"product_id": 1, "name": "Hat"}
@@ -0,0 +1,71 @@
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+from middleware import CompressionMiddleware, CompressionStats, negotiate_encoding
+
+
+stats = CompressionStats()
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=100, stats=stats)
+
+
+@app.get("/large")
+async def large():
+    return {"data": "x" * 1000}
+
+
+@app.get("/small")
+async def small():
+    return {"data": "x"}
+
+
+@app.get("/image")
+async def image():
+    return Response(b"\x89PNG" + b"0" * 1000, media_type="image/png")
+
+
+@app.get("/stream")
+async def stream():
+    return StreamingResponse((b"row\n" * 100 for _ in range(5)), media_type="application/x-ndjson")
+
+
+client = TestClient(app)
+
+
+def test_negotiate_encoding_prefers_brotli():
+    assert negotiate_encoding("gzip, deflate, br") == "br"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.5") == "gzip"
+    assert negotiate_encoding("br;q=0, gzip") == "gzip"
+    assert negotiate_encoding("identity") is None
+
+
+def test_large_response_is_compressed_with_brotli():
+    response = client.get("/large", headers={"Accept-Encoding": "br"})
+    assert response.headers["content-encoding"] == "br"
+    assert response.json() == {"data": "x" * 1000}
+    assert stats.bytes_out < stats.bytes_in
+
+
+def test_large_response_is_compressed_with_gzip():
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < 1000
+
+
+def test_small_and_image_responses_are_not_compressed():
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "br"}).headers
+    assert "content-encoding" not in client.get("/image", headers={"Accept-Encoding": "br"}).headers
+
+
+def test_every_textual_response_varies_on_accept_encoding():
+    assert client.get("/large", headers={"Accept-Encoding": "br"}).headers["vary"] == "Accept-Encoding"
+    assert client.get("/small", headers={"Accept-Encoding": "br"}).headers["vary"] == "Accept-Encoding"
+    assert client.get("/large", headers={"Accept-Encoding": "identity"}).headers["vary"] == "Accept-Encoding"
+    assert "vary" not in client.get("/image", headers={"Accept-Encoding": "br"}).headers
+
+
+def test_streaming_response_is_compressed_incrementally():
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.text == "row\n" * 500
@@ -0,0 +1,92 @@
+import os
+from datetime import date, datetime
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import models
+from schema.job import JobStatus
+from schema.product import ProductBatchItem, ProductBatchUpdate
+from services import product as product_service
+from services.jobs import create_job
+from services.product import batch_update_products, run_product_import
+
+
+# The statement differs on PostgreSQL, set TEST_POSTGRES_URL to a disposable database to run it there too
+@pytest.fixture(params=["sqlite://", os.getenv("TEST_POSTGRES_URL")], ids=["sqlite", "postgresql"])
+def engine(request):
+    if request.param is None:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    engine = create_engine(request.param)
+    models.Base.metadata.create_all(engine)
+    yield engine
+    models.Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    db = sessionmaker(bind=engine)()
+    db.add_all([models.User(id=7, username="owner", email="o@x.com", password="x"),
+                models.User(id=8, username="other", email="p@x.com", password="x"),
+                models.Business(id=1, business_name="Shop", owner_id=7),
+                models.Business(id=2, business_name="Other", owner_id=8)])
+    for id in range(1, 6):
+        db.add(models.Product(id=id, name=f"P{id}", category="c", original_price=10, new_price=10, percentage_discount=0,
+                              quantity=1, offer_expiration_date=date(2027, 1, 1), business_id=1 if id < 5 else 2))
+    db.commit()
+    yield db
+    db.close()
+
+
+def product_rows(db):
+    db.expire_all()
+    return {product.id: (float(product.original_price), float(product.new_price), float(product.percentage_discount),
+                         product.quantity, product.offer_expiration_date, product.version)
+            for product in db.query(models.Product).order_by(models.Product.id)}
+
+
+def test_batch_update_products_applies_each_change(db):
+    before = db.get(models.Product, 1).updated_at
+    items = [ProductBatchItem(product_id=1, new_price=5),
+             ProductBatchItem(product_id=2, original_price=20, quantity=9),
+             ProductBatchItem(product_id=3, offer_expiration_date=datetime(2030, 1, 2)),
+             # Another owner's product is left alone
+             ProductBatchItem(product_id=5, new_price=1)]
+    assert batch_update_products(db, items, owner_id=7, chunk_size=2) == 3
+    db.commit()
+
+    assert product_rows(db) == {
+        1: (10, 5, 50, 1, date(2027, 1, 1), 2),
+        2: (20, 10, 50, 9, date(2027, 1, 1), 2),
+        3: (10, 10, 0, 1, date(2030, 1, 2), 2),
+        4: (10, 10, 0, 1, date(2027, 1, 1), 1),
+        5: (10, 10, 0, 1, date(2027, 1, 1), 1),
+    }
+    assert db.get(models.Product, 1).updated_at > before
+
+
+def test_update_import_applies_rows_and_reports_rejected_ones(db, engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(product_service, "SessionLocal", sessionmaker(bind=engine))
+    path = tmp_path / "changes.csv"
+    path.write_text("product_id,new_price,quantity\n1,4,\n2,,5\n5,1,\n1,3,\n9,1,\n", encoding="utf-8")
+    job = create_job(db, "product_import", 7)
+
+    run_product_import(job.id, str(path), "csv", 7, mode="update")
+
+    db.expire_all()
+    job = db.get(models.Job, job.id)
+    assert job.status == JobStatus.completed
+    assert (job.processed, job.succeeded) == (5, 2)
+    assert [error["row"] for error in job.errors] == [3, 4, 5]
+    rows = product_rows(db)
+    assert rows[1][:4] == (10, 4, 60, 1)
+    assert rows[2][:4] == (10, 10, 0, 5)
+    assert rows[5][5] == 1
+    assert not path.exists()
+
+
+def test_batch_updates_are_capped():
+    ProductBatchUpdate(products=[{"product_id": id} for id in range(1000)])
+    with pytest.raises(ValidationError):
+        ProductBatchUpdate(products=[{"product_id": id} for id in range(1001)])
@@ -0,0 +1,35 @@
+from services.product import read_import_rows, validate_import_rows
+
+
+ROW = {"name": "Lamp", "category": "home", "original_price": "10", "new_price": "8",
+       "offer_expiration_date": "2027-01-01T00:00:00", "quantity": "3"}
+
+
+def test_validate_import_rows_accepts_valid_rows():
+    products, errors = validate_import_rows([(1, ROW), (2, {**ROW, "business_id": "5"})], {5, 9}, 9)
+    assert errors == []
+    assert [product["business_id"] for product in products] == [9, 5]
+    assert products[0]["percentage_discount"] == 20
+
+
+def test_validate_import_rows_reports_rejected_rows():
+    rows = [(1, {**ROW, "original_price": "0"}), (2, {**ROW, "business_id": "6"}),
+            (3, {**ROW, "quantity": "many"}), (4, ValueError("bad line"))]
+    products, errors = validate_import_rows(rows, {5, 9}, 9)
+    assert products == []
+    assert [error["row"] for error in errors] == [1, 2, 3, 4]
+    assert errors[2]["errors"][0].startswith("quantity:")
+
+
+def test_read_import_rows_csv_drops_empty_cells(tmp_path):
+    path = tmp_path / "products.csv"
+    path.write_text("﻿name,business_id\nLamp,\n", encoding="utf-8")
+    assert list(read_import_rows(str(path), "csv")) == [(1, {"name": "Lamp"})]
+
+
+def test_read_import_rows_ndjson_skips_blank_lines(tmp_path):
+    path = tmp_path / "products.ndjson"
+    path.write_text('{"name": "Lamp"}\n\nnope\n', encoding="utf-8")
+    rows = list(read_import_rows(str(path), "ndjson"))
+    assert rows[0] == (1, {"name": "Lamp"})
+    assert rows[1][0] == 3 and isinstance(rows[1][1], ValueError)
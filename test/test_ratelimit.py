@@ -0,0 +1,64 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import models
+from services import ratelimit
+from services.ratelimit import DatabaseBucketStore, MemoryBucketStore, RateLimiter
+
+
+def test_burst_then_wait():
+    limiter = RateLimiter(rate=0.5, burst=3)
+    assert [limiter.hit("a") for _ in range(3)] == [0, 0, 0]
+    wait = limiter.hit("a")
+    assert 0 < wait <= 2
+    # Buckets are independent
+    assert limiter.hit("b") == 0
+
+
+def test_least_recently_used_buckets_are_dropped():
+    store = MemoryBucketStore(maxsize=2)
+    limiter = RateLimiter(rate=0.001, burst=1, store=store)
+    limiter.hit("a")
+    limiter.hit("b")
+    limiter.hit("c")
+    assert len(store._buckets) == 2
+    assert limiter.hit("a") == 0
+
+
+def test_refused_ip_attempts_leave_the_username_budget(monkeypatch):
+    from fastapi import HTTPException
+    from services import auth
+
+    monkeypatch.setattr(auth, "login_ip_limiter", RateLimiter(rate=0.001, burst=2))
+    monkeypatch.setattr(auth, "login_username_limiter", RateLimiter(rate=0.001, burst=3))
+    for _ in range(2):
+        auth.check_login_rate("10.0.0.1", "victim")
+    for _ in range(10):
+        try:
+            auth.check_login_rate("10.0.0.1", "Victim")
+        except HTTPException as e:
+            assert e.status_code == 429
+        else:
+            raise AssertionError("the IP limit was not enforced")
+
+    # The refused attempts took nothing from the username's bucket, its owner can still log in
+    auth.check_login_rate("10.0.0.2", "victim")
+
+
+def test_database_buckets_are_shared_by_the_workers(monkeypatch):
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    monkeypatch.setattr(ratelimit, "SessionLocal", sessionmaker(bind=engine))
+    # Two workers, each with its own store and limiter
+    first = RateLimiter(rate=0.001, burst=3, store=DatabaseBucketStore(), prefix="login-ip:")
+    second = RateLimiter(rate=0.001, burst=3, store=DatabaseBucketStore(), prefix="login-ip:")
+
+    assert [first.hit("a"), second.hit("a"), first.hit("a")] == [0, 0, 0]
+    assert second.hit("a") > 0
+    assert first.hit("b") == 0
+    # Other limiters sharing the store keep their own buckets
+    assert RateLimiter(rate=0.001, burst=1, store=first.store, prefix="login-username:").hit("a") == 0
+
+    assert first.store.purge(idle=3600) == 0
+    assert second.store.purge(idle=0) == 3
+    assert first.hit("a") == 0
+    engine.dispose()
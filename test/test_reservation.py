@@ -0,0 +1,24 @@
+from services.reservation import ReservationBook
+
+
+def test_reservations_hold_stock():
+    book = ReservationBook(ttl=600)
+    first = book.reserve(1, user_id=2, quantity=3, stock=5)
+    assert first is not None and book.held(1) == 3
+    # Only the stock not yet held can be reserved
+    assert book.reserve(1, user_id=3, quantity=3, stock=5) is None
+    assert book.reserve(1, user_id=3, quantity=2, stock=5) is not None
+    assert book.held(2) == 0
+
+    assert book.release(first.id) == first
+    assert book.release(first.id) is None
+    assert book.held(1) == 2
+
+
+def test_reservations_expire():
+    book = ReservationBook(ttl=0)
+    reservation = book.reserve(1, user_id=2, quantity=1, stock=1)
+    assert book.get(reservation.id) is None
+    assert book.held(1) == 0
+    # Never snapshotted, nothing is left to remove from the table
+    assert not book._added and not book._removed
@@ -0,0 +1,52 @@
+import secrets
+from services.bloom import BloomFilter
+from services.revocation import RevocationList
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    items = [secrets.token_hex(16) for _ in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+
+    false_positives = sum(secrets.token_hex(16) in bloom for _ in range(10_000))
+    assert false_positives < 300
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, *criteria):
+        return self
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+
+class FakeSession:
+    def __init__(self, revoked):
+        self.revoked = revoked
+        self.queries = 0
+
+    def query(self, *entities):
+        self.queries += 1
+        return FakeQuery(self.revoked)
+
+
+def test_filter_misses_need_no_database_read():
+    revocations = RevocationList(capacity=1000)
+    revocations.loaded = True
+    revocations.revoked("a" * 32)
+    db = FakeSession(revoked=[])
+
+    assert revocations.is_revoked(db, "a" * 32)
+    assert not revocations.is_revoked(db, "b" * 32)
+    assert db.queries == 0
+
+
+def test_unloaded_list_reads_the_table():
+    revocations = RevocationList(capacity=1000)
+    assert revocations.is_revoked(FakeSession(revoked=[("a" * 32,)]), "a" * 32)
+    assert not revocations.is_revoked(FakeSession(revoked=[]), "b" * 32)
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+import pytest
+from services.cache import TTLCache
+from services.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_load():
+    calls = []
+
+    def load(key):
+        calls.append(key)
+        time.sleep(0.05)
+        return {"key": key}
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("a", load, "a") for _ in range(20)))
+        assert len(flight) == 0
+        return results
+
+    results = asyncio.run(main())
+    assert calls == ["a"]
+    assert all(result is results[0] for result in results)
+
+
+def test_waiters_load_themselves_after_the_timeout():
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(1)
+        return len(calls)
+
+    async def main():
+        flight = SingleFlight(timeout=0.05)
+        leader = asyncio.ensure_future(flight.do("a", load))
+        await asyncio.sleep(0.01)
+        waited = await flight.do("a", load)
+        release.set()
+        return waited, await leader
+
+    assert asyncio.run(main()) == (2, 2)
+
+
+def test_errors_reach_every_waiter():
+    def load():
+        time.sleep(0.05)
+        raise ValueError("boom")
+
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.do("a", load) for _ in range(3)), return_exceptions=True)
+
+    assert [type(result) for result in asyncio.run(main())] == [ValueError] * 3
+
+
+def test_waiters_take_over_a_cancelled_load():
+    calls = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.05)
+        return len(calls)
+
+    async def main():
+        flight = SingleFlight(timeout=5)
+        leader = asyncio.ensure_future(flight.do("a", load))
+        await asyncio.sleep(0.01)
+        waiters = asyncio.gather(*(flight.do("a", load) for _ in range(3)))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        started = time.monotonic()
+        results = await waiters
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(main())
+    # One waiter ran the load again for the others, without waiting for the timeout
+    assert results == [2, 2, 2]
+    assert elapsed < 1
+
+
+def test_early_refresh_only_fires_near_expiry():
+    cache = TTLCache(ttl=60)
+    cache.set("fresh", 1, delta=0.001)
+    assert all(cache.get("fresh", early_refresh=1) == 1 for _ in range(100))
+
+    # An entry that took longer to compute than its remaining lifetime is almost always refreshed
+    cache.set("hot", 1, ttl=1, delta=1000)
+    assert sum(cache.get("hot", early_refresh=1) is None for _ in range(100)) > 90
+    # Reads without early refresh are unaffected
+    assert cache.get("hot") == 1
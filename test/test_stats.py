@@ -0,0 +1,21 @@
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import models
+from services.stats import ORDER_WEIGHT, upsert_stats
+
+
+def test_upsert_stats_adds_counts():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    now = datetime.now()
+    upsert_stats(db, [{"product_id": 1, "views": 2, "orders": 0, "popularity": 2, "updated_at": now}])
+    upsert_stats(db, [{"product_id": 1, "views": 1, "orders": 1, "popularity": 1 + ORDER_WEIGHT, "updated_at": now},
+                      {"product_id": 2, "views": 4, "orders": 0, "popularity": 4, "updated_at": now}])
+    db.commit()
+
+    stats = {row.product_id: (row.views, row.orders, row.popularity) for row in db.query(models.ProductStats)}
+    assert stats == {1: (3, 1, 3 + ORDER_WEIGHT), 2: (4, 0, 4)}
+    db.close()
+    engine.dispose()